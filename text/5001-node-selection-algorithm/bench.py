@@ -0,0 +1,403 @@
+'''
+Benchmarks for the Steward Selection Algorithm.
+
+Generates seeded synthetic steward/scenario data of any size and times analyze() with
+each engine across a grid of (n, f, S, best), printing a table or writing JSON so that
+performance can be compared across commits. For example:
+
+    python bench.py --n 12,16,20 --f 1,2 --scenarios 12,50 --engines numpy,bnb --json before.json
+
+Use --write-csv to save a generated data set in the sample-data.csv layout, so it can
+be fed to select.py directly. --ingest times loading such a file (5000 stewards x 500
+scenarios by default) with load_csv(), and from a warm --cache-dir with
+load_csv_cached(). --startup times what a program that
+embeds select.py pays for it in a fresh interpreter: importing it, and a first
+select_stewards() call on a small steward list. --combinations times generating the
+first --max-combinations combinations of M out of N items (24 and 7 by default) with
+the original recursive generator, itertools, index_combinations() and the
+revolving-door walk. --memory measures each engine's peak RSS, and the peak of what
+tracemalloc sees it allocate, on generated data (20 stewards, f=2, 12 scenarios by
+default), each in a fresh interpreter.
+'''
+
+import os, sys
+
+# Like select.py, move this directory to the end of sys.path so the standard library's
+# select module (which subprocess and multiprocessing need) isn't shadowed by ours.
+# This has to happen before anything imports it.
+here = os.path.dirname(os.path.abspath(__file__))
+if sys.path and os.path.abspath(sys.path[0] or os.curdir) == here:
+    sys.path.append(sys.path.pop(0))
+
+import argparse, ast, csv, importlib.util, itertools, json, math, platform, random, subprocess, tempfile, time
+
+def load_selection_module():
+    # Import select.py under a different name, for the same reason.
+    spec = importlib.util.spec_from_file_location('steward_select', os.path.join(here, 'select.py'))
+    module = importlib.util.module_from_spec(spec)
+    # Worker processes find analyze_shard and friends by module name.
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+sel = load_selection_module()
+
+default_seed = 1
+default_ns = [12, 16, 20]
+default_fs = [1, 2]
+default_scenario_counts = [12, 50]
+default_bests = [sel.default_best_N]
+default_max_combinations = 1000000
+default_ingest_size = '5000,500'
+default_startup_size = '9,12'
+default_combination_size = '24,7'
+default_memory_size = '20,2,12'
+
+# Roughly the shape of the real worksheet: a few scenarios (botched upgrades, global
+# vulnerabilities) fault nearly everyone, the rest only a handful of stewards.
+common_mode_share = 0.25
+common_mode_density = (0.8, 1.0)
+local_density = (0.02, 0.3)
+likelihood_range = (0.0001, 0.9)
+mttr_median = 8.0
+mttr_sigma = 0.4
+
+def generate(n, scenario_count, f=None, seed=default_seed):
+    '''
+    Generate data for n stewards and scenario_count scenarios, in the same form that
+    select.load_data() returns. Likelihoods are log-uniform, MTTRs log-normal (rounded
+    to whole hours like the worksheet's), and each scenario has its own fault density.
+    '''
+    rng = random.Random('%d/%d/%d' % (seed, n, scenario_count))
+    if f is None:
+        f = sel.max_f_for_steward_count(n)
+    scenarios = ['scenario %d' % (i + 1) for i in range(scenario_count)]
+    lo, hi = [math.log(x) for x in likelihood_range]
+    liks = [round(math.exp(rng.uniform(lo, hi)), 4) for i in range(scenario_count)]
+    densities = [rng.uniform(*(common_mode_density if rng.random() < common_mode_share else local_density))
+                 for i in range(scenario_count)]
+    stewards = ['Steward %d' % (i + 1) for i in range(n)]
+    mttrs = [float(max(1, round(rng.lognormvariate(math.log(mttr_median), mttr_sigma)))) for i in range(n)]
+    faults = [[1 if rng.random() < d else 0 for d in densities] for i in range(n)]
+    return f, scenarios, liks, stewards, mttrs, faults
+
+def write_csv(fname, f, scenarios, liks, stewards, mttrs, faults):
+    n = len(stewards)
+    m = (3 * f) + 1
+    pad = [''] * len(scenarios)
+    rows = [
+        ['Scenarios', ''] + pad,
+        ['# of candidate nodes: N', str(n)] + pad,
+        ['max # faulted nodes: F', str(f)] + pad,
+        ['# of active nodes desired: M or 3F + 1', str(m)] + pad,
+        ['N - F', str(n - f)] + pad,
+        ['', ''] + scenarios,
+        ['likelihood per year (from MTBF)', ''] + [repr(x) for x in liks],
+        ['Steward', 'MTTR'] + ['fault?'] * len(scenarios),
+    ]
+    for i in range(n):
+        rows.append([stewards[i], '%g' % mttrs[i]] + [str(x) for x in faults[i]])
+    with open(fname, 'w', newline='') as fp:
+        csv.writer(fp).writerows(rows)
+
+def time_case(engine, data, best, repeat, workers):
+    '''Run analyze() repeat times; return the fastest time and the top list it found.'''
+    f, scenarios, liks, stewards, mttrs, faults = data
+    times = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        result = sel.analyze(f, scenarios, liks, stewards, mttrs, faults, best, quiet=True, engine=engine,
+                             workers=workers)
+        times.append(time.perf_counter() - started)
+    return min(times), [str(x) for x in result.items]
+
+def run_grid(ns, fs, scenario_counts, bests, engines, repeat=1, workers=1, seed=default_seed,
+             max_combinations=default_max_combinations, stream=None):
+    '''
+    Time every engine on every combination of the grid's parameters, skipping cases
+    with fewer stewards than 3f+1 or more than max_combinations combinations. Returns a
+    list of dicts, one per (case, engine). Engines are checked against each other, and
+    any case where they disagree is flagged.
+    '''
+    results = []
+    for n in ns:
+        for scenario_count in scenario_counts:
+            for f in fs:
+                m = (3 * f) + 1
+                combinations = sel.choose(n, m)
+                if m > n or combinations > max_combinations:
+                    continue
+                data = generate(n, scenario_count, f, seed)
+                for best in bests:
+                    reference = None
+                    for engine in engines:
+                        if engine == sel.incremental_engine and workers > 1:
+                            continue
+                        seconds, items = time_case(engine, data, best, repeat, workers)
+                        if reference is None:
+                            reference = items
+                        row = dict(n=n, f=f, m=m, scenarios=scenario_count, best=best, engine=engine,
+                                   workers=workers, combinations=combinations, seconds=seconds,
+                                   combinations_per_second=combinations / seconds if seconds > 0 else None,
+                                   matches=items == reference)
+                        results.append(row)
+                        if stream:
+                            stream.write(format_row(row) + '\n')
+                            stream.flush()
+    return results
+
+table_header = '%4s %2s %4s %5s %-12s %12s %10s %14s' % ('n', 'f', 'S', 'best', 'engine', 'combos', 'seconds', 'combos/sec')
+
+def format_row(row):
+    text = '%4d %2d %4d %5d %-12s %12d %10.4f %14.0f' % (
+        row['n'], row['f'], row['scenarios'], row['best'], row['engine'], row['combinations'], row['seconds'],
+        row['combinations_per_second'] or 0)
+    if not row['matches']:
+        text += '  MISMATCH'
+    return text
+
+def time_ingestion(n, scenario_count, repeat=1, seed=default_seed, stream=None):
+    '''
+    Time loading a generated n x scenario_count file by parsing it, and from a warm
+    cache; return a list of dicts.
+    '''
+    data = generate(n, scenario_count, sel.max_f_for_steward_count(n), seed)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        fname = os.path.join(tmp, 'bench.csv')
+        write_csv(fname, *data)
+        size = os.path.getsize(fname)
+        cache_dir = os.path.join(tmp, 'cache')
+        sel.load_csv_cached(fname, cache_dir)
+        expected = None
+        for loader, load in [('load_csv', lambda fname: sel.load_csv(fname)[3:]),
+                             ('cached', lambda fname: sel.load_csv_cached(fname, cache_dir)[3:])]:
+            times = []
+            for i in range(repeat):
+                started = time.perf_counter()
+                loaded = load(fname)
+                times.append(time.perf_counter() - started)
+            if expected is None:
+                expected = loaded
+            row = dict(loader=loader, n=n, scenarios=scenario_count, bytes=size, seconds=min(times),
+                       cells_per_second=n * scenario_count / min(times), matches=list(loaded) == list(expected))
+            results.append(row)
+            if stream:
+                stream.write('%-10s %6d x %4d %12d bytes %9.3f sec %14.0f cells/sec%s\n' % (
+                    loader, n, scenario_count, size, row['seconds'], row['cells_per_second'],
+                    '' if row['matches'] else '  MISMATCH'))
+    return results
+
+def recursive_combinations(items, n):
+    '''The original unique_combinations(), which builds new lists at every level, for comparison.'''
+    if n == 0:
+        yield []
+    else:
+        for i in range(len(items)):
+            for cc in recursive_combinations(items[i + 1:], n - 1):
+                yield [items[i]] + cc
+
+def time_combinations(n, m, count, repeat=1, stream=None):
+    '''
+    Time generating the first count combinations of m out of n items each way, and
+    check that each way ends at the right combination (for the revolving-door walk,
+    which yields swaps in its own order, that it takes the right number of steps).
+    Returns a list of dicts.
+    '''
+    total = sel.choose(n, m)
+    count = min(count, total)
+    items = list(range(n))
+    # Name, generator, how many to take, and the rank of the last one.
+    cases = [
+        ('recursive', lambda: recursive_combinations(items, m), count, count - 1),
+        ('unique_combinations', lambda: sel.unique_combinations(items, m), count, count - 1),
+        ('itertools', lambda: itertools.combinations(items, m), count, count - 1),
+        ('index_combinations', lambda: sel.index_combinations(n, m), count, count - 1),
+        # From any rank but the first, index_combinations() steps a list in place.
+        ('index_combinations(1)', lambda: sel.index_combinations(n, m, 1), min(count, total - 1), min(count, total - 1)),
+        ('revolving_door', lambda: sel.revolving_door_swaps(n, m), count - 1, None),
+    ]
+    results = []
+    for generator, make, steps, last_rank in cases:
+        times = []
+        for i in range(repeat):
+            seen, last = 0, None
+            started = time.perf_counter()
+            for seen, last in enumerate(itertools.islice(make(), steps), 1):
+                pass
+            times.append(time.perf_counter() - started)
+        matches = seen == steps and (last_rank is None or list(last) == sel.unrank_combination(n, m, last_rank))
+        row = dict(generator=generator, n=n, m=m, combinations=steps, seconds=min(times),
+                   combinations_per_second=steps / min(times) if min(times) > 0 else None, matches=matches)
+        results.append(row)
+        if stream:
+            stream.write('%-22s C(%d, %d) %10d %9.3f sec %12.0f combos/sec%s\n' % (
+                generator, n, m, steps, row['seconds'], row['combinations_per_second'] or 0,
+                '' if matches else '  MISMATCH'))
+    return results
+
+startup_script = '''
+import sys, time
+started = time.perf_counter()
+import importlib.util
+spec = importlib.util.spec_from_file_location('steward_select', %(path)r)
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+imported = time.perf_counter()
+module.select_stewards(*%(data)r)
+print(imported - started, time.perf_counter() - imported, len(sys.modules))
+'''
+
+def time_startup(n, scenario_count, repeat=1, seed=default_seed, stream=None):
+    '''
+    In fresh interpreters, time importing select.py and then analyzing a generated
+    n x scenario_count data set with select_stewards(), and count the modules loaded.
+    Returns a list with one dict, holding the fastest times.
+    '''
+    f, scenarios, liks, stewards, mttrs, faults = generate(n, scenario_count, seed=seed)
+    script = startup_script % dict(path=os.path.join(here, 'select.py'),
+                                   data=(scenarios, liks, stewards, mttrs, faults, f))
+    runs = []
+    for i in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', script]).decode().split()
+        runs.append((float(output[0]), float(output[1]), int(output[2])))
+    row = dict(n=n, scenarios=scenario_count, import_seconds=min(r[0] for r in runs),
+               first_call_seconds=min(r[1] for r in runs), modules=runs[0][2], matches=True)
+    if stream:
+        stream.write('import %9.4f sec, first call (%d x %d) %9.4f sec, %d modules loaded\n' % (
+            row['import_seconds'], n, scenario_count, row['first_call_seconds'], row['modules']))
+    return [row]
+
+memory_script = '''
+import resource, sys, time, tracemalloc
+import importlib.util
+spec = importlib.util.spec_from_file_location('steward_select', %(path)r)
+module = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = module
+spec.loader.exec_module(module)
+# Import NumPy up front, if it's there, so that the baseline is the same for every
+# engine and the numpy engine isn't charged for the import.
+try:
+    import numpy
+except ImportError:
+    pass
+data = %(data)r
+def run():
+    return module.analyze(*data, %(best)d, quiet=True, engine=%(engine)r)
+# ru_maxrss is in kilobytes on Linux, and bytes on macOS.
+unit = 1 if sys.platform == 'darwin' else 1024
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+started = time.perf_counter()
+items = [str(x) for x in run().items]
+seconds = time.perf_counter() - started
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+# tracemalloc slows everything down, so it gets a run of its own.
+tracemalloc.start()
+run()
+traced = tracemalloc.get_traced_memory()[1]
+print(repr((before, peak, seconds, traced, items)))
+'''
+
+def measure_memory(n, f, scenario_count, best, engines, seed=default_seed, stream=None):
+    '''
+    For each engine, in a fresh interpreter, run analyze() on a generated data set
+    and report the peak RSS (and how much it grew over the interpreter's before the
+    run), then run it again under tracemalloc and report the peak of what was traced.
+    The Python heap's peak is what changes when fewer objects are built per
+    combination; RSS also shows how much of that the allocator handed back to the
+    system. Returns a list of dicts.
+    '''
+    data = generate(n, scenario_count, f, seed)
+    combinations = sel.choose(n, (3 * f) + 1)
+    results = []
+    reference = None
+    for engine in engines:
+        script = memory_script % dict(path=os.path.join(here, 'select.py'), data=data, best=best, engine=engine)
+        # Run from elsewhere, so that select.py doesn't shadow the standard library's select.
+        output = subprocess.check_output([sys.executable, '-c', script], cwd=tempfile.gettempdir())
+        before, peak, seconds, traced, items = ast.literal_eval(output.decode().strip().splitlines()[-1])
+        if reference is None:
+            reference = items
+        row = dict(engine=engine, n=n, f=f, scenarios=scenario_count, best=best, combinations=combinations,
+                   seconds=seconds, peak_rss=peak, rss_growth=peak - before, traced_peak=traced,
+                   matches=items == reference)
+        results.append(row)
+        if stream:
+            stream.write('%-12s %4d %2d %4d %12d %9.3f sec %8.1f MB peak RSS (+%.1f) %10.1f KB traced peak%s\n' % (
+                engine, n, f, scenario_count, combinations, seconds, peak / 1048576.0, (peak - before) / 1048576.0,
+                traced / 1024.0, '' if row['matches'] else '  MISMATCH'))
+    return results
+
+def environment():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=here, stderr=subprocess.DEVNULL)
+        commit = commit.decode().strip()
+    except Exception:
+        commit = None
+    return dict(commit=commit, python=platform.python_version(), machine=platform.machine(),
+                platform=platform.platform(), cpus=os.cpu_count())
+
+def int_list(txt):
+    return [int(x) for x in txt.split(',') if x.strip()]
+
+def engine_list(txt):
+    engines = [x.strip() for x in txt.split(',') if x.strip()]
+    for engine in engines:
+        if engine not in sel.engines:
+            raise argparse.ArgumentTypeError('unknown engine %s; choose from %s' % (engine, ', '.join(sel.engines)))
+    return engines
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the steward selection engines on synthetic data.')
+    parser.add_argument('--n', help='Comma-separated steward counts.', type=int_list, default=default_ns)
+    parser.add_argument('--f', help='Comma-separated f values.', type=int_list, default=default_fs)
+    parser.add_argument('--scenarios', help='Comma-separated scenario counts.', type=int_list, default=default_scenario_counts)
+    parser.add_argument('--best', help='Comma-separated sizes of the "top N" list.', type=int_list, default=default_bests)
+    parser.add_argument('--engines', help='Comma-separated engines to time.', type=engine_list, default=sel.engines)
+    parser.add_argument('--workers', help='Worker processes to pass to analyze().', type=int, default=1)
+    parser.add_argument('--repeat', help='Time each case this many times and keep the fastest.', type=int, default=1)
+    parser.add_argument('--seed', help='Seed for the synthetic data.', type=int, default=default_seed)
+    parser.add_argument('--max-combinations', help='Skip cases with more combinations than this.', type=int,
+                        default=default_max_combinations)
+    parser.add_argument('--json', help='Write the results (and details of this machine) to this file as JSON.')
+    parser.add_argument('--ingest', metavar='STEWARDS,SCENARIOS', nargs='?', const=default_ingest_size,
+                        help='Just time loading a generated file of this size (default %s).' % default_ingest_size)
+    parser.add_argument('--startup', metavar='STEWARDS,SCENARIOS', nargs='?', const=default_startup_size,
+                        help='Just time importing select.py and a first call on data of this size (default %s).' %
+                        default_startup_size)
+    parser.add_argument('--combinations', metavar='N,M', nargs='?', const=default_combination_size,
+                        help='Just time generating the first --max-combinations combinations of M out of N items '
+                        '(default %s) each way.' % default_combination_size)
+    parser.add_argument('--memory', metavar='STEWARDS,F,SCENARIOS', nargs='?', const=default_memory_size,
+                        help='Just measure the peak RSS and traced allocations of each of --engines on data of this '
+                        'size (default %s), with the first --best.' % default_memory_size)
+    parser.add_argument('--write-csv', metavar='FNAME', help='Just write data for the first --n, --f and '
+                        '--scenarios to this file, in the sample-data.csv layout.')
+    args = parser.parse_args()
+    if args.write_csv:
+        write_csv(args.write_csv, *generate(args.n[0], args.scenarios[0], args.f[0], args.seed))
+        return
+    if args.ingest:
+        n, scenario_count = int_list(args.ingest)
+        results = time_ingestion(n, scenario_count, args.repeat, args.seed, sys.stdout)
+    elif args.startup:
+        n, scenario_count = int_list(args.startup)
+        results = time_startup(n, scenario_count, args.repeat, args.seed, sys.stdout)
+    elif args.memory:
+        n, f, scenario_count = int_list(args.memory)
+        results = measure_memory(n, f, scenario_count, args.best[0], args.engines, args.seed, sys.stdout)
+    elif args.combinations:
+        n, m = int_list(args.combinations)
+        results = time_combinations(n, m, args.max_combinations, args.repeat, sys.stdout)
+    else:
+        print(table_header)
+        results = run_grid(args.n, args.f, args.scenarios, args.best, args.engines, args.repeat, args.workers,
+                           args.seed, args.max_combinations, sys.stdout)
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(dict(environment=environment(), seed=args.seed, results=results), fp, indent=2)
+    if not all(row['matches'] for row in results):
+        sys.exit('Results disagreed on at least one case.')
+
+if __name__ == '__main__':
+    main()
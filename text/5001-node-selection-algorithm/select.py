@@ -4,15 +4,33 @@ Implementation of Steward Selection Algorithm.
 Assumes CSV data in the format shown in sample-data.csv. This data was produced by exporting
 the worksheet at http://bit.ly/2GoYXTG; any worksheet with the same general layout but with
 different rows for stewards, and different numbers for N and M, should also be supported.
+
+It can also be imported, and select_stewards() called with data that's already in
+memory; that returns a Selection instead of printing anything. Modules that only some
+features need (csv, json, NumPy, multiprocessing, unittest and so on) are imported
+when those features are used, so that importing this and analyzing a small steward
+list stays cheap.
 '''
 
-import csv, os, sys, re, unittest
+import bisect, heapq, itertools, math, os, sys, time
+
+# This script shares its name with the standard library's select module, which
+# multiprocessing depends on. When it's run directly, its own directory is first on
+# sys.path and would shadow the real module, so move that entry to the end.
+if __name__ == '__main__' and sys.path and os.path.abspath(sys.path[0] or os.curdir) == os.path.dirname(os.path.abspath(__file__)):
+    sys.path.append(sys.path.pop(0))
 
 max_f_for_steward_list = -1
 f_from_data_file = 0
 
 
 def load_clean_csv(fname):
+    '''
+    Read every row of a CSV file, with whitespace trimmed from each cell. This is the
+    input parse_headers() and parse_stewards() expect; load_csv() parses a file in one
+    pass instead.
+    '''
+    import csv
     # Read file and parse into rows and cells.
     with open(fname, "r") as f:
         rows = [r for r in csv.reader(f)]
@@ -26,50 +44,36 @@ def load_clean_csv(fname):
     return rows
 
 
-# Define and compile some regexes that we're going to use to match cells.
-f_pat = re.compile(r'.*(max ((number|#) (of )?)?faulted nodes(:|--) ?)?F$', re.I)
-lik_pat = re.compile(r'.*likelihood( per y(ea)?r( \(from MT[BT]F\)?))?$', re.I)
-fault_pat = re.compile(r'\s*fault\s*\?\s*$', re.I)
+# Define some regexes that we're going to use to match cells. They're compiled the
+# first time a file is parsed.
+f_pattern = r'.*(max ((number|#) (of )?)?faulted nodes(:|--) ?)?F$'
+lik_pattern = r'.*likelihood( per y(ea)?r( \(from MT[BT]F\)?))?$'
+fault_pattern = r'\s*fault\s*\?\s*$'
+compiled_patterns = []
+
+def header_patterns():
+    '''Return the compiled f, likelihood and fault? patterns.'''
+    if not compiled_patterns:
+        import re
+        compiled_patterns.extend([re.compile(p, re.I) for p in (f_pattern, lik_pattern, fault_pattern)])
+    return compiled_patterns
 
 def parse_headers(rows, skip_f=False):
-    # Define some rules to parse rows. The rules are tuples where the first item is the
-    # name to assign to a variable if the rule matches, the second item is a function
-    # for testing the row against the rule, and the third item is a function to extract
-    # a value from the row.
-    rules = [
-        ('f', lambda row: f_pat.match(row[0]), lambda row: int(row[1])),
-        ('scenarios', lambda row: bool((not row[0]) and (not row[1]) and row[2] and row[3] and row[4]), lambda row: row[2:]),
-        ('liks', lambda row: lik_pat.match(row[0]), lambda row: [convert_float(cell) for cell in row[2:]]),
-        ('_', lambda row: fault_pat.match(row[-1]), lambda row: None)
-    ]
-    # Parse headers.
-    vars = {}
-    row_idx = 0
-    rule_idx = 0
-    if skip_f:
-        rule_idx = 1
-        vars['f'] = 0
-    while rule_idx < len(rules):
-        rule = rules[rule_idx]
-        row = rows[row_idx]
-        row_idx += 1
-        #print('Testing rule %d against row %d (%s)' % (rule_idx, row_idx, ','.join(row)))
-        if apply_rule(row, vars, rule[0], rule[1], rule[2]):
-            rule_idx += 1
-            continue
-        if row_idx == len(rows):
-            break
-    # Make sure we found everything we expected.
-    if row_idx == len(rows):
-        if skip_f:
-            not_found = [x for x in [r[0] for r in rules[1:-2]] if x not in locals()]
-            raise Exception("Didn't find the following variable(s) in data: %s" % ', '.join(not_found))
-        else:
-            # Try reparsing the data without looking for the top portion where f is defined.
-            return parse_headers(rows, True)
-    return vars['f'], vars['scenarios'], vars['liks'], row_idx
+    '''
+    Parse the rows before the stewards with parse_header_rows(). Returns f (0 if the
+    rows don't give it, or skip_f), the scenario names, their likelihoods, and the
+    index in rows of the first row after the header row, for parse_stewards().
+    '''
+    file_f, scenarios, liks, attribute_columns, number = parse_header_rows(iter(rows))
+    return 0 if skip_f else file_f or 0, scenarios, liks, number
 
 def parse_stewards(rows, row_idx):
+    '''
+    Return the names, MTTRs and faults of the stewards in rows from row_idx on, up to
+    the first row that isn't a steward's. Unlike parse_rows(), which raises an
+    Exception naming the cell, this treats a row with a fault? value other than 0 or 1
+    as the end of the stewards.
+    '''
     # Now consume rows with steward names and their fault profiles
     stewards = []
     mttrs = []
@@ -85,6 +89,141 @@ def parse_stewards(rows, row_idx):
             break
     return stewards, mttrs, faults
 
+# Cells that can appear in a fault? column, and their values.
+fault_cells = {'0': 0, '1': 1}
+
+def load_csv(fname, attributes=None):
+    '''
+    Read data from a CSV file in a single pass, stopping at the end of the steward
+    rows. Returns the same values as load_data(), except that f is the one in the file
+    (or 0 if there isn't one). See parse_rows().
+    '''
+    import csv
+    # utf-8-sig skips the byte order mark that some spreadsheets write.
+    with open(fname, 'r', newline='', encoding='utf-8-sig') as f:
+        return parse_rows(csv.reader(f), attributes)
+
+def parse_rows(rows, attributes=None):
+    '''
+    Parse rows of cells in the layout of sample-data.csv: an optional row giving F,
+    then a row of scenario names (the first two cells empty), a likelihood row, a
+    header row ending in "fault?", and then one row per steward with its name, MTTR,
+    and a 0 or 1 for each scenario. Rows before each of these, blank cells around
+    values and blank cells at the ends of rows are ignored. Stewards end at the first
+    row that doesn't start with a name and a number. Rows can be any iterable, so
+    the fault matrix is built as they stream in. Anything that can't be made sense of
+    raises an Exception naming its row and column, numbered as in a spreadsheet; that
+    includes a steward row with a fault? value other than 0 or 1, which
+    parse_stewards() takes as the end of the stewards instead.
+
+    Columns after the last scenario's can hold attributes of the stewards, such as
+    jurisdiction or hosting provider, named in the header row (whose last scenario
+    column must then say "fault?"). If attributes is a dict, each attribute's name is
+    mapped to a list of the stewards' values.
+    '''
+    rows = iter(rows)
+    file_f, scenarios, liks, attribute_columns, header_number = parse_header_rows(rows)
+    stewards = []
+    mttrs = []
+    faults = []
+    for number, row in enumerate(rows, header_number + 1):
+        name = row[0].strip() if row else ''
+        mttr = row[1].strip() if len(row) > 1 else ''
+        if not (has_string(name) and has_num(mttr)):
+            break
+        cells = row[2:len(scenarios) + 2]
+        try:
+            fault_row = list(map(fault_cells.__getitem__, cells))
+        except KeyError:
+            fault_row = [parse_fault(cell, j, number, name) for j, cell in enumerate(cells, 2)]
+        if len(fault_row) < len(scenarios):
+            raise Exception('Row %d, column %s: steward "%s" has %d fault? values for %d scenarios.' % (
+                number, column_name(len(fault_row) + 2), name, len(fault_row), len(scenarios)))
+        for j in range(len(scenarios) + 2, len(row)):
+            if row[j].strip() and j not in attribute_columns:
+                raise Exception('Row %d, column %s: unexpected "%s" after the last scenario.' % (number, column_name(j), row[j].strip()))
+        if attributes is not None:
+            for j in attribute_columns:
+                attributes.setdefault(attribute_columns[j], []).append(row[j].strip() if j < len(row) else '')
+        stewards.append(name)
+        mttrs.append(parse_number([name, mttr], 1, number, 'the MTTR of "%s"' % name, float))
+        faults.append(fault_row)
+    if attributes is not None:
+        for name in attribute_columns.values():
+            attributes.setdefault(name, [])
+    return file_f or 0, scenarios, liks, stewards, mttrs, faults
+
+def parse_header_rows(rows):
+    '''
+    Read rows, an iterator, up to and including the header row ending in "fault?" (see
+    parse_rows()), and leave it at the first steward row. Returns F (None if the rows
+    don't give it), the scenario names, their likelihoods, a dict mapping the index of
+    each attribute column to its name, and the number of the header row.
+    '''
+    f_pat, lik_pat, fault_pat = header_patterns()
+    file_f = None
+    scenarios = liks = None
+    # Column index -> attribute name.
+    attribute_columns = {}
+    found_data = False
+    for number, row in enumerate(rows, 1):
+        cells = [cell.strip() for cell in row]
+        while cells and not cells[-1]:
+            cells.pop()
+        if not cells:
+            continue
+        found_data = True
+        if scenarios is None:
+            if file_f is None and f_pat.match(cells[0]):
+                file_f = int(parse_number(cells, 1, number, 'F', int))
+            elif len(cells) >= 5 and not cells[0] and not cells[1] and cells[2] and cells[3] and cells[4]:
+                scenarios = cells[2:]
+        elif liks is None:
+            if lik_pat.match(cells[0]):
+                liks = [check_likelihood(parse_number(cells, j, number, 'the likelihood of "%s"' % scenarios[j - 2], convert_float),
+                                         'Row %d, column %s: the likelihood of "%s"' % (number, column_name(j), scenarios[j - 2]))
+                        for j in range(2, len(scenarios) + 2)]
+        elif fault_pat.match(cells[-1]):
+            return file_f, scenarios, liks, attribute_columns, number
+        elif len(cells) > len(scenarios) + 2 and fault_pat.match(cells[len(scenarios) + 1]):
+            for j in range(len(scenarios) + 2, len(cells)):
+                if cells[j]:
+                    if cells[j] in attribute_columns.values():
+                        raise Exception('Row %d, column %s: there is already an attribute named "%s".' % (
+                            number, column_name(j), cells[j]))
+                    attribute_columns[j] = cells[j]
+            return file_f, scenarios, liks, attribute_columns, number
+    if not found_data:
+        raise Exception('No useful data.')
+    if scenarios is None:
+        raise Exception("Didn't find a row of scenario names (one whose first two cells are empty).")
+    if liks is None:
+        raise Exception('Didn\'t find a likelihood row after the scenario names.')
+    raise Exception('Didn\'t find a header row ending in "fault?" after the likelihoods.')
+
+def parse_number(cells, j, number, what, convert):
+    cell = cells[j].strip() if j < len(cells) else ''
+    try:
+        return convert(cell)
+    except ValueError:
+        raise Exception('Row %d, column %s: expected a number for %s, not "%s".' % (number, column_name(j), what, cell))
+
+def parse_fault(cell, j, number, name):
+    value = fault_cells.get(cell.strip())
+    if value is None:
+        raise Exception('Row %d, column %s: fault? values for steward "%s" must be 0 or 1, not "%s".' % (
+            number, column_name(j), name, cell.strip()))
+    return value
+
+def column_name(j):
+    '''Return the spreadsheet name (A, B, ... Z, AA, AB ...) of the column with 0-based index j.'''
+    name = ''
+    j += 1
+    while j:
+        j, remainder = divmod(j - 1, 26)
+        name = chr(ord('A') + remainder) + name
+    return name
+
 def is_steward_row(row):
     if has_string(row[0]) and has_num(row[1]):
         for x in row[2:]:
@@ -93,11 +232,6 @@ def is_steward_row(row):
                 return False
         return True
 
-def apply_rule(row, vars, var_name, test_func, assign_func):
-    if test_func(row):
-        vars[var_name] = assign_func(row)
-        return True
-
 def is_empty_row(r):
     if r:
         for cell in r:
@@ -106,7 +240,7 @@ def is_empty_row(r):
     return True
 
 def convert_float(txt):
-    if type(txt) is str or type(txt) is unicode:
+    if isinstance(txt, str):
         txt = txt.strip()
         if txt.endswith('%'):
             return float(txt[:-1]) * 0.01
@@ -131,25 +265,140 @@ def has_num(cell):
 def max_f_for_steward_count(n):
     return max(int((n - 1) / 3), 0)
 
-def load_data(fname, requested_f=max_f_for_steward_list):
-    rows = load_clean_csv(fname)
-    file_f, scenarios, liks, row_idx = parse_headers(rows)
-    stewards, mttrs, faults = parse_stewards(rows, row_idx)
+def load_data(fname, requested_f=max_f_for_steward_list, instruments=None, cache_dir=None, attributes=None):
+    started = time.time()
+    if cache_dir:
+        file_f, scenarios, liks, stewards, mttrs, faults = load_csv_cached(fname, cache_dir, instruments, attributes)
+    else:
+        file_f, scenarios, liks, stewards, mttrs, faults = load_csv(fname, attributes)
+        if instruments:
+            instruments.add_time('load_csv', time.time() - started)
+    return resolve_f(requested_f, len(stewards), file_f), scenarios, liks, stewards, mttrs, faults
+
+def resolve_f(requested_f, n, file_f=0):
     # Check validity of the f value we've been given.
-    max_f = max_f_for_steward_count(len(stewards))
+    max_f = max_f_for_steward_count(n)
     if file_f > 0 and (requested_f == f_from_data_file):
         requested_f = file_f
     elif requested_f == max_f_for_steward_list:
         requested_f = max_f
     if requested_f > max_f:
-        raise Exception("%d stewards allow f=%d; can't satisfy requested f=%d." % (len(stewards), max_f, requested_f))
-    return requested_f, scenarios, liks, stewards, mttrs, faults
+        raise Exception("%d stewards allow f=%d; can't satisfy requested f=%d." % (n, max_f, requested_f))
+    return requested_f
+
+default_cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'steward-select')
+cache_magic = b'STEWARDS'
+cache_version = 2
+# Magic, version, steward count, scenario count, F from the file, length of the names.
+cache_header = '<8sIIIiI'
+# The bits of each byte value, lowest first, one per byte, for unpacking fault rows.
+byte_bits = [bytes([(b >> i) & 1 for i in range(8)]) for b in range(256)]
+
+def load_csv_cached(fname, cache_dir, instruments=None, attributes=None):
+    '''
+    Like load_csv(), but keep what it returns (and the stewards' attributes) in
+    cache_dir, in a file named for the SHA-256 hash of the CSV file's contents, and
+    load that instead if it exists. Any change to the CSV file changes the hash, so a
+    stale cache is never used.
+    '''
+    import hashlib
+    started = time.time()
+    with open(fname, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    cache_fname = os.path.join(cache_dir, digest + '.cache')
+    data = None
+    found = {}
+    if os.path.exists(cache_fname):
+        data = load_cache(cache_fname, found)
+    if data is not None:
+        if instruments:
+            instruments.add_time('load_cache', time.time() - started)
+    else:
+        data = load_csv(fname, found)
+        if instruments:
+            instruments.add_time('load_csv', time.time() - started)
+        # The cache only saves time; if it can't be written, carry on without it.
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            save_cache(cache_fname, data, found)
+        except OSError as e:
+            sys.stderr.write("Couldn't cache %s in %s: %s\n" % (fname, cache_dir, e))
+    if attributes is not None:
+        attributes.update(found)
+    return data
+
+def save_cache(fname, data, attributes=None):
+    '''
+    Write load_csv()'s results in a compact binary form that load_cache() can
+    memory-map: a header, the scenario and steward names and any attributes as JSON, the likelihoods and
+    MTTRs as little-endian doubles, and then each steward's faults packed 8 scenarios
+    to a byte, lowest bit first. Like checkpoints, the file is replaced atomically;
+    each writer uses its own temporary file, so processes caching the same data at
+    once don't trip over each other.
+    '''
+    import json, struct, tempfile
+    file_f, scenarios, liks, stewards, mttrs, faults = data
+    names = json.dumps([scenarios, stewards, attributes or {}]).encode('utf-8')
+    row_bytes = (len(scenarios) + 7) // 8
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fname) or '.', prefix=os.path.basename(fname) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(struct.pack(cache_header, cache_magic, cache_version, len(stewards), len(scenarios), file_f, len(names)))
+            f.write(names)
+            f.write(struct.pack('<%dd' % len(liks), *liks))
+            f.write(struct.pack('<%dd' % len(mttrs), *mttrs))
+            for row in faults:
+                bits = ''.join(['1' if x else '0' for x in reversed(row)])
+                f.write(int(bits or '0', 2).to_bytes(row_bytes, 'little'))
+        os.replace(tmp, fname)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+def load_cache(fname, attributes=None):
+    '''
+    Read a file written by save_cache(); return None if it isn't one we can use. If
+    attributes is a dict, fill it in as load_csv() would.'''
+    import json, mmap, struct
+    header_size = struct.calcsize(cache_header)
+    with open(fname, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+        with mapped:
+            if len(mapped) < header_size:
+                return None
+            magic, version, n, scenario_count, file_f, names_size = struct.unpack_from(cache_header, mapped)
+            row_bytes = (scenario_count + 7) // 8
+            offset = header_size + names_size
+            if magic != cache_magic or version != cache_version or \
+                    len(mapped) != offset + 8 * (scenario_count + n) + row_bytes * n:
+                return None
+            scenarios, stewards, found = json.loads(mapped[header_size:offset].decode('utf-8'))
+            liks = list(struct.unpack_from('<%dd' % scenario_count, mapped, offset))
+            offset += 8 * scenario_count
+            mttrs = list(struct.unpack_from('<%dd' % n, mapped, offset))
+            offset += 8 * n
+            unpacked = b''.join(map(byte_bits.__getitem__, mapped[offset:offset + row_bytes * n]))
+            row_size = 8 * row_bytes
+            faults = [list(unpacked[i:i + scenario_count]) for i in range(0, row_size * n, row_size)]
+    if attributes is not None:
+        attributes.update(found)
+    return file_f, scenarios, liks, stewards, mttrs, faults
 
 def factorial(n):
     if n < 2:
         return 1
     return n * factorial(n - 1)
 
+def choose(n, k):
+    if k < 0 or k > n:
+        return 0
+    # Ranking and unranking combinations call this a lot; math.comb is much faster
+    # than dividing factorials, with the same result.
+    return math.comb(n, k)
+
 default_best_N = 10
 worst_best_score = -10000000
 invalid_worst_idx = -1
@@ -158,9 +407,13 @@ class BestN:
     '''
     Keep track of the best N combinations. We could do this with a simple sorted list,
     but when we have to insert tens of millions of time, there's really no point in
-    keeping the list sorted constantly. It's far faster to just keep track of the
-    worst item and keep replacing it with something better -- then sort once at the
-    end.
+    keeping the list sorted constantly. Instead we keep a min-heap whose root is the
+    worst item, so replacing it with something better is O(log N) -- then sort once
+    at the end.
+
+    Ties are broken by a sequence number: the item with the lower one is better. By
+    default that's the order in which items are offered, so the list holds the best N
+    items in the order we saw them, no matter how the stream is split up and merged.
     '''
     def __init__(self, quantifier, max=default_best_N):
         '''
@@ -171,63 +424,381 @@ class BestN:
         assert quantifier
         assert type(max) is type(3)
         assert max > 0
-        assert max <= 10000
-        self._items = []
+        # Heap entries are (score, -seq, count, item); count keeps items from ever
+        # being compared to each other.
+        self._heap = []
+        self._count = 0
+        self._next_seq = 0
+        self._ranked = None
         self.quantifier = quantifier
-        self._sorted = False
         self.max = max
-        self.worst_idx = invalid_worst_idx
-        self.worst_score = worst_best_score
-    def _find_worst(self):
-        self.worst_idx = invalid_worst_idx
-        self.worst_score = worst_best_score
-        for i in range(len(self._items)):
-            n = self.quantifier(self._items[i])
-            if (self.worst_idx == invalid_worst_idx) or (n < self.worst_score):
-                self.worst_idx = i
-                self.worst_score = n
+    def cutoff(self):
+        '''
+        Return the lowest score a candidate could get into the list with (by winning
+        a tie), or None if the list still has room for anything.'''
+        if len(self._heap) < self.max:
+            return None
+        return self._heap[0][0]
+    def holds(self, score, seq):
+        '''
+        Return whether an item offered with score and seq is still in the list (or one
+        with them would get in now). Only the worst item ever leaves, and the worst
+        only gets better, so that's a comparison with the worst.'''
+        return len(self._heap) < self.max or (score, -seq) >= self._heap[0][:2]
     def __getattr__(self, item):
         if item == 'items':
-            if not self._sorted:
-                self._items.sort(reverse=True)
-                self._find_worst()
-                self._sorted = True
-            return self._items
+            return [entry[3] for entry in self._sorted_entries()]
+        if item == 'worst_idx':
+            # Where the worst item is in items -- the heap's root, found in the
+            # sorted list rather than assumed to be wherever the heap's last entry is.
+            if not self._heap:
+                return invalid_worst_idx
+            root = self._heap[0]
+            return next(i for i, entry in enumerate(self._sorted_entries()) if entry is root)
+        if item == 'worst_score':
+            return self._heap[0][0] if self._heap else worst_best_score
         raise AttributeError(item)
-    def keep_if_better(self, candidate):
-        if len(self._items) < self.max:
-            self._items.append(candidate)
-            self._sorted = False
+    def _sorted_entries(self):
+        if self._ranked is None:
+            self._ranked = sorted(self._heap, key=lambda entry: (-entry[0], -entry[1]))
+        return self._ranked
+    def ranked(self):
+        '''Return (seq, item) pairs, best first.'''
+        return [(-entry[1], entry[3]) for entry in self._sorted_entries()]
+    def keep_if_better(self, candidate, seq=None):
+        self._offer(self.quantifier(candidate), seq, candidate, None)
+    def keep_many(self, scores, seqs, make_item):
+        '''
+        Offer a batch of candidates as parallel sequences of scores and sequence
+        numbers, e.g. the output of a vectorized scorer and the ranks of the
+        combinations it scored. make_item(seq) is only called for the candidates that
+        get into the list.'''
+        for score, seq in zip(scores, seqs):
+            self._offer(score, seq, None, make_item)
+    def _offer(self, score, seq, candidate, make_item):
+        if seq is None:
+            seq = self._next_seq
+        self._next_seq = max(self._next_seq, seq + 1)
+        if len(self._heap) >= self.max:
+            worst = self._heap[0]
+            if score < worst[0] or (score == worst[0] and -seq <= worst[1]):
+                return
+        if make_item:
+            candidate = make_item(seq)
+        self._count += 1
+        entry = (score, -seq, self._count, candidate)
+        if len(self._heap) < self.max:
+            heapq.heappush(self._heap, entry)
         else:
-            if self.worst_idx == invalid_worst_idx:
-                self._find_worst()
-            score = self.quantifier(candidate)
-            if score > self.worst_score:
-                self._items[self.worst_idx] = candidate
-                self.worst_idx = invalid_worst_idx # Need to recalculate
-                self._sorted = False
+            heapq.heapreplace(self._heap, entry)
+        self._ranked = None
+
+default_histogram_bins = 1024
+# Scores are binned no finer than this once there are too many distinct ones to count
+# exactly.
+min_histogram_width = 2.0 ** -40
+distribution_percentiles = [1, 5, 25, 50, 75, 95, 99]
+
+class ScoreHistogram:
+    '''
+    Histogram of combined scores in bounded memory. Scores are counted exactly until
+    there are more than max_bins distinct ones; after that they're counted in bins of
+    width 2**k anchored at 0, with k as small as keeps the number of bins within
+    max_bins. Because such bins nest, the result doesn't depend on the order scores
+    arrive in, so histograms of separate ranges can be merged.
+    '''
+    def __init__(self, max_bins=default_histogram_bins):
+        self.max_bins = max_bins
+        self.width = None
+        self.counts = {}
+        self.total = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+    def add(self, score, count=1):
+        key = score if self.width is None else math.floor(score / self.width)
+        self.counts[key] = self.counts.get(key, 0) + count
+        self._note(score, score, count, score * count)
+    def add_many(self, np, scores):
+        '''Add a NumPy array of scores.'''
+        if not len(scores):
+            return
+        keys, counts = np.unique(scores if self.width is None else np.floor(scores / self.width), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            if self.width is not None:
+                key = int(key)
+            self.counts[key] = self.counts.get(key, 0) + count
+        self._note(float(scores.min()), float(scores.max()), len(scores), float(scores.sum()))
+    def merge(self, other):
+        if other.width is not None:
+            self._rebin(other.width)
+            factor = int(self.width / other.width)
+            for key, count in other.counts.items():
+                self.counts[key // factor] = self.counts.get(key // factor, 0) + count
+        else:
+            for score, count in other.counts.items():
+                key = score if self.width is None else math.floor(score / self.width)
+                self.counts[key] = self.counts.get(key, 0) + count
+        if other.total:
+            self._note(other.min, other.max, other.total, other.sum)
+    def _note(self, low, high, count, total):
+        self.total += count
+        self.sum += total
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        if len(self.counts) > self.max_bins:
+            self._rebin(self.width or min_histogram_width)
+    def _rebin(self, width):
+        if self.width is None:
+            self.width = min_histogram_width
+            exact = self.counts
+            self.counts = {}
+            for score, count in exact.items():
+                key = math.floor(score / self.width)
+                self.counts[key] = self.counts.get(key, 0) + count
+        while self.width < width or len(self.counts) > self.max_bins:
+            self.width *= 2
+            merged = {}
+            for key, count in self.counts.items():
+                merged[key // 2] = merged.get(key // 2, 0) + count
+            self.counts = merged
+    def bins(self):
+        '''Return (low, high, count) for each non-empty bin, lowest first; low == high while counts are exact.'''
+        if self.width is None:
+            return [(score, score, self.counts[score]) for score in sorted(self.counts)]
+        return [(key * self.width, (key + 1) * self.width, self.counts[key]) for key in sorted(self.counts)]
+    def percentile(self, p):
+        '''
+        Return the score that p percent of combinations are at or below: exact while
+        counts are exact, and interpolated within its bin after that.'''
+        if not self.total:
+            return None
+        target = max(1, int(math.ceil(p / 100.0 * self.total)))
+        seen = 0
+        for low, high, count in self.bins():
+            if seen + count >= target:
+                if low == high:
+                    return low
+                return min(max(low + (high - low) * (target - seen) / count, self.min), self.max)
+            seen += count
+        return self.max
+    def fraction_below(self, score):
+        '''Return the fraction of combinations that score less than score.'''
+        below = 0
+        for low, high, count in self.bins():
+            if high <= score and low < score:
+                below += count
+            elif low < score:
+                below += count * (score - low) / (high - low)
+        return float(below) / self.total if self.total else 0.0
+    def summary(self):
+        return dict(combinations=self.total, exact=self.width is None, bin_width=self.width, min=self.min,
+                    max=self.max, mean=self.sum / self.total if self.total else None,
+                    percentiles=dict([(p, self.percentile(p)) for p in distribution_percentiles]))
+
+class ParetoFront:
+    '''
+    Keep the combinations that no other combination beats on all three objectives of
+    combo_objectives(), each of which is better when lower: expected downtime, the
+    worst MTTR of any scenario, and the number of scenarios that lose consensus.
+
+    Comparing each candidate with every point kept would be quadratic. Instead there
+    is a "staircase" of points per scenario count: sorted by expected downtime, and
+    so by worst MTTR in the opposite order, since none of them beats another. In a
+    staircase for the same or a lower count, the only point that could beat a
+    candidate is the last one with no more downtime, which bisect finds. The points a
+    new one beats make up one contiguous run of each staircase for the same or a
+    higher count. There are only as many staircases as distinct counts, so an offer
+    costs a few bisects however big the front gets.
+
+    Combinations with exactly the same objectives share a point, and are all kept.
+    Sequence numbers are as for BestN: by default, the order items are offered in.
+    '''
+    def __init__(self):
+        # count -> [downtimes, worst MTTRs, lists of (seq, item)], and the counts, sorted.
+        self._stairs = {}
+        self._counts = []
+        self._size = 0
+        self._next_seq = 0
+    def __len__(self):
+        return self._size
+    def dominated(self, objectives):
+        '''Return True if a point already kept beats objectives.'''
+        downtime, worst, count = objectives
+        for key in self._counts:
+            if key > count:
+                break
+            downtimes, worsts, entries = self._stairs[key]
+            i = bisect.bisect_right(downtimes, downtime) - 1
+            if i >= 0 and worsts[i] <= worst and (key < count or downtimes[i] < downtime or worsts[i] < worst):
+                return True
+        return False
+    def offer(self, objectives, seq=None, candidate=None, make_item=None):
+        '''
+        Keep candidate if nothing kept beats its objectives, and drop whatever it beats.
+        As with BestN.keep_many(), make_item(seq) can stand in for candidate, and is only
+        called if it's kept. Returns True if it was kept.'''
+        if seq is None:
+            seq = self._next_seq
+        self._next_seq = max(self._next_seq, seq + 1)
+        if self.dominated(objectives):
+            return False
+        if make_item:
+            candidate = make_item(seq)
+        downtime, worst, count = objectives
+        self._size += 1
+        if count in self._stairs:
+            downtimes, worsts, entries = self._stairs[count]
+            i = bisect.bisect_left(downtimes, downtime)
+            if i < len(downtimes) and downtimes[i] == downtime and worsts[i] == worst:
+                # Anything this point would beat, its twin already did.
+                entries[i].append((seq, candidate))
+                return True
+        for key in self._counts[bisect.bisect_left(self._counts, count):]:
+            downtimes, worsts, entries = self._stairs[key]
+            lo = hi = bisect.bisect_left(downtimes, downtime)
+            while hi < len(worsts) and worsts[hi] >= worst:
+                hi += 1
+            if hi > lo:
+                self._size -= sum([len(e) for e in entries[lo:hi]])
+                del downtimes[lo:hi], worsts[lo:hi], entries[lo:hi]
+                if not downtimes and key != count:
+                    self._counts.remove(key)
+                    del self._stairs[key]
+        if count not in self._stairs:
+            bisect.insort(self._counts, count)
+            self._stairs[count] = [[], [], []]
+        downtimes, worsts, entries = self._stairs[count]
+        i = bisect.bisect_left(downtimes, downtime)
+        downtimes.insert(i, downtime)
+        worsts.insert(i, worst)
+        entries.insert(i, [(seq, candidate)])
+        return True
+    def ranked(self):
+        '''
+        Return (objectives, seq, item) for everything kept, by expected downtime, then
+        worst MTTR, then scenario count, then sequence number.'''
+        points = []
+        for count in self._counts:
+            downtimes, worsts, entries = self._stairs[count]
+            for downtime, worst, entry in zip(downtimes, worsts, entries):
+                for seq, item in entry:
+                    points.append(((downtime, worst, count), seq, item))
+        points.sort(key=lambda point: (point[0], point[1]))
+        return points
+    @property
+    def items(self):
+        return [point[2] for point in self.ranked()]
+
+class TimedBestN(BestN):
+    '''A BestN that adds the time spent maintaining it to an Instrumentation.'''
+    def __init__(self, quantifier, max, instruments):
+        BestN.__init__(self, quantifier, max)
+        self.instruments = instruments
+    def keep_if_better(self, candidate, seq=None):
+        started = time.time()
+        BestN.keep_if_better(self, candidate, seq)
+        self.instruments.add_time('bestn', time.time() - started)
+    def keep_many(self, scores, seqs, make_item):
+        # Building the items is scoring, not list maintenance.
+        building = [0]
+        def timed_make_item(seq):
+            started = time.time()
+            item = make_item(seq)
+            building[0] += time.time() - started
+            return item
+        started = time.time()
+        BestN.keep_many(self, scores, seqs, timed_make_item)
+        self.instruments.add_time('bestn', time.time() - started - building[0])
+
+class Instrumentation:
+    '''
+    Optional instrumentation for a run: a progress line on stderr every progress_every
+    seconds, the time spent in each phase, and overall stats that can be dumped as
+    JSON to track performance across releases.
+    '''
+    def __init__(self, progress_every=None, stream=None):
+        self.progress_every = progress_every
+        self.stream = stream or sys.stderr
+        self.phases = {}
+        self.stats = {}
+        self._last_progress = None
+    def add_time(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0) + seconds
+    def progress(self, done, total, first, elapsed, final=False):
+        '''
+        Print a progress line if one is due. first is where this run started (it's
+        not zero when resuming) and elapsed is how long it has taken so far.'''
+        if not self.progress_every:
+            return
+        now = time.time()
+        if not final and self._last_progress is not None and now - self._last_progress < self.progress_every:
+            return
+        self._last_progress = now
+        rate = (done - first) / elapsed if elapsed > 0 else 0
+        eta = format_duration((total - done) / rate) if rate else '?'
+        self.stream.write('%d/%d combinations (%.1f%%), %.0f/sec, ETA %s\n' % (
+            done, total, 100.0 * done / max(total, 1), rate, eta))
+        self.stream.flush()
+    def report_phases(self):
+        for phase in sorted(self.phases, key=lambda p: -self.phases[p]):
+            self.stream.write('%-16s %10.3f sec\n' % (phase, self.phases[phase]))
+    def dump(self, fname):
+        import json
+        stats = dict(self.stats)
+        stats['phases'] = self.phases
+        with open(fname, 'w') as f:
+            json.dump(stats, f, indent=2, sort_keys=True)
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return '%d:%02d:%02d' % (seconds // 3600, (seconds // 60) % 60, seconds % 60)
 
 class ComboAnalysis:
-    '''Encapsulate info about a single combination of stewards.'''
-    def __init__(self, combo, stewards):
-        self.combo = sorted(combo)
-        self.steward_indexes = [stewards.index(s) for s in combo]
-        self.results = []
-        self._total = None
-    def __getattr__(self, item):
-        if item == 'combined_score':
-            if self._total is None:
-                self._total = sum([r.score for r in self.results])
-            return self._total
-        raise AttributeError(item)
+    '''
+    Encapsulate info about a single combination of stewards. The combination is held
+    as indexes into the steward list; names are only looked up for reporting. If the
+    score is already known, pass it in along with data, a (scenarios, liks, mttrs,
+    faults, f) tuple, and the per-scenario results are only built if someone asks.'''
+    __slots__ = ('steward_indexes', 'stewards', '_results', '_total', '_data')
+    def __init__(self, steward_indexes, stewards, combined_score=None, data=None):
+        self.steward_indexes = steward_indexes
+        self.stewards = stewards
+        self._results = None
+        self._total = combined_score
+        self._data = data
+    @property
+    def results(self):
+        if self._results is None:
+            self._results = []
+            if self._data:
+                scenarios, liks, mttrs, faults, f = self._data
+                # Sorted once, for all the scenarios.
+                ordered_mttrs = sorted([mttrs[ci] for ci in self.steward_indexes])
+                for scenario in scenarios:
+                    self._results.append(ScenarioResult(scenario, scenarios, liks, faults, self.steward_indexes, f, mttrs,
+                                                        ordered_mttrs))
+        return self._results
+    @property
+    def combined_score(self):
+        if self._total is None:
+            self._total = sum([r.score for r in self.results])
+        return self._total
+    @property
+    def combo(self):
+        return sorted([self.stewards[i] for i in self.steward_indexes])
     def __lt__(self, other):
         return self.combined_score < other.combined_score
     def __str__(self):
         return '%s: %s' % ('+'.join(self.combo), self.combined_score)
 
 class ScenarioResult:
-    '''Encapsulate info about one combination of stewards in one scenario.'''
-    def __init__(self, scenario, scenarios, liks, faults, combo_indexes, f, mttrs):
+    '''
+    Encapsulate info about one combination of stewards in one scenario. If the
+    combination's MTTRs have already been sorted, pass them as ordered_mttrs.'''
+    __slots__ = ('name', 'idx', 'likelihood', 'combo_indexes', 'f', 'fault_count', 'profile',
+                 'failure_distance', 'mttr', 'importance', 'score')
+    def __init__(self, scenario, scenarios, liks, faults, combo_indexes, f, mttrs, ordered_mttrs=None):
         self.name = scenario
         self.idx = scenarios.index(scenario)
         self.likelihood = liks[self.idx]
@@ -246,11 +817,12 @@ class ScenarioResult:
         self.profile = profile
         self.failure_distance = self.f - self.fault_count
         if self.failure_distance < 0:
-            relevant_mttrs.sort()
+            if ordered_mttrs is None:
+                ordered_mttrs = sorted(relevant_mttrs)
             # The MTTR of the scenario is the time it will take for the i-th node to
             # repair its fault, where i is the number of the node that finally
             # gets the whole network back into consensus.
-            self.mttr = relevant_mttrs[-(self.failure_distance + 1)]
+            self.mttr = ordered_mttrs[-(self.failure_distance + 1)]
             self.importance = self.likelihood * self.mttr
         else:
             # We don't have any repair time if we never lost consensus.
@@ -263,174 +835,2595 @@ class ScenarioResult:
     def __lt__(self, other):
         return self.score < other.score
 
-def analyze(f, scenarios, liks, stewards, mttrs, faults, bestN, quiet=False):
+python_engine = 'python'
+numpy_engine = 'numpy'
+branch_and_bound_engine = 'bnb'
+incremental_engine = 'incremental'
+bitmask_engine = 'bitmask'
+engines = [python_engine, numpy_engine, branch_and_bound_engine, incremental_engine, bitmask_engine]
+numpy_block_size = 8192
+shards_per_worker = 4
+# analyze_in_slices() keeps this many slices per worker queued up.
+slices_queued_per_worker = 2
+default_checkpoint_every = 60
+checkpoint_version = 1
+# The first slice of a checkpointed run; later slices are sized to take a fraction of
+# the checkpoint interval.
+first_checkpoint_slice = 10000
+# score_distribution() gives up, and the scores are streamed into a histogram during
+# analysis instead, once it would have to track more partial combinations than this,
+# or than 1/distribution_state_ratio of the combinations themselves (but it always
+# allows min_distribution_states).
+max_distribution_states = 1000000
+distribution_state_ratio = 16
+min_distribution_states = 10000
+default_approximate_evaluations = 1000000
+approximate_strata = 1024
+approximate_sample_share = 0.2
+# How many scores analyze_approximately() remembers, so that a search with only a time
+# budget runs in bounded memory. Each takes a few hundred bytes.
+approximate_cache_size = 250000
+# Bounds are computed with floating point, in a different order than real scores, so
+# only prune when a bound falls short of the cutoff by more than rounding could explain.
+bound_tolerance = 1e-9
+
+def analyze(f, scenarios, liks, stewards, mttrs, faults, bestN, quiet=False, engine=python_engine, workers=1,
+            checkpoint=None, checkpoint_every=default_checkpoint_every, resume=False, instruments=None, histogram=None,
+            constraints=None, symmetry=False, merge_scenarios=False, front=None):
     m = (3 * f) + 1
     n = len(stewards)
-    total_combinations = factorial(n) / (factorial(m) * factorial(n - m))
+    total_combinations = choose(n, m)
     if not quiet:
         print('Analyzing %d total %d-steward combinations (n=%d, f=%d).' % (total_combinations, m, n, f))
-    best = BestN(lambda x: x.combined_score, bestN)
-    for combo in unique_combinations(stewards, m):
-        analyze_combo(combo, best, scenarios, liks, stewards, mttrs, faults, f)
+    full = None
+    if merge_scenarios:
+        full = (scenarios, liks, faults)
+        scenarios, liks, faults, groups = distinct_scenarios(scenarios, liks, faults)
+        if len(groups) == len(full[0]):
+            scenarios, liks, faults = full
+            full = None
+        elif not quiet:
+            print('Merged %d scenarios into %d with distinct fault columns.' % (len(full[0]), len(groups)))
+    if engine not in engines:
+        raise Exception("Unknown engine %s; expected one of: %s" % (engine, ', '.join(engines)))
+    if engine == incremental_engine and (workers > 1 or checkpoint):
+        raise Exception("The %s engine walks combinations in an order that can't be split across workers or checkpointed." % engine)
+    if histogram is not None and engine == branch_and_bound_engine:
+        raise Exception("The %s engine skips most combinations, so it can't build a histogram of their scores." % engine)
+    if histogram is not None and checkpoint:
+        raise Exception("A histogram of scores can't be checkpointed.")
+    if constraints is not None and (engine != python_engine or workers > 1 or checkpoint or
+                                    (instruments and instruments.progress_every)):
+        raise Exception("Constraints are applied during the %s engine's search, in one process, without checkpoints "
+                        "or progress lines." % python_engine)
+    if front is not None and (engine not in [python_engine, numpy_engine] or workers > 1 or checkpoint or
+                              constraints is not None or symmetry or merge_scenarios):
+        raise Exception("A Pareto front is built by the %s or %s engine, in one process, from every combination of "
+                        "the scenarios as given, without checkpoints." % (python_engine, numpy_engine))
+    classes = None
+    if symmetry:
+        if engine != python_engine or constraints is not None or workers > 1 or checkpoint:
+            raise Exception("Interchangeable stewards can only be collapsed by the %s engine, in one process, without "
+                            "constraints or checkpoints." % python_engine)
+        classes = steward_classes(mttrs, faults)
+        if len(classes) == n:
+            classes = None
+        elif not can_collapse(mttrs):
+            if not quiet:
+                print("Not collapsing identical stewards: their MTTRs aren't all whole numbers, so their combinations "
+                      "might not score identically.")
+            classes = None
+    if instruments:
+        best = TimedBestN(lambda x: x.combined_score, bestN, instruments)
+    else:
+        best = BestN(lambda x: x.combined_score, bestN)
+    started = time.time()
+    # Progress lines need the work cut into slices, which the incremental engine's
+    # order doesn't allow.
+    progress = instruments and instruments.progress_every and engine != incremental_engine
+    if classes is not None:
+        multisets = analyze_multisets(f, scenarios, liks, stewards, mttrs, faults, best, classes, histogram)
+        if not quiet:
+            print('Collapsed %d stewards into %d classes of identical ones; scored %d multisets of classes.' % (
+                n, len(classes), multisets))
+        stats = None
+    elif constraints is not None:
+        stats = analyze_constrained(f, scenarios, liks, stewards, mttrs, faults, best, constraints, histogram)
+    elif checkpoint or progress:
+        stats = analyze_in_slices(engine, f, scenarios, liks, stewards, mttrs, faults, best, workers,
+                                  checkpoint, checkpoint_every, resume, quiet, instruments, histogram, front)
+    elif workers > 1:
+        stats = analyze_in_parallel(engine, f, scenarios, liks, stewards, mttrs, faults, best, workers, histogram=histogram)
+    else:
+        stats = analyze_range(engine, f, scenarios, liks, stewards, mttrs, faults, best, 0, total_combinations, histogram,
+                              front)
+    if full:
+        best = rescore(best, f, full[0], full[1], stewards, mttrs, full[2])
+    if stats and not quiet:
+        print('Visited %d prefixes; pruned %d subtrees holding %d combinations (%.2f%%).' % (
+            stats[0], stats[1], stats[2], 100.0 * stats[2] / max(total_combinations, 1)))
+    if instruments:
+        elapsed = time.time() - started
+        instruments.add_time('scoring', elapsed - instruments.phases.get('bestn', 0))
+        instruments.stats.update({
+            'engine': engine, 'workers': workers, 'n': n, 'm': m, 'f': f, 'scenarios': len(full[0]) if full else len(scenarios),
+            'best': bestN, 'combinations': total_combinations, 'seconds': elapsed,
+            'combinations_per_second': total_combinations / elapsed if elapsed > 0 else None,
+            'best_score': best.items[0].combined_score if best.items else None,
+        })
+        if full:
+            instruments.stats['distinct_scenarios'] = len(scenarios)
+        if front is not None:
+            instruments.stats['pareto_front'] = len(front)
+        if stats:
+            instruments.stats.update({'prefixes_visited': stats[0], 'subtrees_pruned': stats[1], 'combinations_pruned': stats[2]})
     return best
 
-def analyze_combo(combo, best, scenarios, liks, stewards, mttrs, faults, f):
+def distinct_scenarios(scenarios, liks, faults):
+    '''
+    A combination's score in a scenario depends only on the scenario's column of
+    faults, and is proportional to its likelihood, so scenarios with the same column
+    can be scored as one whose likelihood is the sum of theirs. That includes the
+    scenarios nobody faults in, whose term depends only on the combination's MTTRs.
+    Returns scenarios, liks and faults with one column per distinct fault column, in
+    order of first appearance, plus a list of the original indexes merged into each.
+    Merged scenarios are named after the ones they stand for, joined by " + ".
+    '''
+    columns = {}
+    groups = []
+    for s, column in enumerate(zip(*faults)):
+        column = tuple(1 if x else 0 for x in column)
+        if column not in columns:
+            columns[column] = len(groups)
+            groups.append([])
+        groups[columns[column]].append(s)
+    merged_liks = []
+    for group in groups:
+        # Added in scenario order, the same way every time.
+        lik = 0
+        for s in group:
+            lik += liks[s]
+        merged_liks.append(lik)
+    merged_scenarios = [' + '.join([scenarios[s] for s in group]) for group in groups]
+    firsts = [group[0] for group in groups]
+    merged_faults = [[row[s] for s in firsts] for row in faults]
+    return merged_scenarios, merged_liks, merged_faults, groups
+
+def rescore(best, f, scenarios, liks, stewards, mttrs, faults):
+    '''
+    Score the items in best again against the scenarios given, keeping their sequence
+    numbers, and return a new BestN of them. After a search over merged scenarios,
+    this gives the scores and per-scenario results an unmerged run would have shown
+    for the same combinations. Merging only changes how the sums round, so the
+    ranking can only differ between combinations whose scores differ by rounding.
+    '''
+    data = (scenarios, liks, mttrs, faults, f)
+    rescored = BestN(lambda x: x.combined_score, best.max)
+    for seq, item in best.ranked():
+        combo = item.steward_indexes
+        rescored.keep_if_better(ComboAnalysis(combo, stewards, combo_score(combo, liks, mttrs, faults, f), data), seq)
+    return rescored
+
+def analyze_range(engine, f, scenarios, liks, stewards, mttrs, faults, best, start, stop, histogram=None, front=None):
+    '''
+    Analyze the combinations at positions start..stop-1 of the order that
+    unique_combinations() produces them in. Positions are used as BestN sequence
+    numbers, so ties go to the combination that comes first. If there's a histogram,
+    every score is added to it; if there's a front (a ParetoFront, for the python and
+    numpy engines), every combination is offered to it. Returns search stats for the
+    branch-and-bound engine, and None otherwise.
+    '''
+    if engine == numpy_engine:
+        analyze_numpy(f, scenarios, liks, stewards, mttrs, faults, best, start, stop, histogram=histogram, front=front)
+    elif engine == branch_and_bound_engine:
+        return analyze_branch_and_bound(f, scenarios, liks, stewards, mttrs, faults, best, start, stop)
+    elif engine == incremental_engine:
+        assert start == 0 and stop == choose(len(stewards), (3 * f) + 1)
+        analyze_incremental(f, scenarios, liks, stewards, mttrs, faults, best, histogram)
+    elif engine == bitmask_engine:
+        analyze_bitmasks(f, scenarios, liks, stewards, mttrs, fault_masks(faults, len(scenarios)), best, start, stop, histogram)
+    else:
+        analyze_by_prefix(f, scenarios, liks, stewards, mttrs, faults, best, start, stop, histogram, front)
+
+def analyze_by_prefix(f, scenarios, liks, stewards, mttrs, faults, best, start, stop, histogram=None, front=None):
+    '''
+    Does the same job as calling analyze_combo() on every combination in start..stop-1.
+    In lexicographic order, runs of combinations share everything but their last
+    member, so the shared prefix's fault counts, MTTR sum and sorted MTTRs are worked
+    out once per run, and score_run() scores the run. If there's a front,
+    objectives_run() works out what it needs from the same prefix.
+    '''
+    m = (3 * f) + 1
+    n = len(stewards)
+    if start >= stop:
+        return
+    data = (scenarios, liks, mttrs, faults, f)
+    scenario_range = range(len(liks))
+    rows = [[1 if x else 0 for x in row] for row in faults]
+    first = unrank_combination(n, m, start)
+    seq = start
+    for prefix in index_combinations(n - 1, m - 1, rank_combination(n - 1, m - 1, first[:-1])):
+        prefix_mttrs = [mttrs[ci] for ci in prefix]
+        prefix_ordered = sorted(prefix_mttrs)
+        prefix_sum = sum(prefix_mttrs)
+        # f minus the prefix's fault count, per scenario.
+        prefix_distances = [f - sum([rows[ci][s] for ci in prefix]) for s in scenario_range]
+        lowest = first[-1] if seq == start else (prefix[-1] + 1 if prefix else 0)
+        lasts = range(lowest, min(n, lowest + stop - seq))
+        scores = score_run(m, liks, mttrs, rows, prefix_ordered, prefix_sum, prefix_distances, lasts)
+        if front is not None:
+            for last, score, objectives in zip(lasts, scores, objectives_run(liks, mttrs, rows, prefix_ordered,
+                                                                             prefix_distances, lasts)):
+                front.offer(objectives, seq + last - lasts[0],
+                            make_item=lambda _: ComboAnalysis(prefix + (last,), stewards, score, data))
+        for last, score in zip(lasts, scores):
+            if histogram is not None:
+                histogram.add(score)
+            cutoff = best.cutoff()
+            if cutoff is None or score >= cutoff:
+                best.keep_if_better(ComboAnalysis(prefix + (last,), stewards, score, data), seq)
+            seq += 1
+        if seq == stop:
+            return
+
+def score_run(m, liks, mttrs, rows, prefix_ordered, prefix_sum, prefix_distances, lasts):
+    '''
+    Return the scores of a prefix plus each of lasts in turn, given the prefix's sorted
+    MTTRs, MTTR sum and f minus its fault count in each scenario. Each combination
+    adds its last member's fault row to the counts, and its MTTR at the position bisect
+    finds in the prefix's sorted MTTRs, which is enough to look up any order statistic
+    without sorting. The arithmetic is the same as combo_score()'s, so scores match
+    exactly.
+    '''
+    scenario_range = range(len(liks))
+    scores = []
+    for last in lasts:
+        row = rows[last]
+        mttr = mttrs[last]
+        mttr_sum = prefix_sum + mttr
+        position = bisect.bisect_right(prefix_ordered, mttr)
+        score = 0
+        for s in scenario_range:
+            failure_distance = prefix_distances[s] - row[s]
+            if failure_distance < 0:
+                k = -(failure_distance + 1)
+                importance = liks[s] * (prefix_ordered[k] if k < position else mttr if k == position else prefix_ordered[k - 1])
+            else:
+                importance = liks[s] * mttr_sum / m
+            score += importance * failure_distance
+        scores.append(score)
+    return scores
+
+def objectives_run(liks, mttrs, rows, prefix_ordered, prefix_distances, lasts):
+    '''
+    Return combo_objectives() for a prefix plus each of lasts in turn, looking up MTTRs
+    the way score_run() does.
+    '''
+    scenario_range = range(len(liks))
+    objectives = []
+    for last in lasts:
+        row = rows[last]
+        mttr = mttrs[last]
+        position = bisect.bisect_right(prefix_ordered, mttr)
+        downtime = 0
+        worst = 0
+        failures = 0
+        for s in scenario_range:
+            failure_distance = prefix_distances[s] - row[s]
+            if failure_distance < 0:
+                k = -(failure_distance + 1)
+                repair = prefix_ordered[k] if k < position else mttr if k == position else prefix_ordered[k - 1]
+                downtime += liks[s] * repair
+                if repair > worst:
+                    worst = repair
+                failures += 1
+        objectives.append((downtime, worst, failures))
+    return objectives
+
+class Constraints:
+    '''
+    Rules about which stewards can serve together, in terms of the attribute columns
+    of the data file (see parse_rows()). A spec like
+
+        {"max_per": {"jurisdiction": 1, "provider": 1}, "cover": {"region": ["EU", "NA"]}}
+
+    allows at most one steward per jurisdiction and per hosting provider, and needs
+    at least one from each of the listed regions. "max_per" limits how many stewards
+    in a combination can share any one value of an attribute (blank values are never
+    counted); "cover" gives values of an attribute that every combination must
+    include, or can be a list of attribute names, meaning every value they take.
+
+    analyze_constrained() keeps the counts for the combination being built with
+    add() and remove(), and asks fits() before adding each steward.
+    '''
+    def __init__(self, spec, attributes, stewards):
+        unknown = [key for key in spec if key not in ('max_per', 'cover')]
+        if unknown:
+            raise Exception('Unknown constraint %s; expected max_per or cover.' % ', '.join(unknown))
+        def values_of(name):
+            if name not in attributes:
+                raise Exception('No attribute column named "%s"; the data has %s.' % (
+                    name, ', '.join(['"%s"' % x for x in sorted(attributes)]) or 'none'))
+            if len(attributes[name]) != len(stewards):
+                raise Exception('Attribute "%s" has %d values for %d stewards.' % (name, len(attributes[name]), len(stewards)))
+            return attributes[name]
+        # For each limit: each steward's value (as a code, or -1 if blank), the most
+        # stewards allowed to share a value, and how many in the combination have each.
+        self.limits = []
+        for name, limit in sorted(spec.get('max_per', {}).items()):
+            if type(limit) is not int or limit < 1:
+                raise Exception('The max_per limit for "%s" should be a whole number of at least 1.' % name)
+            values = values_of(name)
+            codes = dict([(value, i) for i, value in enumerate(sorted(set([x for x in values if x])))])
+            self.limits.append(([codes.get(x, -1) for x in values], limit, [0] * len(codes)))
+        # For each cover: each steward's value (as a code, or -1 if it isn't needed), the
+        # last steward with each value, and how many in the combination have each.
+        self.covers = []
+        covers = spec.get('cover', {})
+        if isinstance(covers, list):
+            covers = dict([(name, sorted(set([x for x in values_of(name) if x]))) for name in covers])
+        self.cover_values = 0
+        for name, needed in sorted(covers.items()):
+            values = values_of(name)
+            missing = [x for x in needed if x not in values]
+            if missing:
+                raise Exception('No steward has %s "%s".' % (name, missing[0]))
+            codes = dict([(value, i) for i, value in enumerate(needed)])
+            steward_codes = [codes.get(x, -1) for x in values]
+            last = [max([i for i, code in enumerate(steward_codes) if code == c]) for c in range(len(codes))]
+            self.covers.append((steward_codes, last, [0] * len(codes)))
+        self.uncovered = [len(cover[1]) for cover in self.covers]
+    def fits(self, i, remaining):
+        '''
+        Could steward i join the combination being built, with remaining places still
+        to fill after it?'''
+        for codes, limit, counts in self.limits:
+            code = codes[i]
+            if code >= 0 and counts[code] >= limit:
+                return False
+        for (codes, last, counts), uncovered in zip(self.covers, self.uncovered):
+            code = codes[i]
+            if code >= 0 and not counts[code]:
+                uncovered -= 1
+            if uncovered > remaining:
+                return False
+            # Each value still missing needs a steward after i to supply it.
+            for c in range(len(last)):
+                if not counts[c] and c != code and last[c] <= i:
+                    return False
+        return True
+    def add(self, i):
+        for codes, limit, counts in self.limits:
+            if codes[i] >= 0:
+                counts[codes[i]] += 1
+        for j, (codes, last, counts) in enumerate(self.covers):
+            if codes[i] >= 0:
+                if not counts[codes[i]]:
+                    self.uncovered[j] -= 1
+                counts[codes[i]] += 1
+    def remove(self, i):
+        for codes, limit, counts in self.limits:
+            if codes[i] >= 0:
+                counts[codes[i]] -= 1
+        for j, (codes, last, counts) in enumerate(self.covers):
+            if codes[i] >= 0:
+                counts[codes[i]] -= 1
+                if not counts[codes[i]]:
+                    self.uncovered[j] += 1
+    def allows(self, combo):
+        '''Does a whole combination meet the constraints?'''
+        added = []
+        try:
+            for position, i in enumerate(combo):
+                if not self.fits(i, len(combo) - position - 1):
+                    return False
+                self.add(i)
+                added.append(i)
+            return True
+        finally:
+            for i in added:
+                self.remove(i)
+
+def load_constraints(fname, attributes, stewards):
+    import json
+    with open(fname, 'r') as fp:
+        spec = json.load(fp)
+    if type(spec) is not dict:
+        raise Exception('%s should hold an object with max_per and/or cover.' % fname)
+    return Constraints(spec, attributes, stewards)
+
+def analyze_constrained(f, scenarios, liks, stewards, mttrs, faults, best, constraints, histogram=None):
+    '''
+    Does the same job as analyze_by_prefix(), but only for the combinations that meet
+    constraints (a Constraints). Combinations are built depth first, in the same
+    order, and a steward that can't join the prefix built so far cuts off every
+    combination that would start that way. The prefix's fault counts, MTTR sum and
+    sorted MTTRs are carried down from its parent rather than recomputed. Sequence
+    numbers count only the combinations that meet the constraints; they keep the same
+    order, so ties are broken as they would be without them. Returns the same kind of
+    stats as the branch-and-bound engine: prefixes visited, subtrees pruned and
+    combinations pruned.
+    '''
+    m = (3 * f) + 1
+    n = len(stewards)
+    data = (scenarios, liks, mttrs, faults, f)
+    rows = [[1 if x else 0 for x in row] for row in faults]
+    # Prefixes visited, subtrees pruned, combinations scored.
+    counts = [0, 0, 0]
+    def extend(prefix, prefix_ordered, prefix_sum, prefix_distances):
+        lowest = prefix[-1] + 1 if prefix else 0
+        places = m - len(prefix) - 1
+        if not places:
+            counts[0] += 1
+            lasts = [last for last in range(lowest, n) if constraints.fits(last, 0)]
+            counts[1] += n - lowest - len(lasts)
+            for last, score in zip(lasts, score_run(m, liks, mttrs, rows, prefix_ordered, prefix_sum, prefix_distances, lasts)):
+                if histogram is not None:
+                    histogram.add(score)
+                cutoff = best.cutoff()
+                if cutoff is None or score >= cutoff:
+                    best.keep_if_better(ComboAnalysis(prefix + (last,), stewards, score, data), counts[2])
+                counts[2] += 1
+            return
+        for i in range(lowest, n - places):
+            if not constraints.fits(i, places):
+                counts[1] += 1
+                continue
+            constraints.add(i)
+            ordered = list(prefix_ordered)
+            bisect.insort(ordered, mttrs[i])
+            row = rows[i]
+            extend(prefix + (i,), ordered, prefix_sum + mttrs[i], [d - x for d, x in zip(prefix_distances, row)])
+            constraints.remove(i)
+    extend((), [], 0, [f] * len(liks))
+    return counts[0], counts[1], choose(n, m) - counts[2]
+
+def steward_classes(mttrs, faults):
+    '''
+    Group stewards that are interchangeable: same MTTR, same faults. Returns lists of
+    steward indexes, in order of their first members.
+    '''
+    classes = {}
+    for i, (mttr, row) in enumerate(zip(mttrs, faults)):
+        classes.setdefault((mttr, tuple([1 if x else 0 for x in row])), []).append(i)
+    return sorted(classes.values())
+
+def can_collapse(mttrs):
     '''
-    Given a single combination, evaluate its downtime across all scenarios. If it has less
-    downtime than one of the current "top N" combinations, put this one into the "top N"
-    list.
+    Combinations of interchangeable stewards only score identically to the last bit if
+    summing their MTTRs in any order gives the same result, which is guaranteed when
+    they're whole numbers (as in the worksheet) that don't add up to anything huge.
     '''
-    ca = ComboAnalysis(combo, stewards)
-    for scenario in scenarios:
-        sr = ScenarioResult(scenario, scenarios, liks, faults, ca.steward_indexes, f, mttrs)
-        ca.results.append(sr)
-    best.keep_if_better(ca)
+    return all([float(x).is_integer() for x in mttrs]) and sum([abs(x) for x in mttrs]) < 2 ** 52
+
+def analyze_multisets(f, scenarios, liks, stewards, mttrs, faults, best, classes, histogram=None):
+    '''
+    Does the same job as analyze_by_prefix() over every combination, but visits each
+    multiset of steward classes (how many members to take from each class) once, since
+    all the combinations it stands for score the same. Fault counts are carried down
+    from class to class, and each multiset is scored with the same arithmetic as
+    combo_score(). Its sequence number is the position of its lexicographically first
+    combination. The best N multisets, ranked that way, hold the best N combinations;
+    only they are expanded into combinations, in lexicographic order, to fill best.
+    Requires can_collapse(mttrs). Returns the number of multisets scored.
+    '''
+    m = (3 * f) + 1
+    n = len(stewards)
+    data = (scenarios, liks, mttrs, faults, f)
+    scenario_range = range(len(liks))
+    sizes = [len(members) for members in classes]
+    rows = [[1 if x else 0 for x in faults[members[0]]] for members in classes]
+    class_mttrs = [mttrs[members[0]] for members in classes]
+    by_mttr = sorted(range(len(classes)), key=lambda k: class_mttrs[k])
+    # How many stewards there are in each class and the ones after it.
+    capacity = [sum(sizes[k:]) for k in range(len(classes) + 1)]
+    counts = [0] * len(classes)
+    multisets = BestN(lambda x: x[0], best.max)
+    scored = [0]
+    def walk(k, need, distances):
+        if not need:
+            ordered = []
+            for j in by_mttr:
+                ordered.extend([class_mttrs[j]] * counts[j])
+            # Whole numbers, so this is what summing in any other order would give.
+            mttr_sum = sum(ordered)
+            score = 0
+            for s in scenario_range:
+                failure_distance = distances[s]
+                if failure_distance < 0:
+                    importance = liks[s] * ordered[-(failure_distance + 1)]
+                else:
+                    importance = liks[s] * mttr_sum / m
+                score += importance * failure_distance
+            if histogram is not None:
+                repeats = 1
+                for size, count in zip(sizes, counts):
+                    repeats *= choose(size, count)
+                histogram.add(score, repeats)
+            cutoff = multisets.cutoff()
+            if cutoff is None or score >= cutoff:
+                combo = sorted([i for members, count in zip(classes, counts) for i in members[:count]])
+                multisets.keep_if_better((score, list(counts)), rank_combination(n, m, combo))
+            scored[0] += 1
+            return
+        if capacity[k] < need:
+            return
+        row = rows[k]
+        for count in range(min(sizes[k], need), -1, -1):
+            counts[k] = count
+            walk(k + 1, need - count, [d - count * x for d, x in zip(distances, row)] if count else distances)
+        counts[k] = 0
+    walk(0, m, [f] * len(liks))
+    for score, taken in multisets.items:
+        for combo in itertools.islice(expand_multiset(classes, taken, n), best.max):
+            cutoff = best.cutoff()
+            if cutoff is None or score >= cutoff:
+                best.keep_if_better(ComboAnalysis(combo, stewards, score, data), rank_combination(n, m, combo))
+    return scored[0]
+
+def expand_multiset(classes, taken, n):
+    '''
+    Yield the combinations that take taken[k] stewards from each class classes[k], in
+    lexicographic order.
+    '''
+    class_of = [None] * n
+    for k, members in enumerate(classes):
+        for i in members:
+            class_of[i] = k
+    remaining = list(taken)
+    def walk(start, need):
+        if not need:
+            yield ()
+            return
+        for i in range(start, n):
+            k = class_of[i]
+            if not remaining[k]:
+                continue
+            remaining[k] -= 1
+            # Only carry on if each class can still supply what's needed from after i.
+            if all([remaining[j] <= len(classes[j]) - bisect.bisect_right(classes[j], i) for j in range(len(classes))]):
+                for rest in walk(i + 1, need - 1):
+                    yield (i,) + rest
+            remaining[k] += 1
+    return walk(0, sum(taken))
+
+def analyze_in_parallel(engine, f, scenarios, liks, stewards, mttrs, faults, best, workers, start=0, stop=None,
+                        histogram=None):
+    '''
+    Split the combinations into contiguous ranges, analyze each range in a separate
+    process with its own BestN, and merge the results. Since BestN breaks ties by
+    position, the merged list is identical to the one a single process would produce.
+
+    Each worker is sent the steward data once, with the fault matrix packed into
+    per-scenario bitmasks; tasks are just ranges. Workers send back the scores, ranks
+    and steward indexes of their best combinations, and ComboAnalysis objects are only
+    rebuilt here for the ones that make the merged list. Histograms of each range's
+    scores are merged the same way.
+    '''
+    import multiprocessing
+    if stop is None:
+        stop = choose(len(stewards), (3 * f) + 1)
+    shard_count = max(min(stop - start, workers * shards_per_worker), 1)
+    bounds = [start + (stop - start) * i // shard_count for i in range(shard_count + 1)]
+    bins = histogram.max_bins if histogram is not None else None
+    tasks = [(engine, best.max, bounds[i], bounds[i + 1], bins) for i in range(shard_count)]
+    packed = (f, scenarios, liks, stewards, mttrs, fault_masks(faults, len(scenarios)))
+    total_stats = None
+    with multiprocessing.Pool(workers, initializer=start_worker, initargs=(packed,)) as pool:
+        for result in pool.imap_unordered(analyze_shard, tasks):
+            total_stats = merge_shard(result, best, histogram, total_stats, f, scenarios, liks, stewards, mttrs, faults)
+    return total_stats
+
+def merge_shard(result, best, histogram, total_stats, f, scenarios, liks, stewards, mttrs, faults):
+    '''
+    Merge what analyze_shard() sent back into best and histogram, and return
+    total_stats with the shard's stats added.
+    '''
+    ranked, stats, shard_histogram, seconds = result
+    if histogram is not None:
+        histogram.merge(shard_histogram)
+    combos = dict([(seq, combo) for seq, score, combo in ranked])
+    best.keep_many([score for seq, score, combo in ranked], [seq for seq, score, combo in ranked],
+                   lambda seq: combo_analysis(combos[seq], scenarios, liks, stewards, mttrs, faults, f))
+    if stats:
+        total_stats = [a + b for a, b in zip(total_stats or [0] * len(stats), stats)]
+    return total_stats
+
+def analyze_in_slices(engine, f, scenarios, liks, stewards, mttrs, faults, best, workers,
+                      checkpoint, checkpoint_every, resume, quiet, instruments, histogram=None, front=None):
+    '''
+    Analyze the combinations a slice of positions at a time. If there's a checkpoint
+    file, save how far we've got and the current "top N" list to it at most every
+    checkpoint_every seconds; with resume, pick up from it if it exists. Since BestN
+    breaks ties by position, a resumed run ends up with the same list as one that was
+    never interrupted. Between slices, instruments gets a chance to show progress.
+
+    With more than one worker, one pool of processes (sent the data once) serves the
+    whole run. A few slices are kept queued per worker, so workers never wait for each
+    other; results are merged in position order, so everything before the cursor is
+    done whenever it's saved.
+    '''
+    total = choose(len(stewards), (3 * f) + 1)
+    cursor = 0
+    stats = None
+    if checkpoint:
+        fingerprint = data_fingerprint(f, scenarios, liks, stewards, mttrs, faults)
+        if resume and os.path.exists(checkpoint):
+            cursor, stats = load_checkpoint(checkpoint, fingerprint, f, scenarios, liks, stewards, mttrs, faults, best)
+            if not quiet:
+                print('Resuming from combination %d in %s.' % (cursor, checkpoint))
+    else:
+        checkpoint_every = None
+    intervals = [x for x in [checkpoint_every, instruments and instruments.progress_every] if x]
+    first = cursor
+    slice_size = first_checkpoint_slice
+    run_started = last_save = time.time()
+    pool = None
+    if workers > 1:
+        import collections, multiprocessing
+        packed = (f, scenarios, liks, stewards, mttrs, fault_masks(faults, len(scenarios)))
+        pool = multiprocessing.Pool(workers, initializer=start_worker, initargs=(packed,))
+        bins = histogram.max_bins if histogram is not None else None
+        pending = collections.deque()
+        queued = cursor
+    try:
+        while cursor < total:
+            if pool:
+                while queued < total and len(pending) < workers * slices_queued_per_worker:
+                    stop = min(queued + slice_size, total)
+                    pending.append((stop, pool.apply_async(analyze_shard, ((engine, best.max, queued, stop, bins),))))
+                    queued = stop
+                stop, result = pending.popleft()
+                result = result.get()
+                # Time spent scoring, as the worker measured it, so queueing doesn't count.
+                seconds = result[3]
+                stats = merge_shard(result, best, histogram, stats, f, scenarios, liks, stewards, mttrs, faults)
+            else:
+                stop = min(cursor + slice_size, total)
+                started = time.time()
+                slice_stats = analyze_range(engine, f, scenarios, liks, stewards, mttrs, faults, best, cursor, stop,
+                                            histogram, front)
+                seconds = time.time() - started
+                if slice_stats:
+                    stats = [a + b for a, b in zip(stats or [0] * len(slice_stats), slice_stats)]
+            cursor = stop
+            # Grow slices until each takes at least an eighth of the shortest interval, so
+            # the per-slice overhead stays negligible but we never lose much work.
+            if seconds < min(intervals) / 8.0:
+                slice_size *= 2
+            if checkpoint and (cursor == total or time.time() - last_save >= checkpoint_every):
+                save_checkpoint(checkpoint, fingerprint, best, cursor, stats)
+                last_save = time.time()
+            if instruments:
+                instruments.progress(cursor, total, first, time.time() - run_started, cursor == total)
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+    return stats
+
+def data_fingerprint(f, scenarios, liks, stewards, mttrs, faults):
+    '''Return a hash that changes if anything the analysis depends on changes.'''
+    import hashlib
+    return hashlib.sha256(repr((f, scenarios, liks, stewards, mttrs, faults)).encode('utf-8')).hexdigest()
+
+def save_checkpoint(fname, fingerprint, best, cursor, stats):
+    '''
+    Save the position reached and the current "top N" list, as (position, score,
+    steward indexes) triples. The file is replaced atomically, so a run killed while
+    saving leaves the previous checkpoint intact.
+    '''
+    import json
+    state = {
+        'version': checkpoint_version,
+        'fingerprint': fingerprint,
+        'best': best.max,
+        'cursor': cursor,
+        'stats': stats,
+        'ranked': [[seq, ca.combined_score, list(ca.steward_indexes)] for seq, ca in best.ranked()],
+    }
+    tmp = fname + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, separators=(',', ':'))
+    os.replace(tmp, fname)
+
+def load_checkpoint(fname, fingerprint, f, scenarios, liks, stewards, mttrs, faults, best):
+    '''
+    Restore the "top N" list saved by save_checkpoint() into best, and return the
+    position to carry on from and the search stats so far.
+    '''
+    import json
+    with open(fname, 'r') as fp:
+        state = json.load(fp)
+    if state.get('version') != checkpoint_version:
+        raise Exception("Checkpoint %s was written by an incompatible version of this script." % fname)
+    if state['fingerprint'] != fingerprint:
+        raise Exception("Checkpoint %s was made from different data or a different f." % fname)
+    if state['best'] != best.max:
+        raise Exception("Checkpoint %s keeps the best %d combinations, not %d." % (fname, state['best'], best.max))
+    combos = dict([(seq, tuple(combo)) for seq, score, combo in state['ranked']])
+    best.keep_many([score for seq, score, combo in state['ranked']], [seq for seq, score, combo in state['ranked']],
+                   lambda seq: combo_analysis(combos[seq], scenarios, liks, stewards, mttrs, faults, f))
+    return state['cursor'], state['stats']
+
+# Steward data for the current worker process, as unpacked by start_worker().
+worker_data = None
+
+def start_worker(packed):
+    global worker_data
+    f, scenarios, liks, stewards, mttrs, masks = packed
+    worker_data = (f, scenarios, liks, stewards, mttrs, unpack_fault_masks(masks, len(stewards)))
+
+def analyze_shard(task):
+    engine, bestN, start, stop, bins = task
+    f, scenarios, liks, stewards, mttrs, faults = worker_data
+    started = time.time()
+    best = BestN(lambda x: x.combined_score, bestN)
+    histogram = ScoreHistogram(bins) if bins else None
+    stats = analyze_range(engine, f, scenarios, liks, stewards, mttrs, faults, best, start, stop, histogram)
+    return ([(seq, ca.combined_score, ca.steward_indexes) for seq, ca in best.ranked()], stats, histogram,
+            time.time() - started)
+
+def analyze_combo(combo, best, scenarios, liks, stewards, mttrs, faults, f, seq=None):
+    '''
+    Given a single combination (as steward indexes), evaluate its downtime across all
+    scenarios. If it has less downtime than one of the current "top N" combinations, put
+    this one into the "top N" list.
+    '''
+    best.keep_if_better(combo_analysis(combo, scenarios, liks, stewards, mttrs, faults, f), seq)
+
+def combo_analysis(combo, scenarios, liks, stewards, mttrs, faults, f):
+    return ComboAnalysis(combo, stewards, combo_score(combo, liks, mttrs, faults, f), (scenarios, liks, mttrs, faults, f))
+
+def combo_score(combo, liks, mttrs, faults, f):
+    '''
+    Return the combined_score of combo without building any ScenarioResult objects.
+    The arithmetic is the same as ScenarioResult's, in the same order, so the result
+    is identical to the last bit.
+    '''
+    relevant_mttrs = [mttrs[ci] for ci in combo]
+    member_faults = [faults[ci] for ci in combo]
+    m = len(relevant_mttrs)
+    mttr_sum = sum(relevant_mttrs)
+    ordered = None
+    total = 0
+    for s in range(len(liks)):
+        fault_count = 0
+        for row in member_faults:
+            if row[s]:
+                fault_count += 1
+        failure_distance = f - fault_count
+        if failure_distance < 0:
+            if ordered is None:
+                ordered = sorted(relevant_mttrs)
+            importance = liks[s] * ordered[-(failure_distance + 1)]
+        else:
+            importance = liks[s] * mttr_sum / m
+        total += importance * failure_distance
+    return total
+
+def combo_objectives(combo, liks, mttrs, faults, f):
+    '''
+    Return what ParetoFront compares combo on, from the same per-scenario numbers as
+    ScenarioResult: its expected downtime (the sum of likelihood * MTTR over the
+    scenarios that lose consensus), the worst MTTR of any scenario (0 if none loses
+    consensus), and the number of scenarios that lose consensus.
+    '''
+    relevant_mttrs = [mttrs[ci] for ci in combo]
+    member_faults = [faults[ci] for ci in combo]
+    ordered = sorted(relevant_mttrs)
+    downtime = 0
+    worst = 0
+    failures = 0
+    for s in range(len(liks)):
+        fault_count = 0
+        for row in member_faults:
+            if row[s]:
+                fault_count += 1
+        failure_distance = f - fault_count
+        if failure_distance < 0:
+            mttr = ordered[-(failure_distance + 1)]
+            downtime += liks[s] * mttr
+            if mttr > worst:
+                worst = mttr
+            failures += 1
+    return downtime, worst, failures
+
+def load_variants(fname, scenarios, liks, stewards, f):
+    '''
+    Read a JSON list of what-if variants of the data. Each is an object with any of:
+    "name"; "f" (defaults to f); "likelihoods", either a full list or an object mapping
+    scenario names to new likelihoods (numbers, or strings like "5%"); and "exclude",
+    a list of steward names to leave out. Returns a list of dicts with the name, f,
+    complete likelihood list and set of excluded steward indexes of each variant.
+    Errors name the variant by its number and the line of the file it starts on.
+    '''
+    import json
+    with open(fname, 'r') as fp:
+        text = fp.read()
+    specs = json.loads(text)
+    if type(specs) is not list:
+        raise Exception('%s should hold a list of variants.' % fname)
+    variants = []
+    for i, (spec, line) in enumerate(zip(specs, json_item_lines(text, specs))):
+        label = 'Variant %d (line %d)' % (i + 1, line)
+        if type(spec) is not dict:
+            raise Exception('%s should be an object.' % label)
+        variant_f = spec.get('f', f)
+        max_f = max_f_for_steward_count(len(stewards))
+        # bool is a subclass of int, but true isn't an f.
+        if type(variant_f) is not int or not 0 <= variant_f <= max_f:
+            raise Exception('%s: f must be a whole number from 0 to %d for %d stewards, not %s.' % (
+                label, max_f, len(stewards), json.dumps(variant_f)))
+        variant_liks = list(liks)
+        new_liks = spec.get('likelihoods', {})
+        if type(new_liks) is list:
+            if len(new_liks) != len(scenarios):
+                raise Exception('%s has %d likelihoods for %d scenarios.' % (label, len(new_liks), len(scenarios)))
+            new_liks = dict(zip(scenarios, new_liks))
+        for scenario, lik in new_liks.items():
+            if scenario not in scenarios:
+                raise Exception('%s sets the likelihood of unknown scenario "%s".' % (label, scenario))
+            variant_liks[scenarios.index(scenario)] = check_likelihood(lik, '%s: the likelihood of "%s"' % (label, scenario))
+        excluded = set()
+        for name in spec.get('exclude', []):
+            matches = [j for j in range(len(stewards)) if stewards[j] == name]
+            if not matches:
+                raise Exception('%s excludes unknown steward "%s".' % (label, name))
+            excluded.update(matches)
+        if (3 * variant_f) + 1 > len(stewards) - len(excluded):
+            raise Exception('%s needs %d stewards but only has %d.' % (label, (3 * variant_f) + 1, len(stewards) - len(excluded)))
+        name = spec.get('name') or 'variant %d' % (i + 1)
+        variants.append(dict(name=name, f=variant_f, liks=variant_liks, excluded=excluded))
+    return variants
+
+def json_item_lines(text, items):
+    '''
+    Return the line on which each of items, the decoded form of the JSON list in
+    text, starts. The text has already been decoded in full, so it's known to be valid.
+    '''
+    import json
+    decoder = json.JSONDecoder()
+    lines = []
+    position = text.index('[') + 1
+    for item in items:
+        while text[position] in ' \t\r\n,':
+            position += 1
+        lines.append(text.count('\n', 0, position) + 1)
+        position = decoder.raw_decode(text, position)[1]
+    return lines
+
+def analyze_variants(variants, scenarios, stewards, mttrs, faults, bestN, quiet=False, engine=python_engine):
+    '''
+    Analyze several what-if variants of the data (see load_variants()) together, and
+    return a "top N" list for each. Variants with the same f share one enumeration of
+    the combinations, and each combination's fault counts, MTTR sum and repair MTTRs
+    are worked out once and then weighted by each variant's likelihoods. Combinations
+    with an excluded steward are skipped for that variant. Scores and tie-breaks are
+    exactly what analyze() would give on the edited data, because positions among
+    the remaining combinations keep their order.
+    '''
+    if engine not in [python_engine, numpy_engine]:
+        raise Exception("What-if variants can only be analyzed with the %s or %s engine." % (python_engine, numpy_engine))
+    n = len(stewards)
+    bests = [BestN(lambda x: x.combined_score, bestN) for variant in variants]
+    for f in sorted(set([variant['f'] for variant in variants])):
+        group = [i for i in range(len(variants)) if variants[i]['f'] == f]
+        m = (3 * f) + 1
+        if not quiet:
+            print('Analyzing %d total %d-steward combinations (n=%d, f=%d) for %d variant(s).' % (choose(n, m), m, n, f, len(group)))
+        if engine == numpy_engine:
+            analyze_variants_numpy(f, [variants[i] for i in group], scenarios, stewards, mttrs, faults, [bests[i] for i in group])
+            continue
+        masks = [sum([1 << j for j in variants[i]['excluded']]) for i in group]
+        seq = 0
+        for combo in index_combinations(n, m):
+            combo_mask = 0
+            for ci in combo:
+                combo_mask |= 1 << ci
+            terms = None
+            for i, mask in zip(group, masks):
+                if combo_mask & mask:
+                    continue
+                if terms is None:
+                    terms = combo_terms(combo, mttrs, faults, f, len(scenarios))
+                variant_liks = variants[i]['liks']
+                score = score_terms(terms, variant_liks)
+                cutoff = bests[i].cutoff()
+                if cutoff is None or score >= cutoff:
+                    bests[i].keep_if_better(ComboAnalysis(combo, stewards, score, (scenarios, variant_liks, mttrs, faults, f)), seq)
+            seq += 1
+    return bests
+
+def analyze_variants_numpy(f, variants, scenarios, stewards, mttrs, faults, bests, block_size=numpy_block_size):
+    import numpy as np
+    m = (3 * f) + 1
+    n = len(stewards)
+    fault_matrix = (np.array(faults).reshape(n, len(scenarios)) != 0).T.astype(np.float32)
+    mttr_array = np.array(mttrs, dtype=np.float64)
+    lik_arrays = [np.array(variant['liks'], dtype=np.float64) for variant in variants]
+    excluded = []
+    for variant in variants:
+        excluded.append(np.zeros(n, dtype=bool))
+        excluded[-1][list(variant['excluded'])] = True
+    total = choose(n, m)
+    for block_start in range(0, total, block_size):
+        seqs = np.arange(block_start, min(block_start + block_size, total), dtype=np.int64)
+        block = unrank_combinations(np, n, m, seqs)
+        terms = block_terms_numpy(np, block, f, fault_matrix, mttr_array)
+        for variant, best, lik_array, left_out in zip(variants, bests, lik_arrays, excluded):
+            scores = score_terms_numpy(np, terms, m, lik_array)
+            make_item = lambda seq, liks=variant['liks']: combo_analysis(tuple(block[seq - block_start].tolist()), scenarios, liks, stewards, mttrs, faults, f)
+            if variant['excluded']:
+                allowed = ~left_out[block].any(axis=1)
+                keep_best_of_block(np, best, scores[allowed], seqs[allowed], make_item)
+            else:
+                keep_best_of_block(np, best, scores, seqs, make_item)
+
+def combo_terms(combo, mttrs, faults, f, scenario_count):
+    '''
+    Return the parts of combo_score()'s work that don't depend on likelihoods: for each
+    scenario, the failure distance and the MTTR it would take to repair (None if it
+    doesn't lose consensus); and the combination's MTTR sum and size.
+    '''
+    relevant_mttrs = [mttrs[ci] for ci in combo]
+    member_faults = [faults[ci] for ci in combo]
+    ordered = None
+    scenario_terms = []
+    for s in range(scenario_count):
+        fault_count = 0
+        for row in member_faults:
+            if row[s]:
+                fault_count += 1
+        failure_distance = f - fault_count
+        repair_mttr = None
+        if failure_distance < 0:
+            if ordered is None:
+                ordered = sorted(relevant_mttrs)
+            repair_mttr = ordered[-(failure_distance + 1)]
+        scenario_terms.append((failure_distance, repair_mttr))
+    return scenario_terms, sum(relevant_mttrs), len(relevant_mttrs)
+
+def score_terms(terms, liks):
+    '''Weight the output of combo_terms() by likelihood, exactly as combo_score() would.'''
+    scenario_terms, mttr_sum, m = terms
+    total = 0
+    for s in range(len(liks)):
+        failure_distance, repair_mttr = scenario_terms[s]
+        if repair_mttr is not None:
+            importance = liks[s] * repair_mttr
+        else:
+            importance = liks[s] * mttr_sum / m
+        total += importance * failure_distance
+    return total
+
+def score_distribution(f, liks, mttrs, faults, max_states=max_distribution_states):
+    '''
+    Count how many combinations get each combined score, without enumerating them.
+    A score isn't a sum of per-steward parts, but it only depends on the combination's
+    per-scenario fault counts, its MTTR sum and its m-f smallest MTTRs, and each of
+    those builds up one steward at a time. So walk the stewards in MTTR order, keeping
+    a count of the partial combinations that share each such summary (the terms of a
+    generating function), and score each complete summary once. Scenarios that fault
+    every steward or none, and duplicate scenarios, share a count. Returns {score:
+    number of combinations}, or None as soon as there are more summaries to track than
+    max_states or a small fraction of the number of combinations, i.e. the data is
+    too varied for this to beat enumerating. If MTTRs aren't whole numbers, their sums
+    depend on the order they're taken in, so the stewards are walked in the order
+    combo_score() sums them instead (which tracks more summaries); either way the
+    scores and counts are exactly what enumerating every combination would give.
+    '''
+    m = (3 * f) + 1
+    n = len(mttrs)
+    if m > n:
+        return {}
+    no_faults, all_faulted = -1, -2
+    columns = []
+    column_of = []
+    for s in range(len(liks)):
+        column = tuple([1 if row[s] else 0 for row in faults])
+        if not any(column):
+            column_of.append(no_faults)
+        elif all(column):
+            column_of.append(all_faulted)
+        else:
+            if column not in columns:
+                columns.append(column)
+            column_of.append(columns.index(column))
+    keep = m - f
+    limit = min(max_states, max(choose(n, m) // distribution_state_ratio, min_distribution_states))
+    states = {(0, (0,) * len(columns), (), 0): 1}
+    if can_collapse(mttrs):
+        # In MTTR order, the smallest MTTRs of most partial combinations are settled early.
+        order = sorted(range(n), key=lambda i: (mttrs[i], i))
+    else:
+        order = range(n)
+    for position in range(n):
+        i = order[position]
+        remaining = n - position - 1
+        row = [column[i] for column in columns]
+        next_states = {}
+        for state, count in states.items():
+            k, fault_counts, smallest, mttr_sum = state
+            if k + remaining >= m:
+                next_states[state] = next_states.get(state, 0) + count
+            if k < m:
+                # The keep smallest MTTRs so far, in order.
+                position = bisect.bisect_right(smallest, mttrs[i])
+                if position < keep:
+                    smallest = (smallest[:position] + (mttrs[i],) + smallest[position:])[:keep]
+                added = (k + 1, tuple([a + b for a, b in zip(fault_counts, row)]), smallest, mttr_sum + mttrs[i])
+                next_states[added] = next_states.get(added, 0) + count
+        if len(next_states) > limit:
+            return None
+        states = next_states
+    scores = {}
+    for (k, fault_counts, smallest, mttr_sum), count in states.items():
+        # Same arithmetic, in the same order, as combo_score().
+        total = 0
+        for s in range(len(liks)):
+            c = column_of[s]
+            fault_count = 0 if c == no_faults else m if c == all_faulted else fault_counts[c]
+            failure_distance = f - fault_count
+            if failure_distance < 0:
+                importance = liks[s] * smallest[-(failure_distance + 1)]
+            else:
+                importance = liks[s] * mttr_sum / m
+            total += importance * failure_distance
+        scores[total] = scores.get(total, 0) + count
+    return scores
+
+def analyze_approximately(f, scenarios, liks, stewards, mttrs, faults, bestN, seconds=None, evaluations=None,
+                          seed=None, quiet=False):
+    '''
+    Look for the best combinations when there are far too many to score them all,
+    within a budget of seconds and/or evaluations (distinct combinations scored).
+    The first part of the budget goes on stratified random sampling: the combinations
+    are split into equal runs of positions and one is drawn from each run. The rest
+    goes on local search: starting from each of the best combinations found so far,
+    keep making whichever single swap of a member for a non-member improves the score
+    most, until none does. When every combination in the list has been searched from,
+    sample some more and search from the best of the new sample. Returns the "top N"
+    list and a dict of coverage stats.
+
+    Only the most recently used approximate_cache_size scores are remembered, and a
+    combination that comes up again once its score is forgotten is scored (and
+    counted as an evaluation) again, so after that ("forgotten" in the stats),
+    "distinct" and "coverage" are upper bounds.
+    '''
+    m = (3 * f) + 1
+    n = len(stewards)
+    total = choose(n, m)
+    if not quiet:
+        print('Searching %d total %d-steward combinations (n=%d, f=%d) approximately.' % (total, m, n, f))
+    if seconds is None and evaluations is None:
+        evaluations = default_approximate_evaluations
+    import collections, random
+    rng = random.Random(seed)
+    best = BestN(lambda x: x.combined_score, bestN)
+    data = (scenarios, liks, mttrs, faults, f)
+    # The scores of the combinations we've evaluated, least recently used first.
+    scores = collections.OrderedDict()
+    # The (score, seq) of each combination that got into best and might still be
+    # there, and a heap of those not searched from yet, best first, so the next place
+    # to start a search is found without sorting best.
+    kept = {}
+    starts = []
+    searched = set()
+    stats = dict(combinations=total, evaluations=0, sampled=0, searches=0, swaps=0, local_optima=0, forgotten=0)
+    started = time.time()
+
+    def exhausted():
+        if len(scores) >= total:
+            return True
+        if evaluations is not None and stats['evaluations'] >= evaluations:
+            return True
+        return seconds is not None and time.time() - started >= seconds
+
+    def done_sampling():
+        if evaluations is not None and stats['evaluations'] >= evaluations * approximate_sample_share:
+            return True
+        return seconds is not None and time.time() - started >= seconds * approximate_sample_share
+
+    def evaluate(combo):
+        score = scores.get(combo)
+        if score is not None:
+            scores.move_to_end(combo)
+            return score
+        score = combo_score(combo, liks, mttrs, faults, f)
+        scores[combo] = score
+        if len(scores) > approximate_cache_size:
+            scores.popitem(last=False)
+            stats['forgotten'] += 1
+        stats['evaluations'] += 1
+        cutoff = best.cutoff()
+        # A forgotten combination that's still in best mustn't be added twice.
+        if (cutoff is None or score >= cutoff) and combo not in kept:
+            seq = rank_combination(n, m, combo)
+            best.keep_if_better(ComboAnalysis(combo, stewards, score, data), seq)
+            if best.holds(score, seq):
+                kept[combo] = (score, seq)
+                heapq.heappush(starts, (-score, seq, combo))
+                if len(kept) > 2 * bestN:
+                    for dropped in [c for c in kept if not best.holds(*kept[c])]:
+                        del kept[dropped]
+                    starts[:] = [entry for entry in starts if entry[2] in kept]
+                    heapq.heapify(starts)
+        return score
+
+    def next_start():
+        # The best combination in best that hasn't been searched from, if any.
+        while starts:
+            score, seq, combo = heapq.heappop(starts)
+            if combo not in searched and best.holds(-score, seq):
+                return combo
+        return None
+
+    def sample(enough):
+        # Returns the best new combination drawn.
+        strata = min(total, approximate_strata)
+        top = None
+        for i in range(strata):
+            if enough():
+                break
+            combo = tuple(unrank_combination(n, m, rng.randrange((total * i) // strata, (total * (i + 1)) // strata)))
+            if combo not in scores:
+                score = evaluate(combo)
+                stats['sampled'] += 1
+                if top is None or score > top[0]:
+                    top = (score, combo)
+        return top and top[1]
+
+    def climb(combo):
+        stats['searches'] += 1
+        current = evaluate(combo)
+        while True:
+            searched.add(combo)
+            outsiders = [i for i in range(n) if i not in combo]
+            move = None
+            for j in range(m):
+                rest = combo[:j] + combo[j + 1:]
+                for i in outsiders:
+                    if exhausted():
+                        return
+                    candidate = tuple(sorted(rest + (i,)))
+                    score = evaluate(candidate)
+                    if score > current:
+                        move, current = candidate, score
+            if move is None:
+                stats['local_optima'] += 1
+                return
+            combo = move
+            stats['swaps'] += 1
+
+    if m <= n:
+        while not done_sampling() and not exhausted():
+            sample(lambda: done_sampling() or exhausted())
+        while not exhausted():
+            start = next_start() or sample(exhausted)
+            if start:
+                climb(start)
+    stats['distinct'] = min(stats['evaluations'], total)
+    stats['coverage'] = float(stats['distinct']) / total if total else 1.0
+    stats['seconds'] = time.time() - started
+    if not quiet:
+        print('Scored %d combinations (%.3g%% of them) in %.1f seconds: %d by stratified sampling, the rest '
+              'in %d local searches that made %d improving swaps and reached %d local optima.' % (
+              stats['distinct'], 100.0 * stats['coverage'], stats['seconds'], stats['sampled'],
+              stats['searches'], stats['swaps'], stats['local_optima']))
+    return best, stats
+
+def analyze_numpy(f, scenarios, liks, stewards, mttrs, faults, best, start=0, stop=None, block_size=numpy_block_size,
+                  histogram=None, front=None):
+    '''
+    Does the same job as calling analyze_combo() on every combination, but scores whole
+    blocks of combinations at once with NumPy. Only the combinations in a block that
+    could make it into the "top N" list, or onto the front, are turned into
+    ComboAnalysis objects.
+    '''
+    import numpy as np
+    m = (3 * f) + 1
+    n = len(stewards)
+    # Scenario-major layout, so that each scenario's numbers for a block are contiguous.
+    fault_matrix = (np.array(faults).reshape(n, len(scenarios)) != 0).T.astype(np.float32)
+    mttr_array = np.array(mttrs, dtype=np.float64)
+    lik_array = np.array(liks, dtype=np.float64)
+    if stop is None:
+        stop = choose(n, m)
+    for block_start in range(start, stop, block_size):
+        block = unrank_combinations(np, n, m, np.arange(block_start, min(block_start + block_size, stop), dtype=np.int64))
+        terms = block_terms_numpy(np, block, f, fault_matrix, mttr_array)
+        scores = score_terms_numpy(np, terms, m, lik_array)
+        if histogram is not None:
+            histogram.add_many(np, scores)
+        if front is not None:
+            make_item = lambda seq: ComboAnalysis(tuple(block[seq - block_start].tolist()), stewards,
+                                                  scores[seq - block_start].item(), (scenarios, liks, mttrs, faults, f))
+            downtimes, worsts, counts = objectives_numpy(np, terms, lik_array)
+            for seq, objectives in enumerate(zip(downtimes.tolist(), worsts.tolist(), counts.tolist()), block_start):
+                front.offer(objectives, seq, make_item=make_item)
+        keep_best_of_block(np, best, scores, block_start + np.arange(len(scores)),
+                           lambda seq: combo_analysis(tuple(block[seq - block_start].tolist()), scenarios, liks, stewards, mttrs, faults, f))
+
+def keep_best_of_block(np, best, scores, seqs, make_item):
+    '''
+    Offer a NumPy block of scores, with their sequence numbers, to best. Only the ones
+    that could make the list are turned into items.
+    '''
+    # Anything below the best_N-th score of its own block can't make the list.
+    candidates = np.arange(len(scores))
+    if len(scores) > best.max:
+        kth = len(scores) - best.max
+        candidates = np.flatnonzero(scores >= np.partition(scores, kth)[kth])
+    cutoff = best.cutoff()
+    if cutoff is not None:
+        candidates = candidates[scores[candidates] >= cutoff]
+    best.keep_many(scores[candidates].tolist(), seqs[candidates].tolist(), make_item)
+
+def analyze_branch_and_bound(f, scenarios, liks, stewards, mttrs, faults, best, start=0, stop=None):
+    '''
+    Walk the same prefix tree that unique_combinations() does, but skip any subtree
+    whose most optimistic score can't get into the "top N" list. Only positions
+    start..stop-1 are considered. Returns (prefixes visited, subtrees pruned,
+    combinations pruned).
+
+    The bound for a prefix is a sum of per-scenario bounds. In each scenario, the
+    completion faults at least as many nodes as it must (when there aren't enough
+    unfaulted stewards left to fill it); if that still leaves consensus intact, no
+    completion can beat the biggest possible average MTTR times the biggest possible
+    failure distance. Otherwise every completion loses consensus, and the k-th
+    smallest MTTR of the combination is at least the k-th smallest of the prefix plus
+    all the stewards that could still be added.
+    '''
+    m = (3 * f) + 1
+    n = len(stewards)
+    if stop is None:
+        stop = choose(n, m)
+    # Per-suffix summaries of the stewards at index i and above.
+    unfaulted_from = [[0] * len(scenarios)]
+    ascending_from = [[]]
+    biggest_sums_from = [[0]]
+    for i in reversed(range(n)):
+        unfaulted_from.insert(0, [u + (0 if x else 1) for u, x in zip(unfaulted_from[0], faults[i])])
+        ascending_from.insert(0, sorted(mttrs[i:]))
+        biggest_sums_from.insert(0, [0] + list(itertools.accumulate(sorted(mttrs[i:], reverse=True))))
+    max_kth = m - f - 1
+    sizes = [[choose(a, b) for b in range(m + 1)] for a in range(n + 1)]
+    fault_counts = [0] * len(scenarios)
+    prefix = []
+    stats = [0, 0, 0]
+
+    def bound(prefix_mttrs, prefix_sum, first, remaining):
+        unfaulted = unfaulted_from[first]
+        biggest_average = (prefix_sum + biggest_sums_from[first][remaining]) / m
+        smallest = sorted(prefix_mttrs + ascending_from[first][:max_kth + 1])
+        total = 0
+        for s in range(len(scenarios)):
+            failure_distance = f - fault_counts[s]
+            if remaining > unfaulted[s]:
+                failure_distance -= remaining - unfaulted[s]
+            if failure_distance >= 0:
+                total += liks[s] * biggest_average * failure_distance
+            else:
+                total += liks[s] * smallest[-failure_distance - 1] * failure_distance
+        return total
+
+    def add(i, delta):
+        for s in range(len(scenarios)):
+            if faults[i][s]:
+                fault_counts[s] += delta
+
+    def visit(first, remaining, rank, prefix_sum):
+        # rank is the position of the first combination under this prefix.
+        stats[0] += 1
+        children = []
+        for i in range(first, n - remaining + 1):
+            size = sizes[n - i - 1][remaining - 1]
+            if rank + size > start and rank < stop:
+                children.append((i, rank, size))
+            rank += size
+        # Visit the most promising children first, so the cutoff rises quickly. Ranks
+        # go with them, so BestN still breaks ties as if we'd gone in order. For a
+        # complete combination, bounding against an empty suffix gives its score.
+        bounded = []
+        prefix_mttrs = [mttrs[ci] for ci in prefix]
+        for i, rank, size in children:
+            add(i, 1)
+            first = i + 1 if remaining > 1 else n
+            bounded.append((bound(prefix_mttrs + [mttrs[i]], prefix_sum + mttrs[i], first, remaining - 1), i, rank, size))
+            add(i, -1)
+        bounded.sort(key=lambda x: -x[0])
+        for optimistic, i, rank, size in bounded:
+            cutoff = best.cutoff()
+            if cutoff is not None and optimistic < cutoff - bound_tolerance * max(1, abs(cutoff)):
+                stats[1] += 1
+                stats[2] += size
+                continue
+            prefix.append(i)
+            if remaining == 1:
+                combo = tuple(prefix)
+                best.keep_if_better(combo_analysis(combo, scenarios, liks, stewards, mttrs, faults, f), rank)
+            else:
+                add(i, 1)
+                visit(i + 1, remaining - 1, rank, prefix_sum + mttrs[i])
+                add(i, -1)
+            prefix.pop()
+
+    if m <= n:
+        visit(0, m, 0, 0)
+    return tuple(stats)
+
+def fault_masks(faults, scenario_count):
+    '''
+    Pack the fault matrix into one integer per scenario, with bit i set if steward i
+    faults in that scenario. The number of faulted members of a combination is then
+    just the popcount of the combination's own mask ANDed with the scenario's.
+    '''
+    masks = [0] * scenario_count
+    for i in range(len(faults)):
+        for s in range(scenario_count):
+            if faults[i][s]:
+                masks[s] |= 1 << i
+    return masks
+
+def unpack_fault_masks(masks, n):
+    return [[(mask >> i) & 1 for mask in masks] for i in range(n)]
+
+def mttr_ranking(mttrs):
+    '''
+    Return steward indexes sorted by MTTR, and each steward's position in that order.
+    Setting bit ranks[i] for each member gives a mask whose k-th lowest set bit is the
+    combination's k-th smallest MTTR, without any sorting.
+    '''
+    order = sorted(range(len(mttrs)), key=lambda i: (mttrs[i], i))
+    ranks = [0] * len(mttrs)
+    for rank in range(len(order)):
+        ranks[order[rank]] = rank
+    return order, ranks
+
+def analyze_bitmasks(f, scenarios, liks, stewards, mttrs, masks, best, start=0, stop=None, histogram=None):
+    '''
+    Does the same job as calling analyze_combo() on every combination in start..stop-1,
+    scoring with score_with_masks(). Only combinations that could make it into the
+    "top N" list are turned into ComboAnalysis objects.
+    '''
+    order, ranks = mttr_ranking(mttrs)
+    faults = None
+    seq = start
+    for combo in index_combinations(len(stewards), (3 * f) + 1, start, stop):
+        score = score_with_masks(f, liks, mttrs, masks, order, ranks, combo)
+        if histogram is not None:
+            histogram.add(score)
+        cutoff = best.cutoff()
+        if cutoff is None or score >= cutoff:
+            if faults is None:
+                faults = unpack_fault_masks(masks, len(stewards))
+            best.keep_if_better(combo_analysis(combo, scenarios, liks, stewards, mttrs, faults, f), seq)
+        seq += 1
+
+def score_with_masks(f, liks, mttrs, masks, order, ranks, combo):
+    '''
+    Return the combined_score of combo (a sorted tuple of steward indexes), computed
+    from fault_masks() and mttr_ranking() with the same arithmetic as ScenarioResult.
+    '''
+    m = len(combo)
+    combo_mask = 0
+    rank_mask = 0
+    mttr_sum = 0
+    for i in combo:
+        combo_mask |= 1 << i
+        rank_mask |= 1 << ranks[i]
+        mttr_sum += mttrs[i]
+    smallest = None
+    score = 0
+    for s in range(len(liks)):
+        failure_distance = f - (combo_mask & masks[s]).bit_count()
+        if failure_distance < 0:
+            if smallest is None:
+                # Members' MTTRs, smallest first, as far as a failed scenario can reach.
+                smallest = []
+                bits = rank_mask
+                for k in range(m - f):
+                    low = bits & -bits
+                    smallest.append(mttrs[order[low.bit_length() - 1]])
+                    bits ^= low
+            importance = liks[s] * smallest[-(failure_distance + 1)]
+        else:
+            importance = liks[s] * mttr_sum / m
+        score += importance * failure_distance
+    return score
+
+def analyze_incremental(f, scenarios, liks, stewards, mttrs, faults, best, histogram=None):
+    '''
+    Does the same job as calling analyze_combo() on every combination, but visits them
+    in revolving-door order. Only combinations that could make it into the "top N" list
+    are turned into ComboAnalysis objects; their lexicographic rank is used to break
+    ties, as the other engines do.
+    '''
+    m = (3 * f) + 1
+    for members, score in revolving_door_scores(f, liks, mttrs, faults, len(stewards)):
+        if histogram is not None:
+            histogram.add(score)
+        cutoff = best.cutoff()
+        if cutoff is None or score >= cutoff:
+            combo = tuple(members)
+            best.keep_if_better(combo_analysis(combo, scenarios, liks, stewards, mttrs, faults, f), rank_combination(len(stewards), m, combo))
+
+def revolving_door_scores(f, liks, mttrs, faults, n):
+    '''
+    Yield (members, combined_score) for every combination of n stewards, in
+    revolving-door order. Consecutive combinations differ by one swap, so instead of
+    recomputing everything, we move one steward out of and one into the per-scenario
+    fault counts and the sorted MTTRs: O(scenarios + m) per combination rather than
+    O(scenarios * m). members is a sorted list of indexes that is updated in place.
+    '''
+    m = (3 * f) + 1
+    if m > n:
+        return
+    members = list(range(m))
+    ordered_mttrs = sorted([mttrs[i] for i in members])
+    faulted = [[1 if x else 0 for x in row] for row in faults]
+    fault_counts = [sum([faulted[i][s] for i in members]) for s in range(len(liks))]
+    swaps = revolving_door_swaps(n, m)
+    while True:
+        # Same arithmetic, in the same order, as ScenarioResult and ComboAnalysis.
+        mttr_sum = sum([mttrs[i] for i in members])
+        score = 0
+        for s in range(len(liks)):
+            failure_distance = f - fault_counts[s]
+            if failure_distance < 0:
+                importance = liks[s] * ordered_mttrs[-(failure_distance + 1)]
+            else:
+                importance = liks[s] * mttr_sum / m
+            score += importance * failure_distance
+        yield members, score
+        swap = next(swaps, None)
+        if swap is None:
+            return
+        removed, added = swap
+        members.remove(removed)
+        bisect.insort(members, added)
+        ordered_mttrs.remove(mttrs[removed])
+        bisect.insort(ordered_mttrs, mttrs[added])
+        for s in range(len(liks)):
+            fault_counts[s] += faulted[added][s] - faulted[removed][s]
+
+def revolving_door_swaps(n, m):
+    '''
+    Walk the combinations of range(n) in revolving-door order (Knuth's Algorithm R,
+    TAOCP 7.2.1.3), starting from range(m). Yields one (removed, added) pair per step.
+    '''
+    if m == 0 or m >= n:
+        return
+    if m == 1:
+        for i in range(1, n):
+            yield i - 1, i
+        return
+    # c[1..m] is the combination, with a sentinel in c[m + 1].
+    c = [None] + list(range(m)) + [n]
+    while True:
+        j = 2
+        if m % 2:
+            if c[1] + 1 < c[2]:
+                c[1] += 1
+                yield c[1] - 1, c[1]
+                continue
+            decrease = True
+        else:
+            if c[1] > 0:
+                c[1] -= 1
+                yield c[1] + 1, c[1]
+                continue
+            decrease = False
+        while True:
+            if decrease:
+                # Try to decrease c[j]; here c[j] == c[j - 1] + 1.
+                if c[j] >= j:
+                    removed = c[j]
+                    c[j] = c[j - 1]
+                    c[j - 1] = j - 2
+                    yield removed, j - 2
+                    break
+                j += 1
+            if j > m:
+                return
+            # Try to increase c[j]; here c[j - 1] == j - 2.
+            if c[j] + 1 < c[j + 1]:
+                removed = c[j - 1]
+                c[j - 1] = c[j]
+                c[j] += 1
+                yield removed, c[j]
+                break
+            j += 1
+            if j > m:
+                return
+            decrease = True
+
+def score_block_numpy(np, block, f, fault_matrix, mttr_array, lik_array):
+    '''
+    Return the combined_score of each row of steward indexes in block. fault_matrix is
+    scenarios x stewards. The arithmetic is done in the same order as ScenarioResult
+    does it, so scores match exactly.
+    '''
+    return score_terms_numpy(np, block_terms_numpy(np, block, f, fault_matrix, mttr_array), block.shape[1], lik_array)
+
+def block_terms_numpy(np, block, f, fault_matrix, mttr_array):
+    '''
+    Return the parts of score_block_numpy()'s work that don't depend on likelihoods:
+    the failure distance of each combination in each scenario, each combination's MTTR
+    sum, and the MTTR each scenario would take to repair if it lost consensus.
+    '''
+    rows, m = block.shape
+    n = len(mttr_array)
+    membership = np.zeros((rows, n), dtype=np.float32)
+    membership.ravel()[(np.arange(rows) * n)[:, None] + block] = 1
+    failure_distances = f - (fault_matrix @ membership.T).astype(np.intp)
+    member_mttrs = mttr_array[block.T]
+    mttr_sums = member_mttrs[0].copy()
+    for j in range(1, m):
+        mttr_sums += member_mttrs[j]
+    # A scenario that faults k more nodes than we can tolerate takes the k-th smallest
+    # MTTR in the combination. m is small, so a full sort of each combination's MTTRs
+    # is cheaper than np.partition() with a list of kth values.
+    ordered_mttrs = np.sort(member_mttrs, axis=0)
+    kth = np.maximum(-failure_distances - 1, 0)
+    kth *= rows
+    kth += np.arange(rows)
+    return failure_distances, mttr_sums, ordered_mttrs.ravel()[kth]
+
+def objectives_numpy(np, terms, lik_array):
+    '''
+    Return combo_objectives() for each combination in the output of block_terms_numpy(),
+    as three arrays. Downtime is summed scenario by scenario, as in combo_objectives().
+    '''
+    failure_distances, mttr_sums, repair_mttrs = terms
+    failed = failure_distances < 0
+    repairs = np.where(failed, repair_mttrs, 0)
+    downtimes = repairs * lik_array[:, None]
+    downtime = downtimes[0].copy()
+    for s in range(1, len(downtimes)):
+        downtime += downtimes[s]
+    return downtime, repairs.max(axis=0), failed.sum(axis=0)
+
+def score_terms_numpy(np, terms, m, lik_array):
+    '''Weight the output of block_terms_numpy() by likelihood to give combined scores.'''
+    failure_distances, mttr_sums, repair_mttrs = terms
+    likelihoods = lik_array[:, None]
+    uptime_importance = likelihoods * mttr_sums
+    uptime_importance /= m
+    downtime_importance = repair_mttrs * likelihoods
+    scores = np.where(failure_distances < 0, downtime_importance, uptime_importance)
+    scores *= failure_distances
+    # Sum scenario by scenario rather than with scores.sum(), which adds in a different
+    # order and can disagree with ComboAnalysis in the last bit.
+    combined_scores = scores[0].copy()
+    for s in range(1, len(scores)):
+        combined_scores += scores[s]
+    return combined_scores
+
+def unrank_combinations(np, n, m, ranks):
+    '''
+    Return the combinations of range(n) with the given positions in the order that
+    unique_combinations() produces them, one row per rank. Uses the combinatorial
+    number system: the combination at position r is the complement of the one whose
+    descending digits x_1 > x_2 > ... encode C(n, m) - 1 - r as sum(C(x_j, m - j + 1)).
+    '''
+    remainders = choose(n, m) - 1 - ranks
+    combos = np.empty((len(ranks), m), dtype=np.intp)
+    for j in range(m):
+        binomials = np.array([choose(x, m - j) for x in range(n)], dtype=np.int64)
+        digits = np.searchsorted(binomials, remainders, side='right') - 1
+        remainders = remainders - binomials[digits]
+        combos[:, j] = n - 1 - digits
+    return combos
+
+def unrank_combination(n, m, rank):
+    '''Pure-Python counterpart of unrank_combinations(), for a single rank.'''
+    remainder = choose(n, m) - 1 - rank
+    combo = []
+    for j in range(m):
+        digit = m - j - 1
+        while choose(digit + 1, m - j) <= remainder:
+            digit += 1
+        remainder -= choose(digit, m - j)
+        combo.append(n - 1 - digit)
+    return combo
+
+def rank_combination(n, m, combo):
+    '''Inverse of unrank_combination(): the position of combo (sorted indexes).'''
+    rank = choose(n, m) - 1
+    for j in range(m):
+        rank -= choose(n - 1 - combo[j], m - j)
+    return rank
+
+def index_combinations(n, m, start=0, stop=None):
+    '''
+    Yield tuples of indexes into a list of n items, in the same order as
+    unique_combinations() would yield the items themselves, from position start up to
+    (but not including) position stop.
+    '''
+    if stop is None:
+        stop = choose(n, m)
+    if start >= stop:
+        return
+    if start == 0:
+        # itertools reuses its result tuple whenever the caller has let go of it.
+        yield from itertools.islice(itertools.combinations(range(n), m), stop)
+        return
+    combo = unrank_combination(n, m, start)
+    for _ in range(stop - start):
+        yield tuple(combo)
+        # Step to the next combination in lexicographic order.
+        i = m - 1
+        while i >= 0 and combo[i] == n - m + i:
+            i -= 1
+        if i < 0:
+            return
+        combo[i] += 1
+        for j in range(i + 1, m):
+            combo[j] = combo[j - 1] + 1
 
 def unique_combinations(items, n):
-    if n == 0:
-        yield []
+    for indexes in index_combinations(len(items), n):
+        yield [items[i] for i in indexes]
+
+export_magic = b'STEWSCOR'
+export_version = 1
+# Magic, version, steward count, m, f, scenario count, combination count, bytes per
+# steward index, length of the names.
+export_header = '<8sIIIiIQII'
+default_export_chunk = 65536
+
+def export_scores(fname, f, scenarios, liks, stewards, mttrs, faults, engine=python_engine,
+                  chunk_size=default_export_chunk, instruments=None):
+    '''
+    Score every combination and write it to fname in a columnar form that
+    load_export() can memory-map. After a header and the data as JSON come three
+    columns, one row per combination, in the order unique_combinations() produces them
+    in (so a row's position is its rank):
+
+    - the combination's steward indexes, as unsigned 8- or 16-bit integers;
+    - its combined_score, as a little-endian double;
+    - its failure_distance in each scenario, as signed bytes.
+
+    Each column starts on an 8-byte boundary. Combinations are scored and written
+    chunk_size at a time, straight to their place in each column, so memory use
+    doesn't grow with the number of combinations. Like checkpoints, the file is
+    replaced atomically. Returns the number of combinations written.
+    '''
+    import json, struct
+    m = (3 * f) + 1
+    n = len(stewards)
+    total = choose(n, m)
+    if engine not in [python_engine, numpy_engine]:
+        raise Exception("Exporting scores needs the %s or %s engine." % (python_engine, numpy_engine))
+    if chunk_size < 1:
+        raise Exception("Can't export scores %d combinations at a time." % chunk_size)
+    if n > 65536 or m - f > 128:
+        raise Exception("Too many stewards to export; steward indexes and failure distances wouldn't fit.")
+    index_size = 1 if n <= 256 else 2
+    names = json.dumps([scenarios, liks, stewards, mttrs]).encode('utf-8')
+    combos_at = export_align(struct.calcsize(export_header) + len(names))
+    scores_at = export_align(combos_at + total * m * index_size)
+    distances_at = scores_at + total * 8
+    if engine == numpy_engine:
+        chunks = export_chunks_numpy(f, mttrs, faults, liks, index_size, chunk_size)
     else:
-        for i in range(len(items)):
-            for cc in unique_combinations(items[i + 1:], n - 1):
-                yield [items[i]] + cc
+        chunks = export_chunks_python(f, mttrs, faults, liks, index_size, chunk_size)
+    tmp = fname + '.tmp'
+    started = time.time()
+    with open(tmp, 'wb') as fp:
+        fp.write(struct.pack(export_header, export_magic, export_version, n, m, f, len(scenarios), total, index_size,
+                             len(names)))
+        fp.write(names)
+        fp.truncate(distances_at + total * len(scenarios))
+        done = 0
+        for combos, scores, distances in chunks:
+            rows = len(scores)
+            for at, column in [(combos_at + done * m * index_size, combos), (scores_at + done * 8, scores),
+                               (distances_at + done * len(scenarios), distances)]:
+                fp.seek(at)
+                fp.write(column)
+            done += rows
+            if instruments:
+                instruments.progress(done, total, 0, time.time() - started, done == total)
+    os.replace(tmp, fname)
+    return total
+
+def export_align(offset):
+    return (offset + 7) // 8 * 8
+
+def export_chunks_python(f, mttrs, faults, liks, index_size, chunk_size):
+    '''
+    Yield export_scores()'s columns for chunk_size combinations at a time, as arrays,
+    scoring them the way analyze_by_prefix() does.
+    '''
+    from array import array
+    m = (3 * f) + 1
+    n = len(mttrs)
+    scenario_range = range(len(liks))
+    rows = [[1 if x else 0 for x in row] for row in faults]
+    combos, scores, distances = array('BH'[index_size - 1]), array('d'), array('b')
+    def take(count):
+        chunk = (combos[:count * m], scores[:count], distances[:count * len(liks)])
+        del combos[:count * m], scores[:count], distances[:count * len(liks)]
+        if sys.byteorder != 'little':
+            for column in chunk:
+                column.byteswap()
+        return chunk
+    for prefix in index_combinations(n - 1, m - 1):
+        prefix_mttrs = [mttrs[ci] for ci in prefix]
+        prefix_distances = [f - sum([rows[ci][s] for ci in prefix]) for s in scenario_range]
+        lasts = range(prefix[-1] + 1 if prefix else 0, n)
+        scores.extend(score_run(m, liks, mttrs, rows, sorted(prefix_mttrs), sum(prefix_mttrs), prefix_distances, lasts))
+        for last in lasts:
+            combos.extend(prefix)
+            combos.append(last)
+            distances.extend([d - x for d, x in zip(prefix_distances, rows[last])])
+        while len(scores) >= chunk_size:
+            yield take(chunk_size)
+    if scores:
+        yield take(len(scores))
+
+def export_chunks_numpy(f, mttrs, faults, liks, index_size, chunk_size):
+    '''Like export_chunks_python(), but scoring each chunk as a block with NumPy.'''
+    import numpy as np
+    m = (3 * f) + 1
+    n = len(mttrs)
+    fault_matrix = (np.array(faults).reshape(n, len(liks)) != 0).T.astype(np.float32)
+    mttr_array = np.array(mttrs, dtype=np.float64)
+    lik_array = np.array(liks, dtype=np.float64)
+    total = choose(n, m)
+    for start in range(0, total, chunk_size):
+        block = unrank_combinations(np, n, m, np.arange(start, min(start + chunk_size, total), dtype=np.int64))
+        terms = block_terms_numpy(np, block, f, fault_matrix, mttr_array)
+        scores = score_terms_numpy(np, terms, m, lik_array)
+        yield (block.astype('<u%d' % index_size), scores.astype('<f8'),
+               np.ascontiguousarray(terms[0].T, dtype=np.int8))
+
+def load_export(fname):
+    '''
+    Memory-map a file written by export_scores(). Returns an Export: a dict of what it
+    was made from (f, m, scenarios, liks, stewards, mttrs) and its columns as
+    memoryviews over the file: combos (combinations x m), scores, and
+    failure_distances (combinations x scenarios). np.asarray() turns any of them into
+    an array without copying, for filtering and sorting. The Export owns the mapping;
+    close it, or use it in a with statement, when done.
+    '''
+    import json, mmap, struct
+    header_size = struct.calcsize(export_header)
+    with open(fname, 'rb') as fp:
+        # Check the header before mapping, which fails on an empty file.
+        header = fp.read(header_size)
+        if len(header) < header_size or not header.startswith(export_magic):
+            raise Exception('%s is not an export of scores.' % fname)
+        magic, version, n, m, f, scenario_count, total, index_size, names_size = struct.unpack(export_header, header)
+        if version != export_version:
+            raise Exception('%s is an export of scores in version %d, which this version can\'t read.' % (fname, version))
+        combos_at = export_align(header_size + names_size)
+        scores_at = export_align(combos_at + total * m * index_size)
+        distances_at = scores_at + total * 8
+        if os.fstat(fp.fileno()).st_size != distances_at + total * scenario_count:
+            raise Exception('%s is truncated.' % fname)
+        if sys.byteorder != 'little':
+            raise Exception('Exports are little-endian; this machine is not.')
+        scenarios, liks, stewards, mttrs = json.loads(fp.read(names_size).decode('utf-8'))
+        mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    return Export(mapped, view, {
+        'f': f, 'm': m, 'scenarios': scenarios, 'liks': liks, 'stewards': stewards, 'mttrs': mttrs,
+        'combos': view[combos_at:combos_at + total * m * index_size].cast('BH'[index_size - 1], [total, m]),
+        'scores': view[scores_at:distances_at].cast('d'),
+        'failure_distances': view[distances_at:].cast('b', [total, scenario_count]),
+    })
+
+class Export(dict):
+    '''
+    What load_export() returns: a dict that also holds the memory map its columns are
+    views of. close() (or leaving a with block) releases the columns and unmaps the
+    file; it raises BufferError while arrays made from the columns are still alive.
+    '''
+    def __init__(self, mapped, view, fields):
+        dict.__init__(self, fields)
+        self._mapped = mapped
+        self._view = view
+    def close(self):
+        for column in ('combos', 'scores', 'failure_distances'):
+            self[column].release()
+        self._view.release()
+        self._mapped.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+
+default_simulated_years = 10000
+simulated_years_per_batch = 2000
+# MTTRs are taken to be in hours unless told otherwise.
+hours_per_year = 365.25 * 24
+# For 95% confidence intervals.
+confidence_z = 1.959963984540054
+# The most numbers to work with at once when sweeping clusters of close events.
+max_sweep_elements = 1 << 22
+
+def simulate_downtime(combos, liks, mttrs, faults, f, years=default_simulated_years, seed=None,
+                      year_length=hours_per_year):
+    '''
+    Check the score's rough approximation of downtime against a Monte Carlo
+    simulation. Each scenario happens as a Poisson process at its likelihood per
+    year, at a uniformly random time; each member of a combination that faults in it
+    is down from then until its MTTR has passed (year_length is a year in the same
+    units as MTTRs). Consensus is lost while more than f members are down at once.
+    Every combination in combos (lists of steward indexes) lives through the same
+    simulated years, so differences between them aren't noise in the events.
+
+    Returns the mean time per year without consensus for each combination, and the
+    half-width of a 95% confidence interval around it, as two lists.
+
+    Most events end before the next begins. Then a combination is out for the
+    (f+1)-th longest MTTR among its members that fault, if more than f do, which is
+    worked out once per combination and scenario; a year's downtime is a matrix
+    product of event counts with those. Events closer together than the longest
+    MTTR are swept exactly, all combinations and clusters of the same size at once.
+    '''
+    import numpy as np
+    if [x for x in liks if x < 0]:
+        raise Exception("Likelihoods can't be negative.")
+    if years < 2:
+        raise Exception('Simulate at least 2 years, to have a confidence interval.')
+    rng = np.random.default_rng(seed)
+    member_mttrs = np.array(mttrs, dtype=np.float64)[np.array(combos, dtype=np.intp)]
+    member_faults = (np.array(faults) != 0)[np.array(combos, dtype=np.intp)]
+    k, m = member_mttrs.shape
+    # Combinations x scenarios x members: the MTTR of each member that faults, else 0.
+    repairs = np.where(member_faults.transpose(0, 2, 1), member_mttrs[:, None, :], 0)
+    outages = np.sort(repairs, axis=2)[:, :, m - 1 - f]
+    longest = member_mttrs.max()
+    lik_array = np.array(liks, dtype=np.float64)
+    totals = np.zeros(k)
+    squares = np.zeros(k)
+    for batch_start in range(0, years, simulated_years_per_batch):
+        batch = min(simulated_years_per_batch, years - batch_start)
+        counts = rng.poisson(lik_array, (batch, len(liks)))
+        event_years = np.repeat(np.arange(batch).repeat(len(liks)), counts.ravel())
+        event_scenarios = np.repeat(np.tile(np.arange(len(liks)), batch), counts.ravel())
+        event_times = rng.uniform(0, year_length, len(event_years))
+        order = np.lexsort((event_times, event_years))
+        event_years, event_scenarios, event_times = event_years[order], event_scenarios[order], event_times[order]
+        # An event that starts before the one before it could be over joins its cluster.
+        close = (np.diff(event_years) == 0) & (np.diff(event_times) < longest)
+        clustered = np.zeros(len(event_years), dtype=bool)
+        clustered[1:] |= close
+        clustered[:-1] |= close
+        np.subtract.at(counts, (event_years[clustered], event_scenarios[clustered]), 1)
+        downtime = counts @ outages.T
+        # Clusters start where an event isn't close to the one before, and end where
+        # it isn't close to the one after.
+        starts = np.flatnonzero(clustered & ~np.concatenate(([False], close)))
+        stops = np.flatnonzero(clustered & ~np.concatenate((close, [False]))) + 1
+        sizes = stops - starts
+        for size in np.unique(sizes).tolist():
+            # Clusters of the same size are swept together, a bounded number at a time.
+            group = starts[sizes == size]
+            step = max(1, max_sweep_elements // (k * m * size))
+            for i in range(0, len(group), step):
+                events = group[i:i + step, None] + np.arange(size)
+                times = event_times[events] - event_times[events[:, :1]]
+                np.add.at(downtime, event_years[events[:, 0]],
+                          sweep_clusters(np, times, member_faults[:, :, event_scenarios[events]], member_mttrs, f))
+        totals += downtime.sum(axis=0)
+        squares += (downtime * downtime).sum(axis=0)
+    means = totals / years
+    variances = np.maximum(squares - totals * means, 0) / (years - 1)
+    return means.tolist(), (confidence_z * np.sqrt(variances / years)).tolist()
+
+def sweep_clusters(np, times, member_faults, member_mttrs, f):
+    '''
+    Return how long each combination is without consensus through each of a number
+    of clusters of events, as clusters x combinations. times is clusters x events;
+    member_faults says which members of each combination fault in each event
+    (combinations x members x clusters x events), and member_mttrs is combinations x
+    members. Between one event and the next, every member that is down has been down
+    since before it, and stays down until its last fault plus its MTTR, so consensus
+    is lost from the event until the (f+1)-th longest of those runs out.
+    '''
+    m = member_mttrs.shape[1]
+    last_faults = np.maximum.accumulate(np.where(member_faults, times, -np.inf), axis=3)
+    gaps = np.diff(times, axis=1, append=np.inf)
+    down = np.clip(last_faults + member_mttrs[:, :, None, None] - times, 0, gaps)
+    return np.sort(down, axis=1)[:, m - 1 - f].sum(axis=2).T
+
+def report_simulation(best, means, errors, years):
+    title = 'Simulated Time Without Consensus, per Year, over %d Years' % years
+    print('\n' + title)
+    print('-' * len(title))
+    ranks = sorted(range(len(means)), key=lambda i: (means[i], i))
+    simulated_rank = [0] * len(means)
+    for rank, i in enumerate(ranks):
+        simulated_rank[i] = rank + 1
+    for i, combo in enumerate(best.items):
+        print('%d: %s: %.4g +/- %.2g (#%d simulated)' % (i + 1, '+'.join(combo.combo), means[i], errors[i], simulated_rank[i]))
+    if len(means) > 1:
+        n = len(means)
+        # Spearman's rank correlation between the score's order and the simulation's.
+        d2 = sum([(i + 1 - rank) ** 2 for i, rank in enumerate(simulated_rank)])
+        print('Rank correlation between scores and simulated downtime: %.3f' % (1 - 6.0 * d2 / (n * (n * n - 1))))
 
-def report(best, f):
+def report(best, f, label=None):
     m = (3 * f) + 1
     title = '%d Best %d-Steward Combinations, Ranked' % (len(best.items), m)
+    if label:
+        title += ' (%s)' % label
     print('\n' + title)
     print('-' * len(title))
     for i in range(len(best.items)):
         combo = best.items[i]
         print('%d: %s' % (i + 1, combo))
 
-def select(fname, suggested_f, bestN):
-    f, scenarios, liks, stewards, mttrs, faults = load_data(fname, suggested_f)
-    best = analyze(f, scenarios, liks, stewards, mttrs, faults, bestN)
-    report(best, f)
+def report_distribution(histogram, best):
+    summary = histogram.summary()
+    if summary['exact']:
+        how = 'exact'
+    else:
+        how = 'in bins of %g' % summary['bin_width']
+    print('\nScore distribution over %d combinations (%s):' % (summary['combinations'], how))
+    print('  min %s, max %s, mean %s' % (summary['min'], summary['max'], summary['mean']))
+    for p in distribution_percentiles:
+        print('  %s: %s' % ('median' if p == 50 else '%d%%' % p, summary['percentiles'][p]))
+    if best.items:
+        median = summary['percentiles'][50]
+        worst = best.items[-1].combined_score
+        print('The top %d are %s to %s above the median, and score better than %.4f%% of combinations.' % (
+            len(best.items), worst - median, best.items[0].combined_score - median,
+            100.0 * histogram.fraction_below(worst)))
+
+def report_front(front, f):
+    m = (3 * f) + 1
+    title = 'Pareto Front: %d %d-Steward Combinations' % (len(front), m)
+    print('\n' + title)
+    print('-' * len(title))
+    print('No other combination is as good on expected downtime, worst-case MTTR and scenarios that lose consensus, '
+          'and better on one of them.')
+    for i, (objectives, seq, combo) in enumerate(front.ranked()):
+        print('%d: %s: expected downtime %s, worst-case MTTR %s, loses consensus in %d scenarios' % (
+            (i + 1, '+'.join(combo.combo)) + objectives))
+
+class Selection:
+    '''
+    What select_stewards() found: the f and m it used, how many combinations there
+    were, and the best of them as ComboAnalysis objects, best first. as_dict() gives
+    the same as plain lists and dicts, ready for JSON.'''
+    __slots__ = ('f', 'm', 'combinations', 'best')
+    def __init__(self, f, m, combinations, best):
+        self.f = f
+        self.m = m
+        self.combinations = combinations
+        self.best = best
+    def as_dict(self, details=False):
+        '''
+        With details, each combination also lists its result in every scenario:
+        fault count, failure distance, MTTR, importance and score.'''
+        best = []
+        for combo in self.best:
+            item = {'stewards': combo.combo, 'steward_indexes': list(combo.steward_indexes),
+                    'score': combo.combined_score}
+            if details:
+                item['scenarios'] = [{'name': r.name, 'fault_count': r.fault_count, 'failure_distance': r.failure_distance,
+                                      'mttr': r.mttr, 'importance': r.importance, 'score': r.score}
+                                     for r in combo.results]
+            best.append(item)
+        return {'f': self.f, 'm': self.m, 'combinations': self.combinations, 'best': best}
+
+def select_stewards(scenarios, liks, stewards, mttrs, faults, f=max_f_for_steward_list, bestN=default_best_N,
+                    engine=python_engine, workers=1, instruments=None, constraints=None, merge_scenarios=False):
+    '''
+    Find the best combinations of stewards in data that's already in memory, without
+    printing anything. The arguments are as load_data() returns them, except that they
+    can be any sequences (tuples, NumPy arrays...) and f is as for --f: by default, the
+    most that the number of stewards allows. constraints is an optional Constraints.
+    With merge_scenarios, scenarios with the same fault column are scored as one (see
+    distinct_scenarios()). Returns a Selection.'''
+    scenarios, liks, stewards, mttrs, faults = check_data(scenarios, liks, stewards, mttrs, faults)
+    f = resolve_f(f, len(stewards))
+    best = analyze(f, scenarios, liks, stewards, mttrs, faults, bestN, quiet=True, engine=engine, workers=workers,
+                   instruments=instruments, constraints=constraints, merge_scenarios=merge_scenarios)
+    return Selection(f, (3 * f) + 1, choose(len(stewards), (3 * f) + 1), best.items)
+
+def check_data(scenarios, liks, stewards, mttrs, faults):
+    '''
+    Turn in-memory data into the lists that load_data() would have returned, raising
+    an Exception if its parts don't fit together.'''
+    scenarios = list(scenarios)
+    liks = [float(x) for x in liks]
+    stewards = list(stewards)
+    mttrs = [float(x) for x in mttrs]
+    faults = [[int(x) for x in row] for row in faults]
+    if len(liks) != len(scenarios):
+        raise Exception('There are %d scenarios but %d likelihoods.' % (len(scenarios), len(liks)))
+    if len(mttrs) != len(stewards) or len(faults) != len(stewards):
+        raise Exception('There are %d stewards but %d MTTRs and %d rows of faults.' % (len(stewards), len(mttrs), len(faults)))
+    for name, row in zip(stewards, faults):
+        check_faults(name, row, len(scenarios))
+    if len(set(stewards)) != len(stewards):
+        raise Exception('Steward names must be unique.')
+    return scenarios, liks, stewards, mttrs, faults
+
+def check_mttr(name, mttr):
+    try:
+        return float(mttr)
+    except (TypeError, ValueError):
+        raise Exception('The MTTR of steward "%s" must be a number, not %r.' % (name, mttr))
+
+def check_likelihood(lik, what):
+    '''
+    Return lik, a number or a string like "5%", as a float. Anything else (including
+    true, null and lists from JSON), or a negative or NaN likelihood, raises an
+    Exception starting with what.'''
+    if isinstance(lik, (int, float, str)) and not isinstance(lik, bool):
+        try:
+            value = convert_float(lik)
+        except ValueError:
+            value = None
+        # NaN isn't >= 0 either.
+        if value is not None and value >= 0:
+            return value
+    raise Exception('%s must be a non-negative number or percentage, not %r.' % (what, lik))
+
+def check_faults(name, row, scenario_count):
+    if len(row) != scenario_count:
+        raise Exception('Steward "%s" has %d fault values; expected one per scenario (%d).' % (name, len(row), scenario_count))
+    if [x for x in row if x not in (0, 1)]:
+        raise Exception('fault values for steward "%s" must be 0 or 1.' % name)
+
+# WarmSelection won't keep the scores of more combinations than this in memory.
+max_warm_combinations = 5000000
 
-class Tests(unittest.TestCase):
-
-    def test_ScenarioResult(self):
-        stewards = 'A,B,C,D,E,F'.split(',')
-        scenarios = 'a,b,c'.split(',')
-        liks = [.5, .4, .3]
-        mttrs = [6,7,8,9,10,11]
-        combo_indexes = [0,2,3,4]
-        faults = [[0,1,1],[1,0,0],[0,0,0],[1,1,1],[0,1,0],[1,0,1]]
-        sr = ScenarioResult('b', scenarios, liks, faults, combo_indexes, 1, mttrs)
-        self.assertEquals(sr.name, 'b')
-        self.assertEquals(sr.idx, 1)
-        self.assertAlmostEquals(sr.likelihood, .4)
-        self.assertEquals(sr.mttr, 8)
-        self.assertAlmostEquals(sr.score, -6.4)
-
-    def test_analyze(self):
-        stewards = 'A,B,C,D,E,F'.split(',')
-        scenarios = 'a,b,c'.split(',')
-        liks = [.5, .4, .3]
-        mttrs = [6,7,8,9,10,11]
-        faults = [[0,1,1],[1,0,0],[0,0,0],[1,1,1],[0,1,0],[1,0,1]]
-        best = analyze(1,scenarios,liks,stewards,mttrs,faults,3, quiet=True)
-        self.assertTrue(best.items[0].combined_score > best.items[1].combined_score)
-        self.assertTrue(best.items[1].combined_score > best.items[2].combined_score)
-
-    def test_unique_combinations(self):
-        fruit = 'apple,banana,orange,pear'.split(',')
-        combos = '\n'.join(sorted(['+'.join(x) for x in unique_combinations(fruit, 2)]))
-        self.assertEquals(combos, 'apple+banana\napple+orange\napple+pear\nbanana+orange\nbanana+pear\norange+pear')
-
-    def test_is_empty_row(self):
-        self.assertTrue(is_empty_row((None,None,None)))
-        self.assertTrue(is_empty_row(('','','')))
-        self.assertFalse(is_empty_row((1,'',None)))
-
-    def test_convert_float(self):
-        self.assertAlmostEquals(convert_float('1'), 1.0)
-        self.assertAlmostEquals(convert_float(1), 1.0)
-        self.assertAlmostEquals(convert_float('0.01'), 0.01)
-        self.assertAlmostEquals(convert_float('10%'), 0.1)
-
-    def test_factorial(self):
-        self.assertEquals(factorial(1), 1)
-        self.assertEquals(factorial(2), 2)
-        self.assertEquals(factorial(3), 6)
-        self.assertEquals(factorial(4), 24)
-
-    def test_has_string(self):
-        self.assertTrue(has_string(' abc '))
-        self.assertTrue(has_string('X'))
-        self.assertFalse(has_string(' 123'))
-
-    def test_has_num(self):
-        self.assertFalse(has_num(' abc '))
-        self.assertFalse(has_num('X'))
-        self.assertTrue(has_num(' 123'))
-        self.assertTrue(has_num('-2'))
-        self.assertTrue(has_num('1%'))
-
-    def test_is_steward_row(self):
-        self.assertTrue(is_steward_row(('x', '25', 1, '0', '0', '1')))
-        self.assertFalse(is_steward_row(('x', '25', 5, '0', '0', '1')))
-        self.assertFalse(is_steward_row(('x', '25', '1', '0', '0.1', '1')))
-
-    def test_max_f_for_steward_count(self):
-        self.assertEquals(max_f_for_steward_count(0), 0)
-        self.assertEquals(max_f_for_steward_count(3), 0)
-        self.assertEquals(max_f_for_steward_count(4), 1)
-        self.assertEquals(max_f_for_steward_count(5), 1)
-        self.assertEquals(max_f_for_steward_count(7), 2)
-
-    def test_parse_headers(self):
-        rows = [x.split(',') for x in ''',,scheduled maintenance coincidence,botched upgrade,foo
-likelihood per year (from MTBF),,1%,85%,17%
-Steward,MTTR,fault?,fault?,fault?
-Bank A,5,1,1,0
-Tech Firm B,13,1,0,1'''.replace('\r', '').split('\n')]
-        f, scenarios, liks, row_idx = parse_headers(rows)
-        self.assertEquals(row_idx, 3)
-        self.assertEquals(liks, [0.01,0.85,0.17])
-        self.assertEquals(f, 0)
-
-    def test_load_data_good(self):
-        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
-        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, f_from_data_file)
-        self.assertEquals(f, 1)
-        self.assertEquals(scenarios[0], 'scheduled maintenance coincidence')
-        self.assertEquals(scenarios[11], 'major natural disaster, US East Coast')
-        self.assertEquals(liks, [0.01, 0.85, 0.0001, 0.05, 0.01, 0.8, 0.03, 0.5, 0.02, 0.03, 0.1, 0.0001])
-        self.assertEquals(stewards, ['Bank A', 'Tech Firm B', 'University C', 'Law Firm D', 'NGO E', 'Government F', 'Consortium G', 'Tech Firm H', 'Biotech Firm J'])
-        self.assertEquals(mttrs, [5.0, 13.0, 11.0, 6.0, 6.0, 9.0, 12.0, 8.0, 7.0])
-        self.assertEquals(faults[0], [1, 1, 0, 0, 0, 1, 0, 1, 1, 0, 1, 0])
-        self.assertEquals(faults[8], [1, 1, 0, 0, 0, 1, 0, 1, 0, 0, 1, 0])
-
-    def test_not_enough_stewards(self):
-        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
-        self.assertRaises(Exception, load_data, fname, 5)
-
-    def test_BestN(self):
-        # Keep a list of the 3 best integers. Always give it back in sorted form.
-        b = BestN(lambda x: x, 3)
-        def try_this(*args):
-            b = BestN(lambda x: x, 3)
-            for arg in args:
-                b.keep_if_better(arg)
-            return b
-        b = try_this(3,10,4,11,9)
-        self.assertEquals(b.items, [11,10,9])
-        self.assertEquals(b.worst_idx, 2)
-        self.assertEquals(b.worst_score, 9)
-        b = try_this(-10,-9,-3.14,4.0,-1)
-        self.assertEquals(b.items, [4,-1,-3.14])
+class WarmSelection:
+    '''
+    Keep data and the score of every combination in memory, so that when the data
+    changes a step at a time, the "top N" list can be brought up to date by rescoring
+    only the combinations the change affects:
+
+    - a steward's MTTR or faults change: the combinations that include it;
+    - a steward is added: the new combinations, which all include it;
+    - a steward is removed: nothing; its combinations are just dropped;
+    - a scenario is added: each score gains one term, since scores are summed
+      scenario by scenario;
+    - a likelihood changes: everything (each score is a sum in scenario order, so a
+      changed term can't be swapped out without changing the last bits).
+
+    Scores live in blocks, each an array of the scores of the combinations of some
+    stewards, in the order unique_combinations() produces them: first all the
+    combinations of the starting stewards, then, for each steward added since, the
+    combinations of it with the stewards there were when it was added. Stewards are
+    identified by ids that only ever increase, so a combination's ids sort the same
+    way as its indexes would in a fresh load_data() of the current data, and ties are
+    broken just as analyze() breaks them. Results are identical to analyzing the
+    current data from scratch.
+
+    Everything is rescored from scratch if a change alters f (when f follows the
+    number of stewards), or removed stewards leave more dead scores than live ones.
+    '''
+    def __init__(self, scenarios, liks, stewards, mttrs, faults, f=max_f_for_steward_list, bestN=default_best_N,
+                 engine=python_engine, max_combinations=max_warm_combinations):
+        scenarios, liks, stewards, mttrs, faults = check_data(scenarios, liks, stewards, mttrs, faults)
+        if engine not in [python_engine, numpy_engine]:
+            raise Exception('Scores can only be kept warm with the %s or %s engine.' % (python_engine, numpy_engine))
+        self.scenarios = scenarios
+        self.liks = liks
+        self.requested_f = f
+        self.bestN = bestN
+        self.engine = engine
+        self.max_combinations = max_combinations
+        # Steward id -> [name, mttr, faults]; ids of the current stewards, in order.
+        self.rows = {}
+        self.ids = []
+        for row in zip(stewards, mttrs, faults):
+            self.rows[len(self.ids)] = list(row)
+            self.ids.append(len(self.ids))
+        self.next_id = len(self.ids)
+        self.rescore()
+    def data(self):
+        '''Return the current data, as load_data() would.'''
+        return (self.f, self.scenarios, self.liks, [self.rows[i][0] for i in self.ids],
+                [self.rows[i][1] for i in self.ids], [self.rows[i][2] for i in self.ids])
+    def selection(self):
+        '''Return the current "top N" list, as a Selection.'''
+        f, scenarios, liks, stewards, mttrs, faults = data = self.data()
+        position = dict([(sid, i) for i, sid in enumerate(self.ids)])
+        candidates = []
+        for universe, required, scores in self.blocks:
+            for rank in self.best_ranks(scores):
+                if scores[rank] != dead_score:
+                    candidates.append((scores[rank], self.block_combo(universe, required, rank)))
+        candidates.sort(key=lambda item: (-item[0], item[1]))
+        best = [ComboAnalysis(tuple([position[sid] for sid in combo]), stewards, score, (scenarios, liks, mttrs, faults, f))
+                for score, combo in candidates[:self.bestN]]
+        return Selection(f, self.m, choose(len(self.ids), self.m), best)
+    def best_ranks(self, scores):
+        '''Return the positions of the best bestN scores in an array, lowest first among equals.'''
+        if self.engine != numpy_engine or len(scores) <= self.bestN:
+            # nlargest() keeps the first of equal scores.
+            return heapq.nlargest(self.bestN, range(len(scores)), key=scores.__getitem__)
+        import numpy as np
+        view = np.frombuffer(scores, dtype=np.float64)
+        cutoff = np.partition(view, len(view) - self.bestN)[len(view) - self.bestN]
+        ranks = np.flatnonzero(view >= cutoff)
+        return ranks[np.lexsort((ranks, -view[ranks]))][:self.bestN].tolist()
+    def block_combo(self, universe, required, rank):
+        k = self.m if required is None else self.m - 1
+        combo = tuple([universe[i] for i in unrank_combination(len(universe), k, rank)])
+        return combo if required is None else combo + (required,)
+    def rescore(self):
+        '''Score every combination from scratch. Returns how many there are.'''
+        n = len(self.ids)
+        self.f = resolve_f(self.requested_f, n)
+        self.m = (3 * self.f) + 1
+        total = choose(n, self.m)
+        if total > self.max_combinations:
+            raise Exception('%d combinations are too many to keep scores for (the limit is %d).' % (total, self.max_combinations))
+        self.blocks = [(tuple(self.ids), None, self.score_block(tuple(self.ids), None))]
+        self.dead = 0
+        return total
+    def score_block(self, universe, required, liks=None, faults=None):
+        '''
+        Return an array of the scores of a block's combinations. With liks and faults,
+        score against those scenarios instead of the current ones.'''
+        from array import array
+        scores = array('d')
+        for ranks, combos in self.block_combos(universe, required):
+            values = self.score_combos(combos, liks, faults)
+            if self.engine == numpy_engine:
+                scores.frombytes(values.tobytes())
+            else:
+                scores.extend(values)
+        return scores
+    def block_combos(self, universe, required, sid=None):
+        '''
+        Yield the combinations of a block in chunks, as (ranks, combos) pairs: ranks are
+        their positions in the block's scores, and combos hold their members' current
+        indexes, as NumPy arrays for the numpy engine and lists otherwise. With sid,
+        only yield the live combinations that include that steward. Stewards who have
+        been removed stand in as steward 0, since their combinations' scores are dead.'''
+        position = dict([(sid, i) for i, sid in enumerate(self.ids)])
+        members = [position.get(x, 0) for x in universe]
+        tail = () if required is None else (position[required],)
+        k = self.m - len(tail)
+        fixed = ()
+        pool = list(range(len(universe)))
+        if sid is not None:
+            if sid != required:
+                fixed = (universe.index(sid),)
+            pool = [i for i in pool if universe[i] in position and universe[i] != sid]
+        j = k - len(fixed)
+        total = choose(len(pool), j)
+        if self.engine == numpy_engine:
+            import numpy as np
+            pool_array = np.array(pool, dtype=np.intp)
+            member_array = np.array(members, dtype=np.intp)
+            # The binomials that rank_combination() would subtract for each column.
+            binomials = [np.array([choose(len(universe) - 1 - x, k - c) for x in range(len(universe))], dtype=np.int64)
+                         for c in range(k)]
+            for block_start in range(0, total, numpy_block_size):
+                ranks = np.arange(block_start, min(block_start + numpy_block_size, total), dtype=np.int64)
+                local = pool_array[unrank_combinations(np, len(pool), j, ranks)]
+                if sid is not None:
+                    if fixed:
+                        local = np.sort(np.hstack([local, np.full((len(ranks), 1), fixed[0], dtype=np.intp)]), axis=1)
+                    ranks = choose(len(universe), k) - 1 - sum([binomials[c][local[:, c]] for c in range(k)])
+                combos = member_array[local]
+                if tail:
+                    combos = np.hstack([combos, np.full((len(ranks), 1), tail[0], dtype=np.intp)])
+                yield ranks, combos
+            return
+        chunk = itertools.combinations(pool, j)
+        for block_start in range(0, total, numpy_block_size):
+            locals_ = [tuple(sorted(sub + fixed)) for sub in itertools.islice(chunk, numpy_block_size)]
+            if sid is None:
+                ranks = range(block_start, block_start + len(locals_))
+            else:
+                ranks = [rank_combination(len(universe), k, local) for local in locals_]
+            yield ranks, [tuple([members[i] for i in local]) + tail for local in locals_]
+    def score_combos(self, combos, liks=None, faults=None):
+        '''Score a chunk of combinations from block_combos().'''
+        f, scenarios, current_liks, stewards, mttrs, current_faults = self.data()
+        if liks is None:
+            liks, faults = current_liks, current_faults
+        if self.engine == numpy_engine:
+            import numpy as np
+            fault_matrix = (np.array(faults).reshape(len(stewards), len(liks)) != 0).T.astype(np.float32)
+            terms = block_terms_numpy(np, combos, f, fault_matrix, np.array(mttrs, dtype=np.float64))
+            return score_terms_numpy(np, terms, self.m, np.array(liks, dtype=np.float64))
+        return [combo_score(combo, liks, mttrs, faults, f) for combo in combos]
+    def set_scores(self, scores, ranks, values):
+        if self.engine == numpy_engine:
+            import numpy as np
+            np.frombuffer(scores, dtype=np.float64)[ranks] = values
+        else:
+            for rank, value in zip(ranks, values):
+                scores[rank] = value
+    def affected(self, sid):
+        '''Yield (scores, ranks, combos) chunks for the live combinations that include steward sid.'''
+        for universe, required, scores in self.blocks:
+            if sid == required or sid in universe:
+                for ranks, combos in self.block_combos(universe, required, sid):
+                    yield scores, ranks, combos
+    def restructure(self, n, change):
+        '''
+        Make a change that leaves n stewards. If that changes f, rescore everything
+        and return the count; otherwise return None, and the caller rescores what it
+        must. Nothing is changed if the new steward list can't be analyzed.'''
+        f = resolve_f(self.requested_f, n)
+        total = choose(n, (3 * f) + 1)
+        if total > self.max_combinations:
+            raise Exception('%d combinations are too many to keep scores for (the limit is %d).' % (total, self.max_combinations))
+        change()
+        if f != self.f:
+            return self.rescore()
+        return None
+    def steward_id(self, name):
+        for sid in self.ids:
+            if self.rows[sid][0] == name:
+                return sid
+        raise Exception('No steward named "%s".' % name)
+    def scenario_index(self, name):
+        if name not in self.scenarios:
+            raise Exception('No scenario named "%s".' % name)
+        return self.scenarios.index(name)
+    def update_steward(self, name, mttr=None, faults=None):
+        '''Change a steward's MTTR and/or faults. Returns how many combinations were rescored.'''
+        sid = self.steward_id(name)
+        row = self.rows[sid]
+        # Check everything before changing anything, so a bad request leaves the data
+        # and the scores as they were.
+        if faults is not None:
+            faults = [int(x) for x in faults]
+            check_faults(name, faults, len(self.scenarios))
+        if mttr is not None:
+            mttr = check_mttr(name, mttr)
+        if faults is not None:
+            row[2] = faults
+        if mttr is not None:
+            row[1] = mttr
+        count = 0
+        for scores, ranks, combos in self.affected(sid):
+            self.set_scores(scores, ranks, self.score_combos(combos))
+            count += len(ranks)
+        return count
+    def add_steward(self, name, mttr, faults):
+        '''Add a steward after the others. Returns how many combinations were scored.'''
+        if name in [self.rows[sid][0] for sid in self.ids]:
+            raise Exception('There is already a steward named "%s".' % name)
+        faults = [int(x) for x in faults]
+        check_faults(name, faults, len(self.scenarios))
+        mttr = check_mttr(name, mttr)
+        sid = self.next_id
+        universe = tuple(self.ids)
+        def change():
+            self.next_id += 1
+            self.rows[sid] = [name, mttr, faults]
+            self.ids.append(sid)
+        count = self.restructure(len(self.ids) + 1, change)
+        if count is None:
+            scores = self.score_block(universe, sid)
+            self.blocks.append((universe, sid, scores))
+            count = len(scores)
+        return count
+    def remove_steward(self, name):
+        '''Remove a steward. Returns how many combinations were rescored.'''
+        sid = self.steward_id(name)
+        # The block of combinations that sid was added with goes altogether.
+        dropped = [(scores, ranks) for universe, required, scores in self.blocks if sid in universe
+                   for ranks, combos in self.block_combos(universe, required, sid)]
+        def change():
+            self.ids.remove(sid)
+            del self.rows[sid]
+        count = self.restructure(len(self.ids) - 1, change)
+        if count is None:
+            count = 0
+            for scores, ranks in dropped:
+                self.set_scores(scores, ranks, [dead_score] * len(ranks))
+                self.dead += len(ranks)
+            self.blocks = [block for block in self.blocks if block[1] != sid]
+            if self.dead > choose(len(self.ids), self.m):
+                count = self.rescore()
+        return count
+    def add_scenario(self, name, likelihood, faults):
+        '''
+        Add a scenario after the others. faults is a list with a value for each
+        steward, or a dict mapping steward names to values (missing ones are 0).
+        Returns how many combinations were rescored.'''
+        if name in self.scenarios:
+            raise Exception('There is already a scenario named "%s".' % name)
+        names = [self.rows[sid][0] for sid in self.ids]
+        if isinstance(faults, dict):
+            for steward in faults:
+                self.steward_id(steward)
+            faults = [faults.get(steward, 0) for steward in names]
+        column = [int(x) for x in faults]
+        if len(column) != len(self.ids) or [x for x in column if x not in (0, 1)]:
+            raise Exception('Scenario "%s" needs a fault value of 0 or 1 for each of the %d stewards.' % (name, len(self.ids)))
+        likelihood = check_likelihood(likelihood, 'The likelihood of scenario "%s"' % name)
+        count = 0
+        for universe, required, scores in self.blocks:
+            # Scores are summed scenario by scenario, so adding the new scenario's term
+            # to the old total gives exactly what scoring from scratch would.
+            terms = self.score_block(universe, required, [likelihood], [[x] for x in column])
+            if self.engine == numpy_engine:
+                import numpy as np
+                np.frombuffer(scores, dtype=np.float64)[:] += np.frombuffer(terms, dtype=np.float64)
+            else:
+                for rank in range(len(scores)):
+                    scores[rank] += terms[rank]
+            count += len(scores)
+        for sid, fault in zip(self.ids, column):
+            self.rows[sid][2].append(fault)
+        self.scenarios.append(name)
+        self.liks.append(likelihood)
+        return count - self.dead
+    def set_likelihood(self, name, likelihood):
+        '''Change a scenario's likelihood. Returns how many combinations were rescored.'''
+        index = self.scenario_index(name)
+        self.liks[index] = check_likelihood(likelihood, 'The likelihood of scenario "%s"' % name)
+        return self.rescore()
+    def handle(self, request):
+        '''
+        Carry out a request (a dict) from serve(), and return a response to send back:
+        {"op": "top"} just gets the current list; the other ops are "update_steward"
+        (with "steward" and "mttr" and/or "faults"), "add_steward" ("steward", "mttr",
+        "faults"), "remove_steward" ("steward"), "add_scenario" ("scenario",
+        "likelihood", "faults") and "set_likelihood" ("scenario", "likelihood").'''
+        started = time.time()
+        def field(name):
+            if name not in request:
+                raise Exception('Missing %r.' % name)
+            return request[name]
+        try:
+            op = request.get('op')
+            if op == 'top':
+                rescored = 0
+            elif op == 'update_steward':
+                rescored = self.update_steward(field('steward'), request.get('mttr'), request.get('faults'))
+            elif op == 'add_steward':
+                rescored = self.add_steward(field('steward'), field('mttr'), field('faults'))
+            elif op == 'remove_steward':
+                rescored = self.remove_steward(field('steward'))
+            elif op == 'add_scenario':
+                rescored = self.add_scenario(field('scenario'), field('likelihood'), request.get('faults', {}))
+            elif op == 'set_likelihood':
+                rescored = self.set_likelihood(field('scenario'), field('likelihood'))
+            else:
+                raise Exception('Unknown op %r.' % op)
+            response = self.selection().as_dict()
+        except Exception as e:
+            return {'ok': False, 'error': str(e)}
+        response.update({'ok': True, 'rescored': rescored, 'seconds': time.time() - started})
+        return response
+
+# Marks the score of a combination that includes a steward who's been removed.
+dead_score = float('-inf')
+
+def serve(state, socket_path=None):
+    '''
+    Answer requests to a WarmSelection, one JSON object per line, with one JSON
+    response per line: on stdin and stdout, or from any number of clients on a Unix
+    socket. Requests are handled one at a time, in the order they arrive.'''
+    import asyncio, json
+    def respond(line):
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            response = {'ok': False, 'error': 'Not JSON: %s' % e}
+        else:
+            response = state.handle(request) if isinstance(request, dict) else {'ok': False, 'error': 'Expected an object.'}
+        return (json.dumps(response) + '\n').encode('utf-8')
+    async def handle_client(reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                writer.write(respond(line))
+                await writer.drain()
+        writer.close()
+    async def serve_socket():
+        server = await asyncio.start_unix_server(handle_client, socket_path)
+        async with server:
+            await server.serve_forever()
+    async def serve_stdio():
+        loop = asyncio.get_running_loop()
+        while True:
+            # Reading a line blocks, so do it on another thread; stdin may be a plain file.
+            line = await loop.run_in_executor(None, sys.stdin.buffer.readline)
+            if not line:
+                break
+            if line.strip():
+                sys.stdout.buffer.write(respond(line))
+                sys.stdout.buffer.flush()
+    asyncio.run(serve_socket() if socket_path else serve_stdio())
+
+def select(fname, suggested_f, bestN, *, engine=python_engine, workers=1, checkpoint=None,
+           checkpoint_every=default_checkpoint_every, resume=False, instruments=None,
+           approximate=False, budget_seconds=None, budget_evaluations=None, seed=None,
+           distribution=False, histogram_bins=default_histogram_bins, distribution_json=None,
+           what_if=None, cache_dir=None, constraints=None, symmetry=False,
+           merge_scenarios=False, pareto=False, simulate=None, year_length=hours_per_year):
+    # Everything after bestN is keyword-only: there are too many options to pass
+    # them by position without getting two of them swapped.
+    attributes = {}
+    f, scenarios, liks, stewards, mttrs, faults = load_data(fname, suggested_f, instruments, cache_dir, attributes)
+    if constraints:
+        constraints = load_constraints(constraints, attributes, stewards)
+    if what_if:
+        variants = load_variants(what_if, scenarios, liks, stewards, f)
+        bests = analyze_variants(variants, scenarios, stewards, mttrs, faults, bestN, engine=engine)
+        for variant, best in zip(variants, bests):
+            report(best, variant['f'], variant['name'])
+        return
+    histogram = streamed = None
+    if distribution:
+        histogram = ScoreHistogram(histogram_bins)
+        # The distribution can't be worked out without scoring if only some combinations count.
+        scores = score_distribution(f, liks, mttrs, faults) if constraints is None else None
+        if scores is None:
+            if approximate:
+                raise Exception("The data is too varied to work out the score distribution without scoring every combination.")
+            streamed = histogram
+        else:
+            for score in sorted(scores):
+                histogram.add(score, scores[score])
+    front = ParetoFront() if pareto else None
+    if approximate:
+        best, stats = analyze_approximately(f, scenarios, liks, stewards, mttrs, faults, bestN, budget_seconds,
+                                            budget_evaluations, seed)
+    else:
+        best = analyze(f, scenarios, liks, stewards, mttrs, faults, bestN, engine=engine, workers=workers,
+                       checkpoint=checkpoint, checkpoint_every=checkpoint_every, resume=resume, instruments=instruments,
+                       histogram=streamed, constraints=constraints, symmetry=symmetry,
+                       merge_scenarios=merge_scenarios, front=front)
+    report(best, f)
+    if simulate:
+        started = time.time()
+        means, errors = simulate_downtime([item.steward_indexes for item in best.items], liks, mttrs, faults, f, simulate,
+                                          seed, year_length)
+        if instruments:
+            instruments.add_time('simulation', time.time() - started)
+        report_simulation(best, means, errors, simulate)
+    if front is not None:
+        report_front(front, f)
+    if histogram is not None:
+        report_distribution(histogram, best)
+        if distribution_json:
+            summary = histogram.summary()
+            import json
+            summary['bins'] = histogram.bins()
+            with open(distribution_json, 'w') as fp:
+                json.dump(summary, fp, indent=2)
 
 if __name__ == '__main__':
     if len(sys.argv) >= 2 and sys.argv[1] == 'test':
         del sys.argv[1]  # remove --test from args, so unittest won't complain about unknown switch
-        unittest.main()
+        # The tests live in test_select.py, so that importing this doesn't pay for unittest.
+        import unittest
+        unittest.main(module='test_select')
     else:
         import argparse
         parser = argparse.ArgumentParser()
         parser.add_argument('fname', help='CSV data file in format matching http://bit.ly/2GoYXTG. Lines before scenarios are optional.')
         parser.add_argument('--f', '-f', help='Number of faulted nodes to allow before consensus is lost. -1=max allowed by steward list (default); 0=as in data file', type=int, default=max_f_for_steward_list)
         parser.add_argument('--best', help='Specify how many of the best steward combinations to show.', type=int, default=10)
+        parser.add_argument('--engine', help='Scoring engine to use. numpy is much faster for big steward lists, but requires NumPy.', choices=engines, default=python_engine)
+        parser.add_argument('--workers', help='Number of processes to spread the analysis across.', type=int, default=1)
+        parser.add_argument('--checkpoint', help='File to save progress to periodically, so a long run can be resumed.')
+        parser.add_argument('--checkpoint-every', help='Seconds between checkpoints.', type=float, default=default_checkpoint_every)
+        parser.add_argument('--resume', help='Carry on from the --checkpoint file, if it exists.', action='store_true')
+        parser.add_argument('--progress', help='Show progress, speed and ETA on stderr every this many seconds.', type=float)
+        parser.add_argument('--timings', help='Show time spent in each phase of the run on stderr.', action='store_true')
+        parser.add_argument('--stats-json', help='Write stats about the run to this file as JSON.')
+        parser.add_argument('--approximate', help="Don't score every combination; sample and search within a budget instead.", action='store_true')
+        parser.add_argument('--budget-seconds', help='With --approximate, stop searching after this many seconds.', type=float)
+        parser.add_argument('--budget-evaluations', help='With --approximate, stop after scoring this many combinations (default %d if there is no time budget).' % default_approximate_evaluations, type=int)
+        parser.add_argument('--seed', help='Random seed for --approximate and --simulate.', type=int)
+        parser.add_argument('--distribution', help='Also summarize the scores of all the combinations. This is exact and '
+                            'needs no enumeration when the data allows; otherwise scores are binned as they are analyzed.', action='store_true')
+        parser.add_argument('--histogram-bins', help='Most bins to use for --distribution.', type=int, default=default_histogram_bins)
+        parser.add_argument('--distribution-json', help='Write the --distribution summary and bins to this file as JSON.')
+        parser.add_argument('--cache', help='Keep parsed copies of data files in this directory (default %s), '
+                            'and reuse them while the file is unchanged.' % default_cache_dir,
+                            nargs='?', const=default_cache_dir, metavar='DIR')
+        parser.add_argument('--what-if', help='JSON file listing variants of the data (f, likelihoods, excluded stewards) '
+                            'to analyze together, with a separate "top N" list for each.')
+        parser.add_argument('--constraints', help='JSON file of rules about which stewards can serve together, in terms of '
+                            'attribute columns after the fault? ones, e.g. {"max_per": {"jurisdiction": 1}, '
+                            '"cover": {"region": ["EU", "NA"]}}. Only combinations that obey them are considered.')
+        parser.add_argument('--symmetry', help='Score each mix of interchangeable stewards (same MTTR and faults) once, '
+                            'instead of every combination of them. Results are the same.', action='store_true')
+        parser.add_argument('--merge-scenarios', help='Score scenarios with the same fault column (including those nobody '
+                            'faults in) as one. Scores can differ from an unmerged run in the last bits while searching; '
+                            'the best combinations are scored again against every scenario.', action='store_true')
+        parser.add_argument('--pareto', help='Also list the combinations that no other beats on expected downtime, '
+                            'worst-case MTTR and number of scenarios that lose consensus all at once.', action='store_true')
+        parser.add_argument('--export', help='Instead of a "top N" list, write every combination with its score and '
+                            'failure distance in each scenario to this file, in a columnar form that can be memory-mapped '
+                            '(see load_export()).', metavar='FILE')
+        parser.add_argument('--export-chunk', help='With --export, score and write this many combinations at a time.',
+                            type=int, default=default_export_chunk, metavar='ROWS')
+        parser.add_argument('--simulate', help='Check the "top N" list against a Monte Carlo simulation of this many years '
+                            '(default %d) of scenarios happening at random, at their likelihoods, and stewards recovering '
+                            'after their MTTRs; show the time per year without consensus, with 95%% confidence '
+                            'intervals.' % default_simulated_years, nargs='?', const=default_simulated_years, type=int,
+                            metavar='YEARS')
+        parser.add_argument('--year-length', help='With --simulate, how long a year is in the units MTTRs are given in '
+                            '(default %g, for hours).' % hours_per_year, type=float, default=hours_per_year)
+        parser.add_argument('--serve', help='Keep the data and scores in memory, and answer JSON requests (one per line) '
+                            'to change the data and get the updated "top N" list, on stdin and stdout.', action='store_true')
+        parser.add_argument('--socket', help='With --serve, listen on this Unix socket instead of stdin.')
         args = parser.parse_args()
-        select(args.fname, args.f, args.best)
+        if args.resume and not args.checkpoint:
+            parser.error('--resume requires --checkpoint')
+        if (args.budget_seconds or args.budget_evaluations) and not args.approximate:
+            parser.error('--budget-seconds and --budget-evaluations require --approximate')
+        if args.seed is not None and not (args.approximate or args.simulate):
+            parser.error('--seed requires --approximate or --simulate')
+        if args.simulate is not None and (args.simulate < 2 or args.what_if or args.serve or args.export):
+            parser.error('--simulate needs at least 2 years, and can\'t be used with --what-if, --serve or --export')
+        if args.year_length != hours_per_year and not args.simulate:
+            parser.error('--year-length requires --simulate')
+        if args.approximate and (args.checkpoint or args.workers > 1 or args.progress or args.stats_json or args.timings):
+            parser.error('--approximate runs in one process, without checkpoints or instrumentation')
+        if args.what_if and (args.approximate or args.distribution or args.distribution_json or args.checkpoint or
+                             args.workers > 1 or args.progress or args.stats_json or args.timings):
+            parser.error('--what-if runs on its own, in one process')
+        if args.constraints and (args.what_if or args.approximate or args.checkpoint or args.workers > 1 or
+                                 args.progress or args.engine != python_engine):
+            parser.error('--constraints works with the %s engine, in one process, without --what-if, --approximate, '
+                         '--checkpoint or --progress' % python_engine)
+        if args.symmetry and (args.what_if or args.approximate or args.checkpoint or args.workers > 1 or
+                              args.constraints or args.progress or args.engine != python_engine):
+            parser.error('--symmetry works with the %s engine, in one process, without --what-if, --approximate, '
+                         '--checkpoint, --constraints or --progress' % python_engine)
+        if args.merge_scenarios and (args.what_if or args.approximate):
+            parser.error('--merge-scenarios can\'t be used with --what-if or --approximate')
+        if args.pareto and (args.what_if or args.approximate or args.checkpoint or args.workers > 1 or args.constraints or
+                            args.symmetry or args.merge_scenarios or args.engine not in [python_engine, numpy_engine]):
+            parser.error('--pareto works with the %s or %s engine, in one process, without --what-if, --approximate, '
+                         '--checkpoint, --constraints, --symmetry or --merge-scenarios' % (python_engine, numpy_engine))
+        if args.export and (args.what_if or args.approximate or args.distribution or args.distribution_json or
+                            args.checkpoint or args.workers > 1 or args.stats_json or args.timings or args.constraints or
+                            args.symmetry or args.merge_scenarios or args.pareto or args.serve or
+                            args.engine not in [python_engine, numpy_engine]):
+            parser.error('--export runs on its own, in one process, with the %s or %s engine' % (python_engine, numpy_engine))
+        if args.socket and not args.serve:
+            parser.error('--socket requires --serve')
+        if args.serve and (args.what_if or args.constraints or args.symmetry or args.merge_scenarios or args.pareto or args.approximate or args.distribution or args.distribution_json or
+                           args.checkpoint or args.workers > 1 or args.progress or args.stats_json or args.timings or
+                           args.engine not in [python_engine, numpy_engine]):
+            parser.error('--serve runs on its own, in one process, with the %s or %s engine' % (python_engine, numpy_engine))
+        if args.serve:
+            f, scenarios, liks, stewards, mttrs, faults = load_data(args.fname, args.f, cache_dir=args.cache)
+            # Unless f was left to follow the number of stewards, hold it where it is.
+            if args.f != max_f_for_steward_list:
+                args.f = f
+            serve(WarmSelection(scenarios, liks, stewards, mttrs, faults, args.f, args.best, args.engine), args.socket)
+            sys.exit(0)
+        if args.export:
+            f, scenarios, liks, stewards, mttrs, faults = load_data(args.fname, args.f, cache_dir=args.cache)
+            total = export_scores(args.export, f, scenarios, liks, stewards, mttrs, faults, args.engine, args.export_chunk,
+                                  Instrumentation(args.progress) if args.progress else None)
+            print('Wrote %d %d-steward combinations (n=%d, f=%d) to %s.' % (total, (3 * f) + 1, len(stewards), f, args.export))
+            sys.exit(0)
+        instruments = None
+        if args.progress or args.timings or args.stats_json:
+            instruments = Instrumentation(args.progress)
+        select(args.fname, args.f, args.best, engine=args.engine, workers=args.workers, checkpoint=args.checkpoint,
+               checkpoint_every=args.checkpoint_every, resume=args.resume, instruments=instruments,
+               approximate=args.approximate, budget_seconds=args.budget_seconds,
+               budget_evaluations=args.budget_evaluations, seed=args.seed,
+               distribution=args.distribution or bool(args.distribution_json), histogram_bins=args.histogram_bins,
+               distribution_json=args.distribution_json, what_if=args.what_if, cache_dir=args.cache,
+               constraints=args.constraints, symmetry=args.symmetry, merge_scenarios=args.merge_scenarios,
+               pareto=args.pareto, simulate=args.simulate, year_length=args.year_length)
+        if args.timings:
+            instruments.report_phases()
+        if args.stats_json:
+            instruments.dump(args.stats_json)
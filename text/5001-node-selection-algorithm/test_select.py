@@ -0,0 +1,967 @@
+'''
+Tests for select.py. Run them with "python select.py test", or "python -m unittest
+test_select" in this directory.
+'''
+
+import itertools, math, os, sys, unittest
+
+# select.py shares its name with the standard library's select module, which
+# multiprocessing and subprocess depend on, so keep this directory from shadowing it
+# and load select.py under another name, as bench.py does. Worker processes find
+# analyze_shard and friends by that name.
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[:] = [p for p in sys.path if os.path.abspath(p or os.curdir) != here] + [here]
+if 'steward_select' not in sys.modules:
+    import importlib.util
+    spec = importlib.util.spec_from_file_location('steward_select', os.path.join(here, 'select.py'))
+    sys.modules[spec.name] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sys.modules[spec.name])
+sel = sys.modules['steward_select']
+from steward_select import *
+
+class Tests(unittest.TestCase):
+
+    def test_ScenarioResult(self):
+        stewards = 'A,B,C,D,E,F'.split(',')
+        scenarios = 'a,b,c'.split(',')
+        liks = [.5, .4, .3]
+        mttrs = [6,7,8,9,10,11]
+        combo_indexes = [0,2,3,4]
+        faults = [[0,1,1],[1,0,0],[0,0,0],[1,1,1],[0,1,0],[1,0,1]]
+        sr = ScenarioResult('b', scenarios, liks, faults, combo_indexes, 1, mttrs)
+        self.assertEquals(sr.name, 'b')
+        self.assertEquals(sr.idx, 1)
+        self.assertAlmostEquals(sr.likelihood, .4)
+        self.assertEquals(sr.mttr, 8)
+        self.assertAlmostEquals(sr.score, -6.4)
+
+    def test_analyze(self):
+        stewards = 'A,B,C,D,E,F'.split(',')
+        scenarios = 'a,b,c'.split(',')
+        liks = [.5, .4, .3]
+        mttrs = [6,7,8,9,10,11]
+        faults = [[0,1,1],[1,0,0],[0,0,0],[1,1,1],[0,1,0],[1,0,1]]
+        best = analyze(1,scenarios,liks,stewards,mttrs,faults,3, quiet=True)
+        self.assertTrue(best.items[0].combined_score > best.items[1].combined_score)
+        self.assertTrue(best.items[1].combined_score > best.items[2].combined_score)
+
+    def test_analyze_numpy(self):
+        try:
+            import numpy as np
+        except ImportError:
+            self.skipTest('NumPy not installed')
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, f_from_data_file)
+        block = unrank_combinations(np, len(stewards), 4, np.arange(choose(len(stewards), 4)))
+        self.assertEqual(block.tolist(), [list(c) for c in index_combinations(len(stewards), 4)])
+        scores = score_block_numpy(np, block, f, np.array(faults, dtype=np.float32).T, np.array(mttrs), np.array(liks))
+        for i, combo in enumerate(index_combinations(len(stewards), 4)):
+            ca = combo_analysis(combo, scenarios, liks, stewards, mttrs, faults, f)
+            self.assertEqual(scores[i], ca.combined_score)
+        expected = analyze(f, scenarios, liks, stewards, mttrs, faults, 5, quiet=True)
+        best = analyze(f, scenarios, liks, stewards, mttrs, faults, 5, quiet=True, engine=numpy_engine)
+        self.assertEqual([str(x) for x in best.items], [str(x) for x in expected.items])
+
+    def test_analyze_parallel(self):
+        stewards = 'A,B,C,D,E,F,G,H'.split(',')
+        scenarios = 'a,b,c'.split(',')
+        liks = [.5, .4, .3]
+        # Lots of identical stewards, so there are lots of ties to break.
+        mttrs = [6,7,6,6,10,7,6,6]
+        faults = [[0,1,1],[1,0,0],[0,1,1],[0,1,1],[0,1,0],[1,0,0],[0,1,1],[0,1,1]]
+        for engine in engines:
+            if engine == incremental_engine:
+                continue
+            if engine == numpy_engine:
+                try:
+                    import numpy
+                except ImportError:
+                    continue
+            expected = analyze(1, scenarios, liks, stewards, mttrs, faults, 7, quiet=True, engine=engine)
+            best = analyze(1, scenarios, liks, stewards, mttrs, faults, 7, quiet=True, engine=engine, workers=3)
+            self.assertEqual([str(x) for x in best.items], [str(x) for x in expected.items])
+            self.assertEqual(best.ranked()[0][0], expected.ranked()[0][0])
+
+    def test_analyze_branch_and_bound(self):
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, f_from_data_file)
+        for bestN in [1, 5, 126]:
+            expected = analyze(f, scenarios, liks, stewards, mttrs, faults, bestN, quiet=True)
+            best = BestN(lambda x: x.combined_score, bestN)
+            visited, pruned, skipped = analyze_branch_and_bound(f, scenarios, liks, stewards, mttrs, faults, best)
+            self.assertEqual([str(x) for x in best.items], [str(x) for x in expected.items])
+            self.assertEqual([seq for seq, x in best.ranked()], [seq for seq, x in expected.ranked()])
+            if bestN == 1:
+                self.assertTrue(skipped > 0)
+            if bestN == 126:
+                self.assertEqual(skipped, 0)
+        best = analyze(f, scenarios, liks, stewards, mttrs, faults, 5, quiet=True, engine=branch_and_bound_engine, workers=2)
+        self.assertEqual([str(x) for x in best.items], [str(x) for x in analyze(f, scenarios, liks, stewards, mttrs, faults, 5, quiet=True).items])
+
+    def test_revolving_door_swaps(self):
+        for n in range(8):
+            for m in range(n + 1):
+                combo = set(range(m))
+                seen = [tuple(sorted(combo))]
+                for removed, added in revolving_door_swaps(n, m):
+                    self.assertIn(removed, combo)
+                    self.assertNotIn(added, combo)
+                    combo.remove(removed)
+                    combo.add(added)
+                    seen.append(tuple(sorted(combo)))
+                self.assertEqual(sorted(seen), list(itertools.combinations(range(n), m)))
+
+    def test_analyze_incremental(self):
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, f_from_data_file)
+        count = 0
+        for members, score in revolving_door_scores(f, liks, mttrs, faults, len(stewards)):
+            ca = combo_analysis(tuple(members), scenarios, liks, stewards, mttrs, faults, f)
+            self.assertEqual(score, ca.combined_score)
+            count += 1
+        self.assertEqual(count, choose(len(stewards), (3 * f) + 1))
+        expected = analyze(f, scenarios, liks, stewards, mttrs, faults, 7, quiet=True)
+        best = analyze(f, scenarios, liks, stewards, mttrs, faults, 7, quiet=True, engine=incremental_engine)
+        self.assertEqual([(seq, str(x)) for seq, x in best.ranked()], [(seq, str(x)) for seq, x in expected.ranked()])
+        self.assertRaises(Exception, analyze, f, scenarios, liks, stewards, mttrs, faults, 7, quiet=True, engine=incremental_engine, workers=2)
+
+    def test_fault_masks(self):
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, f_from_data_file)
+        masks = fault_masks(faults, len(scenarios))
+        self.assertEqual(masks[0], 0b111111111)
+        self.assertEqual(masks[3], 0b000001100)
+        self.assertEqual(unpack_fault_masks(masks, len(stewards)), faults)
+        order, ranks = mttr_ranking(mttrs)
+        self.assertEqual([mttrs[i] for i in order], sorted(mttrs))
+        self.assertEqual([order[r] for r in ranks], list(range(len(stewards))))
+        for combo in index_combinations(len(stewards), 4):
+            ca = combo_analysis(combo, scenarios, liks, stewards, mttrs, faults, f)
+            self.assertEqual(score_with_masks(f, liks, mttrs, masks, order, ranks, combo), ca.combined_score)
+        expected = analyze(f, scenarios, liks, stewards, mttrs, faults, 7, quiet=True)
+        best = analyze(f, scenarios, liks, stewards, mttrs, faults, 7, quiet=True, engine=bitmask_engine)
+        self.assertEqual([(seq, str(x)) for seq, x in best.ranked()], [(seq, str(x)) for seq, x in expected.ranked()])
+
+    def test_checkpoint_resume(self):
+        import io, json, tempfile
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, f_from_data_file)
+        expected = analyze(f, scenarios, liks, stewards, mttrs, faults, 5, quiet=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoint = os.path.join(tmp, 'checkpoint.json')
+            # Pretend a run got 50 combinations in before it was killed.
+            partial = BestN(lambda x: x.combined_score, 5)
+            analyze_range(python_engine, f, scenarios, liks, stewards, mttrs, faults, partial, 0, 50)
+            save_checkpoint(checkpoint, data_fingerprint(f, scenarios, liks, stewards, mttrs, faults), partial, 50, None)
+            for engine in [python_engine, bitmask_engine]:
+                best = analyze(f, scenarios, liks, stewards, mttrs, faults, 5, quiet=True, engine=engine,
+                               checkpoint=checkpoint, resume=True)
+                self.assertEqual([(seq, str(x)) for seq, x in best.ranked()], [(seq, str(x)) for seq, x in expected.ranked()])
+            with open(checkpoint) as fp:
+                self.assertEqual(json.load(fp)['cursor'], 126)
+            # With workers, many small slices go through one pool, and are merged in order.
+            saved_slice = sel.first_checkpoint_slice
+            sel.first_checkpoint_slice = 7
+            try:
+                save_checkpoint(checkpoint, data_fingerprint(f, scenarios, liks, stewards, mttrs, faults), partial, 50, None)
+                instruments = Instrumentation(progress_every=1000, stream=io.StringIO())
+                best = analyze(f, scenarios, liks, stewards, mttrs, faults, 5, quiet=True, workers=2,
+                               checkpoint=checkpoint, checkpoint_every=0.000001, resume=True, instruments=instruments)
+                self.assertEqual([(seq, str(x)) for seq, x in best.ranked()], [(seq, str(x)) for seq, x in expected.ranked()])
+                self.assertTrue(instruments.stream.getvalue().splitlines()[-1].startswith('126/126 combinations'))
+            finally:
+                sel.first_checkpoint_slice = saved_slice
+            with open(checkpoint) as fp:
+                self.assertEqual(json.load(fp)['cursor'], 126)
+            self.assertRaises(Exception, analyze, f, scenarios, liks, stewards, mttrs, faults, 6, quiet=True,
+                              checkpoint=checkpoint, resume=True)
+            self.assertRaises(Exception, analyze, f, scenarios, liks, stewards, mttrs[::-1], faults, 5, quiet=True,
+                              checkpoint=checkpoint, resume=True)
+
+    def test_Instrumentation(self):
+        import io, json, tempfile
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        stream = io.StringIO()
+        instruments = Instrumentation(progress_every=0.000001, stream=stream)
+        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, f_from_data_file, instruments)
+        best = analyze(f, scenarios, liks, stewards, mttrs, faults, 5, quiet=True, instruments=instruments)
+        expected = analyze(f, scenarios, liks, stewards, mttrs, faults, 5, quiet=True)
+        self.assertEqual([str(x) for x in best.items], [str(x) for x in expected.items])
+        self.assertTrue(stream.getvalue().endswith('\n'))
+        self.assertTrue(stream.getvalue().splitlines()[-1].startswith('126/126 combinations (100.0%)'))
+        self.assertEqual(sorted(instruments.phases), ['bestn', 'load_csv', 'scoring'])
+        self.assertEqual(instruments.stats['combinations'], 126)
+        self.assertEqual(instruments.stats['best_score'], expected.items[0].combined_score)
+        with tempfile.TemporaryDirectory() as tmp:
+            instruments.dump(os.path.join(tmp, 'stats.json'))
+            with open(os.path.join(tmp, 'stats.json')) as fp:
+                self.assertEqual(json.load(fp)['engine'], python_engine)
+        self.assertEqual(format_duration(3725.5), '1:02:05')
+
+    def test_analyze_approximately(self):
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, f_from_data_file)
+        expected = [str(x) for x in analyze(f, scenarios, liks, stewards, mttrs, faults, 5, quiet=True).items]
+        # A budget bigger than the whole space ends up scoring all of it.
+        best, stats = analyze_approximately(f, scenarios, liks, stewards, mttrs, faults, 5, evaluations=1000, seed=1, quiet=True)
+        self.assertEqual([str(x) for x in best.items], expected)
+        self.assertEqual((stats['distinct'], stats['coverage']), (126, 1.0))
+        # A small one is respected, and a seed makes the search repeatable.
+        runs = [analyze_approximately(f, scenarios, liks, stewards, mttrs, faults, 5, evaluations=40, seed=2, quiet=True)
+                for i in range(2)]
+        self.assertEqual(runs[0][1]['evaluations'], 40)
+        self.assertEqual(runs[0][1]['sampled'], 8)
+        self.assertTrue(runs[0][1]['searches'] >= 1)
+        self.assertEqual([str(x) for x in runs[0][0].items], [str(x) for x in runs[1][0].items])
+        for x in runs[0][0].items:
+            self.assertEqual(x.combined_score, sum([r.score for r in x.results]))
+        # Scores are forgotten to stay within memory, but the best are never kept twice.
+        saved_size = sel.approximate_cache_size
+        sel.approximate_cache_size = 10
+        try:
+            best, stats = analyze_approximately(f, scenarios, liks, stewards, mttrs, faults, 5, evaluations=1000, seed=1,
+                                                quiet=True)
+        finally:
+            sel.approximate_cache_size = saved_size
+        self.assertEqual([str(x) for x in best.items], expected)
+        self.assertEqual((stats['evaluations'], stats['forgotten']), (1000, 990))
+        self.assertEqual(stats['coverage'], 1.0)
+
+    def test_score_distribution(self):
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, f_from_data_file)
+        expected = {}
+        for combo in index_combinations(len(stewards), 4):
+            score = combo_score(combo, liks, mttrs, faults, f)
+            expected[score] = expected.get(score, 0) + 1
+        self.assertEqual(score_distribution(f, liks, mttrs, faults), expected)
+        self.assertIsNone(score_distribution(f, liks, mttrs, faults, max_states=10))
+        self.assertEqual(score_distribution(3, liks, mttrs, faults), {})
+        # With fractional MTTRs, sums depend on the order they're taken in, and the
+        # distribution still matches a histogram of every combination's score.
+        mttrs = [0.91, 0.13, 0.27, 0.03, 0.07, 0.33, 0.59, 0.01, 0.02]
+        for f in [1, 2]:
+            enumerated = ScoreHistogram()
+            for combo in index_combinations(len(stewards), (3 * f) + 1):
+                enumerated.add(combo_score(combo, liks, mttrs, faults, f))
+            counted = ScoreHistogram()
+            for score, count in sorted(score_distribution(f, liks, mttrs, faults).items()):
+                counted.add(score, count)
+            self.assertEqual((counted.total, counted.counts), (enumerated.total, enumerated.counts))
+
+    def test_ScoreHistogram(self):
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, f_from_data_file)
+        scores = sorted([combo_score(combo, liks, mttrs, faults, f) for combo in index_combinations(len(stewards), 4)])
+        exact = ScoreHistogram()
+        for score in scores:
+            exact.add(score)
+        self.assertTrue(exact.summary()['exact'])
+        self.assertEqual((exact.total, exact.min, exact.max), (126, scores[0], scores[-1]))
+        self.assertEqual(exact.percentile(50), scores[62])
+        self.assertEqual(exact.fraction_below(scores[-1]), 125 / 126.0)
+        # Once binned, the histogram is the same whatever order the scores came in, and
+        # however they were split up.
+        binned = ScoreHistogram(8)
+        for score in reversed(scores):
+            binned.add(score)
+        parts = [ScoreHistogram(8), ScoreHistogram(8)]
+        for i, score in enumerate(scores):
+            parts[i % 2].add(score)
+        parts[0].merge(parts[1])
+        self.assertEqual((parts[0].width, parts[0].counts), (binned.width, binned.counts))
+        self.assertTrue(len(binned.counts) <= 8)
+        self.assertEqual(sum([count for low, high, count in binned.bins()]), 126)
+        self.assertTrue(binned.min <= binned.percentile(50) <= binned.max)
+        # Every engine that sees every score streams the same histogram.
+        for engine in engines:
+            if engine == branch_and_bound_engine:
+                continue
+            if engine == numpy_engine:
+                try:
+                    import numpy
+                except ImportError:
+                    continue
+            for workers in [1, 2]:
+                if engine == incremental_engine and workers > 1:
+                    continue
+                histogram = ScoreHistogram(8)
+                analyze(f, scenarios, liks, stewards, mttrs, faults, 5, quiet=True, engine=engine, workers=workers,
+                        histogram=histogram)
+                self.assertEqual((histogram.width, histogram.counts), (binned.width, binned.counts), engine)
+        self.assertRaises(Exception, analyze, f, scenarios, liks, stewards, mttrs, faults, 5, quiet=True,
+                          engine=branch_and_bound_engine, histogram=ScoreHistogram())
+
+    def test_analyze_variants(self):
+        import json, tempfile
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, f_from_data_file)
+        specs = [{}, {'f': 2, 'name': 'f=2'}, {'likelihoods': {scenarios[0]: '50%', scenarios[3]: 0.2}},
+                 {'exclude': ['Bank A', 'NGO E'], 'likelihoods': [0.1] * len(scenarios)}]
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, 'variants.json'), 'w') as fp:
+                json.dump(specs, fp)
+            variants = load_variants(os.path.join(tmp, 'variants.json'), scenarios, liks, stewards, f)
+            def error(bad):
+                with open(os.path.join(tmp, 'bad.json'), 'w') as fp:
+                    json.dump(specs[:2] + [bad], fp, indent=2)
+                try:
+                    load_variants(os.path.join(tmp, 'bad.json'), scenarios, liks, stewards, f)
+                except Exception as e:
+                    return str(e)
+            # The first two variants take up lines 2 and 3-6 of the file.
+            for bad_f in [-1, 3, 1.5, '1', True]:
+                self.assertEqual(error({'name': 'bad', 'f': bad_f}), 'Variant 3 (line 7): f must be a whole number from 0 '
+                                 'to 2 for 9 stewards, not %s.' % json.dumps(bad_f))
+            self.assertEqual(error(['f', 1]), 'Variant 3 (line 7) should be an object.')
+            for bad_lik in [True, None, [0.1], -0.5, '-5%', 'often']:
+                self.assertEqual(error({'likelihoods': {scenarios[1]: bad_lik}}), 'Variant 3 (line 7): the likelihood of '
+                                 '"%s" must be a non-negative number or percentage, not %r.' % (scenarios[1], bad_lik))
+            self.assertEqual(error({'f': 2, 'exclude': ['Bank A', 'NGO E', 'Law Firm D']}),
+                             'Variant 3 (line 7) needs 7 stewards but only has 6.')
+            self.assertIsNone(error({'f': 0}))
+        self.assertEqual([v['name'] for v in variants], ['variant 1', 'f=2', 'variant 3', 'variant 4'])
+        self.assertEqual(variants[2]['liks'][:4], [0.5, liks[1], liks[2], 0.2])
+        # Each variant gets what analyze() would give on the edited data.
+        expected = []
+        for v in variants:
+            kept = [i for i in range(len(stewards)) if i not in v['excluded']]
+            best = analyze(v['f'], scenarios, v['liks'], [stewards[i] for i in kept], [mttrs[i] for i in kept],
+                           [faults[i] for i in kept], 5, quiet=True)
+            expected.append([str(x) for x in best.items])
+        for engine in [python_engine, numpy_engine]:
+            if engine == numpy_engine:
+                try:
+                    import numpy
+                except ImportError:
+                    continue
+            bests = analyze_variants(variants, scenarios, stewards, mttrs, faults, 5, quiet=True, engine=engine)
+            self.assertEqual([[str(x) for x in best.items] for best in bests], expected, engine)
+            self.assertEqual(bests[2].items[0].combined_score, sum([r.score for r in bests[2].items[0].results]))
+
+    def test_analyze_by_prefix(self):
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, f_from_data_file)
+        for m_f in [0, 1, 2]:
+            m = (3 * m_f) + 1
+            total = choose(len(stewards), m)
+            expected = [(seq, combo_score(combo, liks, mttrs, faults, m_f))
+                        for seq, combo in enumerate(index_combinations(len(stewards), m))]
+            for start, stop in [(0, total), (5, total), (3, 4), (total - 2, total)]:
+                best = BestN(lambda x: x.combined_score, total)
+                analyze_by_prefix(m_f, scenarios, liks, stewards, mttrs, faults, best, start, stop)
+                self.assertEqual(sorted([(seq, x.combined_score) for seq, x in best.ranked()]), expected[start:stop])
+                for seq, x in best.ranked():
+                    self.assertEqual(list(x.steward_indexes), unrank_combination(len(stewards), m, seq))
+
+    def test_rank_combination(self):
+        for rank, combo in enumerate(itertools.combinations(range(7), 3)):
+            self.assertEqual(rank_combination(7, 3, combo), rank)
+            self.assertEqual(unrank_combination(7, 3, rank), list(combo))
+
+    def test_index_combinations(self):
+        expected = list(itertools.combinations(range(7), 3))
+        self.assertEqual(list(index_combinations(7, 3)), expected)
+        self.assertEqual(list(index_combinations(7, 3, 5, 17)), expected[5:17])
+        self.assertEqual(list(index_combinations(7, 3, 34)), expected[34:])
+        self.assertEqual(list(index_combinations(3, 4)), [])
+
+    def test_unique_combinations(self):
+        fruit = 'apple,banana,orange,pear'.split(',')
+        combos = '\n'.join(sorted(['+'.join(x) for x in unique_combinations(fruit, 2)]))
+        self.assertEquals(combos, 'apple+banana\napple+orange\napple+pear\nbanana+orange\nbanana+pear\norange+pear')
+        self.assertEqual(list(unique_combinations(fruit, 0)), [[]])
+        self.assertEqual(list(unique_combinations(fruit, 5)), [])
+
+    def test_ComboAnalysis(self):
+        # Stewards with the same name are still told apart by index.
+        stewards = ['B', 'A', 'A']
+        ca = ComboAnalysis((0, 2), stewards)
+        self.assertEqual(ca.combo, ['A', 'B'])
+        self.assertEqual(ca.steward_indexes, (0, 2))
+        self.assertEqual(str(ca), 'A+B: 0')
+        self.assertRaises(AttributeError, setattr, ca, 'extra', 1)
+
+    def test_combo_score(self):
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, f_from_data_file)
+        for combo in index_combinations(len(stewards), 4):
+            # The details are only worked out on demand, and agree with the score.
+            ca = combo_analysis(combo, scenarios, liks, stewards, mttrs, faults, f)
+            self.assertIsNone(ca._results)
+            self.assertEqual(len(ca.results), len(scenarios))
+            self.assertEqual(ca.combined_score, sum([r.score for r in ca.results]))
+            self.assertEqual(combo_score(combo, liks, mttrs, faults, f), ca.combined_score)
+
+    def test_is_empty_row(self):
+        self.assertTrue(is_empty_row((None,None,None)))
+        self.assertTrue(is_empty_row(('','','')))
+        self.assertFalse(is_empty_row((1,'',None)))
+
+    def test_convert_float(self):
+        self.assertAlmostEquals(convert_float('1'), 1.0)
+        self.assertAlmostEquals(convert_float(1), 1.0)
+        self.assertAlmostEquals(convert_float('0.01'), 0.01)
+        self.assertAlmostEquals(convert_float('10%'), 0.1)
+
+    def test_factorial(self):
+        self.assertEquals(factorial(1), 1)
+        self.assertEquals(factorial(2), 2)
+        self.assertEquals(factorial(3), 6)
+        self.assertEquals(factorial(4), 24)
+
+    def test_choose(self):
+        self.assertEqual(choose(9, 4), 126)
+        self.assertEqual(choose(4, 4), 1)
+        self.assertEqual(choose(3, 4), 0)
+
+    def test_has_string(self):
+        self.assertTrue(has_string(' abc '))
+        self.assertTrue(has_string('X'))
+        self.assertFalse(has_string(' 123'))
+
+    def test_has_num(self):
+        self.assertFalse(has_num(' abc '))
+        self.assertFalse(has_num('X'))
+        self.assertTrue(has_num(' 123'))
+        self.assertTrue(has_num('-2'))
+        self.assertTrue(has_num('1%'))
+
+    def test_is_steward_row(self):
+        self.assertTrue(is_steward_row(('x', '25', 1, '0', '0', '1')))
+        self.assertFalse(is_steward_row(('x', '25', 5, '0', '0', '1')))
+        self.assertFalse(is_steward_row(('x', '25', '1', '0', '0.1', '1')))
+
+    def test_max_f_for_steward_count(self):
+        self.assertEquals(max_f_for_steward_count(0), 0)
+        self.assertEquals(max_f_for_steward_count(3), 0)
+        self.assertEquals(max_f_for_steward_count(4), 1)
+        self.assertEquals(max_f_for_steward_count(5), 1)
+        self.assertEquals(max_f_for_steward_count(7), 2)
+
+    def test_parse_headers(self):
+        rows = [x.split(',') for x in ''',,scheduled maintenance coincidence,botched upgrade,foo
+likelihood per year (from MTBF),,1%,85%,17%
+Steward,MTTR,fault?,fault?,fault?
+Bank A,5,1,1,0
+Tech Firm B,13,1,0,1'''.replace('\r', '').split('\n')]
+        f, scenarios, liks, row_idx = parse_headers(rows)
+        self.assertEquals(row_idx, 3)
+        self.assertEquals(liks, [0.01,0.85,0.17])
+        self.assertEquals(f, 0)
+
+    def test_load_data_good(self):
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, f_from_data_file)
+        self.assertEquals(f, 1)
+        self.assertEquals(scenarios[0], 'scheduled maintenance coincidence')
+        self.assertEquals(scenarios[11], 'major natural disaster, US East Coast')
+        self.assertEquals(liks, [0.01, 0.85, 0.0001, 0.05, 0.01, 0.8, 0.03, 0.5, 0.02, 0.03, 0.1, 0.0001])
+        self.assertEquals(stewards, ['Bank A', 'Tech Firm B', 'University C', 'Law Firm D', 'NGO E', 'Government F', 'Consortium G', 'Tech Firm H', 'Biotech Firm J'])
+        self.assertEquals(mttrs, [5.0, 13.0, 11.0, 6.0, 6.0, 9.0, 12.0, 8.0, 7.0])
+        self.assertEquals(faults[0], [1, 1, 0, 0, 0, 1, 0, 1, 1, 0, 1, 0])
+        self.assertEquals(faults[8], [1, 1, 0, 0, 0, 1, 0, 1, 0, 0, 1, 0])
+
+    def test_parse_rows(self):
+        # The same data as test_parse_headers() gets, with no F row, plus messy whitespace,
+        # trailing blank cells and a summary row after the stewards.
+        rows = [x.split(',') for x in '''title,,,,
+,,scheduled maintenance coincidence,botched upgrade,foo,,
+likelihood per year (from MTBF),,1%, 85% ,0.17
+Steward,MTTR,fault?,fault?,fault?,
+Bank A, 5 ,1,1,0
+Tech Firm B,13,1, 0 ,1,,
+,,
+faulted,,2,1,1'''.split('\n')]
+        f, scenarios, liks, stewards, mttrs, faults = parse_rows(rows)
+        self.assertEqual((f, scenarios), (0, ['scheduled maintenance coincidence', 'botched upgrade', 'foo']))
+        self.assertEqual(liks, [0.01, 0.85, 0.17])
+        self.assertEqual((stewards, mttrs, faults), (['Bank A', 'Tech Firm B'], [5.0, 13.0], [[1, 1, 0], [1, 0, 1]]))
+        # Rows are only read as far as they need to be.
+        consumed = []
+        def stream():
+            for row in rows:
+                consumed.append(row)
+                yield row
+        parse_rows(stream())
+        self.assertEqual(len(consumed), 7)
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        self.assertEqual(load_csv(fname)[0], 1)
+        # The older pipeline reads the same data.
+        legacy = load_clean_csv(fname)
+        f, scenarios, liks, row_idx = parse_headers(legacy)
+        self.assertEqual((f, scenarios, liks) + parse_stewards(legacy, row_idx), load_csv(fname))
+        def error(changes):
+            edited = [list(row) for row in rows]
+            for (i, j), value in changes.items():
+                edited[i][j] = value
+            try:
+                parse_rows(edited)
+            except Exception as e:
+                return str(e)
+        self.assertEqual(error({(5, 3): '0.5'}), 'Row 6, column D: fault? values for steward "Tech Firm B" must be 0 or 1, not "0.5".')
+        # The older parse_stewards() takes such a row as the end of the stewards instead.
+        edited = [[cell.strip() for cell in row] for row in rows]
+        edited[5][3] = '0.5'
+        self.assertEqual(parse_stewards(edited, parse_headers(edited)[3]), (['Bank A'], [5.0], [[1, 1, 0]]))
+        self.assertEqual(error({(2, 3): '-85%'}), 'Row 3, column D: the likelihood of "botched upgrade" must be a '
+                         'non-negative number or percentage, not -0.85.')
+        self.assertEqual(error({(2, 3): 'lots'}), 'Row 3, column D: expected a number for the likelihood of "botched upgrade", not "lots".')
+        self.assertEqual(error({(5, 5): 'x'}), 'Row 6, column F: unexpected "x" after the last scenario.')
+        self.assertEqual(error({(1, 2): ''}), "Didn't find a row of scenario names (one whose first two cells are empty).")
+        self.assertEqual(error({(3, 4): 'notes'}), 'Didn\'t find a header row ending in "fault?" after the likelihoods.')
+        self.assertRaises(Exception, parse_rows, rows[:4] + [['Bank A', '5', '1', '1']])
+        self.assertRaises(Exception, parse_rows, [[], ['', ' ']])
+        self.assertEqual([column_name(j) for j in [0, 25, 26, 27, 701, 702]], ['A', 'Z', 'AA', 'AB', 'ZZ', 'AAA'])
+
+    def test_cache(self):
+        import contextlib, functools, io, multiprocessing, shutil, tempfile
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        expected = load_csv(fname)
+        with tempfile.TemporaryDirectory() as tmp:
+            copy = os.path.join(tmp, 'data.csv')
+            shutil.copy(fname, copy)
+            cache_dir = os.path.join(tmp, 'cache')
+            self.assertEqual(load_csv_cached(copy, cache_dir), expected)
+            [cached] = os.listdir(cache_dir)
+            self.assertEqual(load_cache(os.path.join(cache_dir, cached)), expected)
+            instruments = Instrumentation()
+            self.assertEqual(load_csv_cached(copy, cache_dir, instruments), expected)
+            self.assertEqual(list(instruments.phases), ['load_cache'])
+            # Editing the file gives it a new cache entry.
+            with open(copy, 'a') as fp:
+                fp.write('\n')
+            self.assertEqual(load_csv_cached(copy, cache_dir), expected)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+            # A cache file that's been damaged is ignored, and rewritten.
+            with open(os.path.join(cache_dir, cached), 'r+b') as fp:
+                fp.truncate(100)
+            self.assertIsNone(load_cache(os.path.join(cache_dir, cached)))
+            self.assertEqual(load_data(fname, 1, cache_dir=cache_dir), load_data(fname, 1))
+            self.assertEqual(load_cache(os.path.join(cache_dir, cached)), expected)
+            # Batch jobs starting together with a cold cache all write it at once.
+            cold = os.path.join(tmp, 'cold')
+            with multiprocessing.Pool(8) as pool:
+                loaded = pool.map(functools.partial(load_csv_cached, copy), [cold] * 40)
+            self.assertEqual(loaded, [load_csv(copy)] * 40)
+            self.assertEqual([x for x in os.listdir(cold) if not x.endswith('.cache')], [])
+            # A cache that can't be written is reported, and the data is loaded anyway.
+            stream = io.StringIO()
+            with contextlib.redirect_stderr(stream):
+                self.assertEqual(load_csv_cached(copy, copy), load_csv(copy))
+            self.assertTrue(stream.getvalue().startswith("Couldn't cache"))
+
+    def test_select_stewards(self):
+        import json, subprocess
+        try:
+            import numpy
+            as_array = numpy.array
+        except ImportError:
+            as_array = tuple
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, 1)
+        expected = analyze(f, scenarios, liks, stewards, mttrs, faults, 5, quiet=True)
+        selection = select_stewards(tuple(scenarios), as_array(liks), stewards, as_array(mttrs),
+                                    as_array(faults), f, 5)
+        self.assertEqual((selection.f, selection.m, selection.combinations), (1, 4, 126))
+        self.assertEqual([str(x) for x in selection.best], [str(x) for x in expected.items])
+        result = json.loads(json.dumps(selection.as_dict(details=True)))
+        self.assertEqual(result['best'][0]['stewards'], expected.items[0].combo)
+        self.assertEqual(result['best'][0]['score'], expected.items[0].combined_score)
+        self.assertEqual(sum([r['score'] for r in result['best'][0]['scenarios']]), expected.items[0].combined_score)
+        self.assertEqual(select_stewards(scenarios, liks, stewards, mttrs, faults).f, 2)
+        self.assertRaises(Exception, select_stewards, scenarios, liks[1:], stewards, mttrs, faults)
+        self.assertRaises(Exception, select_stewards, scenarios, liks, stewards, mttrs, faults[:-1])
+        self.assertRaises(Exception, select_stewards, scenarios, liks, stewards, mttrs, [[2] * len(scenarios)] * len(stewards))
+        self.assertRaises(Exception, select_stewards, scenarios, liks, stewards, mttrs, faults, 3)
+        # Importing this, and analyzing a few stewards with the python engine, doesn't
+        # import anything it doesn't need.
+        code = '''import importlib.util, sys
+spec = importlib.util.spec_from_file_location('steward_select', %r)
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+module.select_stewards(['a', 'b', 'c'], [0.1, 0.2, 0.3], ['x', 'y', 'z', 'w'], [1, 2, 3, 4], [[0, 1, 0]] * 4)
+print(' '.join(sorted(sys.modules)))''' % os.path.join(here, 'select.py')
+        loaded = subprocess.check_output([sys.executable, '-c', code]).decode().split()
+        for name in ['csv', 'json', 'numpy', 'multiprocessing', 'unittest', 'random']:
+            self.assertNotIn(name, loaded)
+
+    def test_WarmSelection(self):
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, 1)
+        def check(state):
+            f, scenarios, liks, stewards, mttrs, faults = state.data()
+            expected = analyze(f, scenarios, liks, stewards, mttrs, faults, 6, quiet=True)
+            self.assertEqual([str(x) for x in state.selection().best], [str(x) for x in expected.items])
+        for engine in [python_engine, numpy_engine]:
+            if engine == numpy_engine:
+                try:
+                    import numpy
+                except ImportError:
+                    continue
+            for requested_f in [1, max_f_for_steward_list]:
+                state = WarmSelection(scenarios, liks, stewards, mttrs, faults, requested_f, 6, engine)
+                check(state)
+                self.assertEqual(state.update_steward('Bank A', mttr=20), choose(8, 3 if requested_f == 1 else 6))
+                check(state)
+                state.update_steward('NGO E', faults=[1] * len(scenarios))
+                check(state)
+                state.add_steward('New K', 3, [0, 1] * (len(scenarios) // 2))
+                check(state)
+                state.add_steward('New L', 2, [1, 0] * (len(scenarios) // 2))
+                check(state)
+                # Ties between blocks go to the combination that would come first.
+                state.update_steward('New L', 5, state.data()[5][stewards.index('Law Firm D')])
+                check(state)
+                state.add_scenario('flood', '5%', {'New K': 1, 'Bank A': 1})
+                check(state)
+                state.remove_steward('Tech Firm B')
+                check(state)
+                state.remove_steward('New K')
+                check(state)
+                state.update_steward('New L', mttr=1)
+                check(state)
+                state.set_likelihood('flood', 0.5)
+                check(state)
+                for name in ['Consortium G', 'Tech Firm H', 'University C']:
+                    state.remove_steward(name)
+                    check(state)
+                self.assertRaises(Exception, state.add_scenario, 'flood', 0.1, {})
+                self.assertRaises(Exception, state.update_steward, 'Tech Firm B', 1)
+                # A rejected update changes neither the data nor the list.
+                data, best = state.data(), [str(x) for x in state.selection().best]
+                self.assertRaises(Exception, state.update_steward, 'Bank A', 'soon', [1] * len(scenarios))
+                self.assertRaises(Exception, state.add_steward, 'New M', None, [0] * len(scenarios))
+                self.assertRaises(Exception, state.add_scenario, 'drought', -0.1, {})
+                self.assertRaises(Exception, state.set_likelihood, 'flood', '-5%')
+                self.assertEqual(state.data(), data)
+                self.assertEqual([str(x) for x in state.selection().best], best)
+                check(state)
+        # f=2 needs 7 stewards; a change that would leave fewer changes nothing.
+        state = WarmSelection(scenarios, liks, stewards, mttrs, faults, 2, 3)
+        state.remove_steward('Bank A')
+        state.remove_steward('NGO E')
+        self.assertRaises(Exception, state.remove_steward, 'Tech Firm B')
+        self.assertEqual(len(state.data()[3]), 7)
+        check(state)
+        self.assertRaises(Exception, WarmSelection, scenarios, liks, stewards, mttrs, faults, 1, 3, max_combinations=100)
+        response = state.handle({'op': 'add_steward', 'steward': 'New K', 'mttr': 4, 'faults': [0] * len(scenarios)})
+        self.assertEqual((response['ok'], response['rescored'], response['m']), (True, 7, 7))
+        self.assertEqual(state.handle({'op': 'remove_steward'}), {'ok': False, 'error': "Missing 'steward'."})
+        self.assertEqual(state.handle({'op': 'set_likelihood', 'scenario': scenarios[0], 'likelihood': True}),
+                         {'ok': False, 'error': 'The likelihood of scenario "%s" must be a non-negative number or '
+                                                'percentage, not True.' % scenarios[0]})
+        # Only a missing request field is reported as one.
+        state.remove_steward = lambda name: {}['internal']
+        self.assertEqual(state.handle({'op': 'remove_steward', 'steward': 'New K'}), {'ok': False, 'error': "'internal'"})
+
+    def test_constraints(self):
+        import csv, io, tempfile
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        with open(fname, newline='') as fp:
+            rows = list(csv.reader(fp))
+        # Attribute columns after the fault? ones; Consortium G's provider is unknown.
+        extra = {7: ['jurisdiction', 'provider', 'region']}
+        places = [('DE', 'aws', 'EU'), ('US', 'azure', 'NA'), ('US', 'aws', 'NA'), ('FR', 'ovh', 'EU'), ('CH', 'own', 'EU'),
+                  ('CA', 'azure', 'NA'), ('SG', '', 'APAC'), ('DE', 'gcp', 'EU'), ('JP', 'aws', 'APAC')]
+        for i, place in enumerate(places):
+            extra[8 + i] = list(place)
+        rows = [row + extra.get(i, []) for i, row in enumerate(rows)]
+        with tempfile.TemporaryDirectory() as tmp:
+            attributed = os.path.join(tmp, 'attributed.csv')
+            with open(attributed, 'w', newline='') as fp:
+                csv.writer(fp).writerows(rows)
+            attributes = {}
+            f, scenarios, liks, stewards, mttrs, faults = load_data(attributed, 1, attributes=attributes)
+            self.assertEqual((f, scenarios, liks, stewards, mttrs, faults), load_data(fname, 1))
+            self.assertEqual(attributes['provider'], [place[1] for place in places])
+            cached = {}
+            load_data(attributed, 1, cache_dir=os.path.join(tmp, 'cache'))
+            load_data(attributed, 1, cache_dir=os.path.join(tmp, 'cache'), attributes=cached)
+            self.assertEqual(cached, attributes)
+        specs = [{'max_per': {'jurisdiction': 1, 'provider': 1}, 'cover': {'region': ['EU', 'NA', 'APAC']}},
+                 {'max_per': {'provider': 2}, 'cover': ['region']},
+                 {'max_per': {'region': 2}},
+                 {'cover': {'jurisdiction': ['JP', 'SG', 'CA']}}]
+        for spec in specs:
+            constraints = Constraints(spec, attributes, stewards)
+            expected = BestN(lambda x: x.combined_score, 5)
+            for combo in index_combinations(len(stewards), 4):
+                if constraints.allows(combo):
+                    expected.keep_if_better(ComboAnalysis(combo, stewards, combo_score(combo, liks, mttrs, faults, f)))
+            histogram = ScoreHistogram(100)
+            best = analyze(f, scenarios, liks, stewards, mttrs, faults, 5, quiet=True, constraints=constraints,
+                           histogram=histogram)
+            self.assertEqual([str(x) for x in best.items], [str(x) for x in expected.items])
+            self.assertEqual(histogram.total, len([c for c in index_combinations(len(stewards), 4) if constraints.allows(c)]))
+        # With one per region and 4 to choose, all three regions have to be there.
+        best = select_stewards(scenarios, liks, stewards, mttrs, faults, 1, 200, constraints=Constraints(specs[0], attributes, stewards))
+        self.assertTrue(all([len(set([attributes['region'][i] for i in x.steward_indexes])) == 3 for x in best.best]))
+        self.assertTrue(0 < len(best.best) < 126)
+        self.assertRaises(Exception, Constraints, {'max_per': {'color': 1}}, attributes, stewards)
+        self.assertRaises(Exception, Constraints, {'cover': {'region': ['Antarctica']}}, attributes, stewards)
+        self.assertRaises(Exception, Constraints, {'min_per': {}}, attributes, stewards)
+        self.assertRaises(Exception, analyze, f, scenarios, liks, stewards, mttrs, faults, 5, quiet=True,
+                          engine=numpy_engine, constraints=Constraints(specs[1], attributes, stewards))
+        # Progress lines would never be written, so asking for them is an error too.
+        self.assertRaises(Exception, analyze, f, scenarios, liks, stewards, mttrs, faults, 5, quiet=True,
+                          constraints=Constraints(specs[1], attributes, stewards),
+                          instruments=Instrumentation(progress_every=1, stream=io.StringIO()))
+
+    def test_ParetoFront(self):
+        import random
+        rng = random.Random(7)
+        def beats(a, b):
+            return a != b and all([x <= y for x, y in zip(a, b)])
+        for trial in range(10):
+            points = [(rng.randint(0, 12) / 4.0, rng.choice([0, 3, 5.5, 8]), rng.randint(0, 4)) for i in range(200)]
+            front = ParetoFront()
+            for seq, point in enumerate(points):
+                front.offer(point, seq, point)
+            expected = sorted([(point, seq) for seq, point in enumerate(points)
+                               if not [other for other in points if beats(other, point)]])
+            self.assertEqual([(objectives, seq) for objectives, seq, item in front.ranked()], expected)
+            self.assertEqual(len(front), len(expected))
+            self.assertTrue(front.dominated((3.0, 8, 4)) or (3.0, 8, 4) in [point for point, seq in expected])
+        # Every engine that can build a front builds the same one as brute force.
+        stewards = 'A,B,C,D,E,F,G,H,I'.split(',')
+        scenarios = 'a,b,c,d'.split(',')
+        liks = [.5, .4, .3, .25]
+        mttrs = [6, 7.5, 6, 9, 10, 7.5, 3, 12, 6]
+        faults = [[0,1,1,0],[1,0,0,1],[0,1,1,1],[1,1,1,0],[0,1,0,0],[1,0,0,1],[0,1,1,0],[0,0,1,1],[1,1,0,1]]
+        objectives = [combo_objectives(combo, liks, mttrs, faults, 1) for combo in index_combinations(9, 4)]
+        expected = sorted([(o, seq) for seq, o in enumerate(objectives) if not [x for x in objectives if beats(x, o)]])
+        for engine in [python_engine, numpy_engine]:
+            if engine == numpy_engine:
+                try:
+                    import numpy
+                except ImportError:
+                    continue
+            front = ParetoFront()
+            best = analyze(1, scenarios, liks, stewards, mttrs, faults, 3, quiet=True, engine=engine, front=front)
+            self.assertEqual([(o, seq) for o, seq, item in front.ranked()], expected)
+            for o, seq, item in front.ranked():
+                self.assertEqual(list(item.steward_indexes), list(unrank_combination(9, 4, seq)))
+                self.assertEqual(item.combined_score, combo_score(item.steward_indexes, liks, mttrs, faults, 1))
+        with self.assertRaises(Exception):
+            analyze(1, scenarios, liks, stewards, mttrs, faults, 3, quiet=True, engine=bitmask_engine, front=ParetoFront())
+
+    def test_export_scores(self):
+        import tempfile
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, 1)
+        combos = list(index_combinations(len(stewards), 4))
+        engines_to_try = [python_engine]
+        try:
+            import numpy
+            engines_to_try.append(numpy_engine)
+        except ImportError:
+            pass
+        with tempfile.TemporaryDirectory() as tmp:
+            for engine in engines_to_try:
+                # A chunk size that doesn't divide the number of combinations.
+                export = os.path.join(tmp, engine + '.scores')
+                self.assertEqual(export_scores(export, f, scenarios, liks, stewards, mttrs, faults, engine, 17), len(combos))
+                with load_export(export) as found:
+                    self.assertEqual((found['f'], found['m'], found['stewards'], found['liks']), (f, 4, stewards, liks))
+                    self.assertEqual(found['combos'].tolist(), [list(combo) for combo in combos])
+                    self.assertEqual(found['scores'].tolist(), [combo_score(combo, liks, mttrs, faults, f) for combo in combos])
+                    self.assertEqual(found['failure_distances'].tolist(),
+                                     [[r.failure_distance for r in combo_analysis(combo, scenarios, liks, stewards, mttrs,
+                                                                                  faults, f).results] for combo in combos])
+                # Once closed, the columns can't be used.
+                self.assertRaises(ValueError, found['scores'].tolist)
+                with open(export, 'rb') as fp:
+                    written = fp.read()
+                with open(os.path.join(tmp, python_engine + '.scores'), 'rb') as fp:
+                    self.assertEqual(written, fp.read())
+            # With f=0, combinations are single stewards, with nothing before the last.
+            for engine in engines_to_try:
+                export = os.path.join(tmp, engine + '.f0.scores')
+                self.assertEqual(export_scores(export, 0, scenarios, liks, stewards, mttrs, faults, engine, 4), len(stewards))
+                with load_export(export) as found:
+                    self.assertEqual(found['combos'].tolist(), [[i] for i in range(len(stewards))])
+                    self.assertEqual(found['scores'].tolist(), [combo_score([i], liks, mttrs, faults, 0) for i in range(len(stewards))])
+                with open(export, 'rb') as fp:
+                    written = fp.read()
+                with open(os.path.join(tmp, python_engine + '.f0.scores'), 'rb') as fp:
+                    self.assertEqual(written, fp.read())
+            with open(export, 'r+b') as fp:
+                fp.truncate(os.path.getsize(export) - 1)
+            def error(fname):
+                try:
+                    load_export(fname)
+                except Exception as e:
+                    return str(e)
+            self.assertEqual(error(export), '%s is truncated.' % export)
+            empty = os.path.join(tmp, 'empty.scores')
+            open(empty, 'wb').close()
+            for foreign in [empty, fname]:
+                self.assertEqual(error(foreign), '%s is not an export of scores.' % foreign)
+
+    def test_simulate_downtime(self):
+        try:
+            import numpy as np
+        except ImportError:
+            self.skipTest('NumPy not installed')
+        # Members 0 and 1 fault at 0, member 2 at 1: two are down from 0 until member 1
+        # is back at 3.
+        times = np.array([[0.0, 1.0]])
+        member_faults = np.array([[[[1, 0]], [[1, 0]], [[0, 1]], [[0, 0]]]], dtype=bool)
+        self.assertEqual(sweep_clusters(np, times, member_faults, np.array([[2.0, 3.0, 5.0, 7.0]]), 1).tolist(), [[3.0]])
+        liks = [.5, .25]
+        mttrs = [4, 6, 8, 1, 2, 3]
+        faults = [[1, 0], [1, 0], [0, 1], [0, 1], [0, 0], [0, 0]]
+        combos = [[0, 1, 2, 4], [0, 2, 4, 5], [1, 2, 3, 4]]
+        means, errors = simulate_downtime(combos, liks, mttrs, faults, 1, 20000, seed=3)
+        self.assertEqual((means, errors), simulate_downtime(combos, liks, mttrs, faults, 1, 20000, seed=3))
+        # Nothing but close events can take the second down, and they're rare.
+        self.assertTrue(means[1] < 0.01)
+        # Otherwise it's the likelihood times the second longest MTTR of those that fault.
+        for mean, error, expected in zip(means, errors, [.5 * 4, None, .25 * 1]):
+            if expected is not None:
+                self.assertTrue(abs(mean - expected) < 4 * error, (mean, expected, error))
+        # Years so short that events overlap all the time still agree with a slow sweep.
+        year_length = 20
+        rng = np.random.default_rng(5)
+        mttr_array = np.array(mttrs, dtype=float)
+        for combo in combos:
+            counts = rng.poisson(liks, (1, 2))
+            events = sorted([(rng.uniform(0, year_length), s) for s in range(2) for i in range(counts[0][s])])
+            if not events:
+                continue
+            event_times = np.array([[t - events[0][0] for t, s in events]])
+            scenario_faults = np.array([[faults[i][s] for t, s in events] for i in combo], dtype=bool)[None, :, None, :]
+            swept = sweep_clusters(np, event_times, scenario_faults, mttr_array[combo][None, :], 1)[0][0]
+            points = sorted(set([t for t, s in events] + [t + mttrs[i] for t, s in events for i in combo]))
+            expected = 0
+            for start, stop in zip(points, points[1:]):
+                middle = (start + stop) / 2
+                down = [i for i in combo if [t for t, s in events if faults[i][s] and t <= middle < t + mttrs[i]]]
+                if len(down) > 1:
+                    expected += stop - start
+            self.assertAlmostEqual(swept, expected)
+
+    def test_distinct_scenarios(self):
+        scenarios = 'a,b,c,d,e'.split(',')
+        liks = [.5, .4, .3, .2, .1]
+        faults = [[1,0,1,0,0],[0,0,0,0,1],[1,0,1,0,1]]
+        merged, merged_liks, merged_faults, groups = distinct_scenarios(scenarios, liks, faults)
+        self.assertEqual(groups, [[0, 2], [1, 3], [4]])
+        self.assertEqual(merged, ['a + c', 'b + d', 'e'])
+        self.assertEqual(merged_liks, [.5 + .3, .4 + .2, .1])
+        self.assertEqual(merged_faults, [[1,0,0],[0,0,1],[1,0,1]])
+        # The sample data has repeated columns, and columns no steward faults in.
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, 1)
+        self.assertTrue(len(distinct_scenarios(scenarios, liks, faults)[3]) < len(scenarios))
+        for engine in engines:
+            if engine == numpy_engine:
+                try:
+                    import numpy
+                except ImportError:
+                    continue
+            expected = analyze(f, scenarios, liks, stewards, mttrs, faults, 10, quiet=True, engine=engine)
+            best = analyze(f, scenarios, liks, stewards, mttrs, faults, 10, quiet=True, engine=engine, merge_scenarios=True)
+            self.assertEqual([str(x) for x in best.items], [str(x) for x in expected.items])
+            # Reports still get a result for every scenario.
+            self.assertEqual([r.name for r in best.items[0].results], scenarios)
+            self.assertEqual(best.items[0].combined_score, sum([r.score for r in best.items[0].results]))
+
+    def test_analyze_multisets(self):
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        f, scenarios, liks, stewards, mttrs, faults = load_data(fname, 1)
+        # Copies of some stewards, mixed in among the others so that their classes interleave.
+        for copy, original in [(2, 0), (5, 4), (7, 0), (10, 4), (11, 8), (12, 0)]:
+            stewards.insert(copy, '%s %d' % (stewards[original], copy))
+            mttrs.insert(copy, mttrs[original])
+            faults.insert(copy, list(faults[original]))
+        classes = steward_classes(mttrs, faults)
+        self.assertEqual(len(classes), 9)
+        self.assertEqual(classes[0], [0, 2, 7, 12])
+        for f in [1, 2, 3]:
+            expected_histogram = ScoreHistogram(64)
+            expected = analyze(f, scenarios, liks, stewards, mttrs, faults, 12, quiet=True, histogram=expected_histogram)
+            histogram = ScoreHistogram(64)
+            best = analyze(f, scenarios, liks, stewards, mttrs, faults, 12, quiet=True, histogram=histogram, symmetry=True)
+            self.assertEqual([x.steward_indexes for x in best.items], [x.steward_indexes for x in expected.items])
+            self.assertEqual([x.combined_score for x in best.items], [x.combined_score for x in expected.items])
+            # Adding a score with a count sums it in a different order, so only the mean can differ.
+            self.assertEqual(histogram.bins(), expected_histogram.bins())
+            self.assertAlmostEqual(histogram.summary()['mean'], expected_histogram.summary()['mean'])
+        self.assertEqual(list(expand_multiset(classes, [2, 1] + [0] * 7, len(stewards))),
+                         sorted([c for c in itertools.combinations(range(len(stewards)), 3)
+                                 if len([i for i in c if i in classes[0]]) == 2 and len([i for i in c if i in classes[1]]) == 1]))
+        # Without whole-number MTTRs, nothing is collapsed, but the answer is the same.
+        mttrs = [x + 0.1 for x in mttrs]
+        self.assertFalse(can_collapse(mttrs))
+        self.assertEqual([str(x) for x in analyze(1, scenarios, liks, stewards, mttrs, faults, 5, quiet=True, symmetry=True).items],
+                         [str(x) for x in analyze(1, scenarios, liks, stewards, mttrs, faults, 5, quiet=True).items])
+        # Multisets are scored in Python, so another engine would be ignored.
+        self.assertRaises(Exception, analyze, 1, scenarios, liks, stewards, mttrs, faults, 5, quiet=True, symmetry=True,
+                          engine=numpy_engine)
+
+    def test_not_enough_stewards(self):
+        fname = os.path.join(os.path.dirname(__file__), 'sample-data.csv')
+        self.assertRaises(Exception, load_data, fname, 5)
+
+    def test_BestN(self):
+        # Keep a list of the 3 best integers. Always give it back in sorted form.
+        b = BestN(lambda x: x, 3)
+        def try_this(*args):
+            b = BestN(lambda x: x, 3)
+            for arg in args:
+                b.keep_if_better(arg)
+            return b
+        b = try_this(3,10,4,11,9)
+        self.assertEquals(b.items, [11,10,9])
+        self.assertEquals(b.worst_idx, 2)
+        self.assertEquals(b.worst_score, 9)
+        b = try_this(-10,-9,-3.14,4.0,-1)
+        self.assertEquals(b.items, [4,-1,-3.14])
+        self.assertEquals(b.worst_idx, 2)
+        self.assertEquals(BestN(lambda x: x, 3).worst_idx, invalid_worst_idx)
+        # worst_idx points at the worst item, whatever the list's length and ties.
+        b = BestN(lambda x: x[0], 4)
+        for item in [(5, 'a'), (7, 'b'), (5, 'c'), (9, 'd'), (5, 'e'), (7, 'f')]:
+            b.keep_if_better(item)
+            # Best first, and the later of two ties is worse, so the worst is last.
+            self.assertEqual(b.worst_idx, len(b.items) - 1)
+            self.assertEqual(b.items[b.worst_idx][0], b.worst_score)
+        self.assertEqual(b.items, [(9, 'd'), (7, 'b'), (7, 'f'), (5, 'a')])
+        self.assertEqual(b.items[b.worst_idx], (5, 'a'))
+        # No artificial cap on N.
+        b = BestN(lambda x: x, 20000)
+        for i in range(30000):
+            b.keep_if_better((i * 7919) % 30000)
+        self.assertEqual(b.items, list(range(29999, 9999, -1)))
+        self.assertEqual(b.worst_score, 10000)
+
+    def test_BestN_keep_many(self):
+        b = BestN(lambda x: x[0], 3)
+        made = []
+        def make_item(seq):
+            made.append(seq)
+            return (scores[seq], 'c%d' % seq)
+        scores = [5, 1, 7, 7, 2, 9, 7]
+        b.keep_many(scores[:4], range(4), make_item)
+        b.keep_many(scores[4:], range(4, 7), make_item)
+        self.assertEqual(b.ranked(), [(5, (9, 'c5')), (2, (7, 'c2')), (3, (7, 'c3'))])
+        # Candidates that could never get in are never built.
+        self.assertEqual(made, [0, 1, 2, 3, 5])
+
+    def test_BestN_ties(self):
+        # Ties go to the lower sequence number, whatever order things arrive in.
+        b = BestN(lambda x: x[0], 3)
+        for seq, item in [(5, (2, 'e')), (1, (1, 'a')), (4, (2, 'd')), (0, (1, 'z')), (3, (2, 'c')), (2, (1, 'b'))]:
+            b.keep_if_better(item, seq)
+        self.assertEqual(b.items, [(2, 'c'), (2, 'd'), (2, 'e')])
+        # Whether something offered is still there takes no sorting.
+        self.assertEqual([b.holds(2, 5), b.holds(2, 6), b.holds(1, 0), b.holds(3, 100)], [True, False, False, True])
+        b = BestN(lambda x: x[0], 2)
+        for item in [(1, 'a'), (2, 'b'), (1, 'c'), (2, 'd'), (2, 'e')]:
+            b.keep_if_better(item)
+        self.assertEqual(b.ranked(), [(1, (2, 'b')), (3, (2, 'd'))])
+
+if __name__ == '__main__':
+    unittest.main()